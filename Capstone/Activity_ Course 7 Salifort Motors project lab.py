@@ -103,6 +103,11 @@ from sklearn.tree import plot_tree
 # For saving models
 import pickle
 
+# For exporting fitted trees as memory-mappable arrays
+from labtools.artifacts import write_artifact
+from labtools.instrument import stage
+from labtools.splits import SplitRegistry, fold_assignment, index_fingerprint
+
 
 # ### Load dataset
 
@@ -811,6 +816,13 @@ X.head()
 # Split the data
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, stratify=y, random_state=0)
 
+# Assign the training rows to 4 cross-validation folds once and save them next
+# to the dataset, so every tree and forest below is scored on identical folds.
+# The folds are named after the rows, so a different split never loads them.
+registry = SplitRegistry('HR_capstone_dataset.csv')
+cv_name = f'cv4_{index_fingerprint(X_train.index)}'
+registry.get_or_build(cv_name, X_train.index, lambda: fold_assignment(y_train, n_splits=4))
+
 
 # #### Decision tree - Round 1
 
@@ -832,7 +844,8 @@ cv_params = {'max_depth':[4, 6, 8, None],
 scoring = {'accuracy', 'precision', 'recall', 'f1', 'roc_auc'}
 
 # Instantiate GridSearch
-tree1 = GridSearchCV(tree, cv_params, scoring=scoring, cv=4, refit='roc_auc')
+tree1 = GridSearchCV(tree, cv_params, scoring=scoring,
+                     cv=registry.predefined_split(cv_name, X_train.index), refit='roc_auc')
 
 
 # Fit the decision tree model to the training data.
@@ -840,7 +853,8 @@ tree1 = GridSearchCV(tree, cv_params, scoring=scoring, cv=4, refit='roc_auc')
 # In[41]:
 
 
-get_ipython().run_cell_magic('time', '', 'tree1.fit(X_train, y_train)')
+with stage('fit', rows=len(X_train), model='tree1'):
+    tree1.fit(X_train, y_train)
 
 
 # Identify the optimal values for the decision tree parameters.
@@ -950,7 +964,8 @@ cv_params = {'max_depth': [3,5, None],
 scoring = {'accuracy', 'precision', 'recall', 'f1', 'roc_auc'}
 
 # Instantiate GridSearch
-rf1 = GridSearchCV(rf, cv_params, scoring=scoring, cv=4, refit='roc_auc')
+rf1 = GridSearchCV(rf, cv_params, scoring=scoring,
+                   cv=registry.predefined_split(cv_name, X_train.index), refit='roc_auc')
 
 
 # Fit the random forest model to the training data.
@@ -958,7 +973,8 @@ rf1 = GridSearchCV(rf, cv_params, scoring=scoring, cv=4, refit='roc_auc')
 # In[47]:
 
 
-get_ipython().run_cell_magic('time', '', 'rf1.fit(X_train, y_train) # --> Wall time: ~10min')
+with stage('fit', rows=len(X_train), model='rf1'):
+    rf1.fit(X_train, y_train) # --> Wall time: ~10min
 
 
 # Specify path to where you want to save your model.
@@ -1188,6 +1204,10 @@ X = df2.drop('left', axis=1)
 # Create test data
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, stratify=y, random_state=0)
 
+# Same rows as the first split, so this finds the folds saved in round 1
+cv_name = f'cv4_{index_fingerprint(X_train.index)}'
+registry.get_or_build(cv_name, X_train.index, lambda: fold_assignment(y_train, n_splits=4))
+
 
 # #### Decision tree - Round 2
 
@@ -1207,13 +1227,15 @@ cv_params = {'max_depth':[4, 6, 8, None],
 scoring = {'accuracy', 'precision', 'recall', 'f1', 'roc_auc'}
 
 # Instantiate GridSearch
-tree2 = GridSearchCV(tree, cv_params, scoring=scoring, cv=4, refit='roc_auc')
+tree2 = GridSearchCV(tree, cv_params, scoring=scoring,
+                     cv=registry.predefined_split(cv_name, X_train.index), refit='roc_auc')
 
 
 # In[65]:
 
 
-get_ipython().run_cell_magic('time', '', 'tree2.fit(X_train, y_train)')
+with stage('fit', rows=len(X_train), model='tree2'):
+    tree2.fit(X_train, y_train)
 
 
 # In[66]:
@@ -1266,13 +1288,15 @@ cv_params = {'max_depth': [3,5, None],
 scoring = {'accuracy', 'precision', 'recall', 'f1', 'roc_auc'}
 
 # Instantiate GridSearch
-rf2 = GridSearchCV(rf, cv_params, scoring=scoring, cv=4, refit='roc_auc')
+rf2 = GridSearchCV(rf, cv_params, scoring=scoring,
+                   cv=registry.predefined_split(cv_name, X_train.index), refit='roc_auc')
 
 
 # In[70]:
 
 
-get_ipython().run_cell_magic('time', '', 'rf2.fit(X_train, y_train) # --> Wall time: 7min 5s')
+with stage('fit', rows=len(X_train), model='rf2'):
+    rf2.fit(X_train, y_train) # --> Wall time: 7min 5s
 
 
 # In[71]:
@@ -1289,6 +1313,11 @@ write_pickle(path, rf2, 'hr_rf2')
 rf2 = read_pickle(path, 'hr_rf2')
 
 
+# Export only the best estimator's trees; `read_artifact` memory-maps them and
+# can score without unpickling the whole grid search.
+write_artifact(path, rf2, 'hr_rf2')
+
+
 # In[73]:
 
 
@@ -0,0 +1,8 @@
+'''
+Reusable helpers for the course labs.
+
+The labs are exported notebooks, so anything that more than one lab needs
+(or that is too slow to leave inline in a notebook cell) lives here. Run the
+labs from the repository root, or put the root on `PYTHONPATH`, so that
+`import labtools` resolves.
+'''
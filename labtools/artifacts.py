@@ -0,0 +1,314 @@
+'''
+Memory-mappable artifacts for fitted tree models.
+
+A pickled `GridSearchCV` carries every refit object and the whole Python
+object graph of the forest, all of which has to be rebuilt before a single
+row can be scored. An artifact keeps only what prediction needs: the best
+estimator's trees, concatenated into flat NumPy arrays and written as `.npy`
+files next to a small `meta.json`. `read_artifact()` opens the arrays with
+`mmap_mode='r'`, so loading costs a few file opens and scoring processes
+that read the same artifact share its pages through the OS page cache.
+
+Layout of `<save_as>.forest/`:
+
+    meta.json          model kind, classes, link function, base margin, ...
+    feature.npy        int32    feature tested at each node
+    threshold.npy      float64  go left when x <= threshold
+    left.npy           int32    global index of the left child
+    right.npy          int32    global index of the right child
+    default_left.npy   bool     direction taken by a missing (NaN) value
+    value.npy          float64  (n_nodes, n_outputs) leaf values
+    roots.npy          int32    global index of each tree's root
+    tree_group.npy     int32    output column each tree contributes to
+
+Leaves point to themselves (`left[i] == right[i] == i`): a leaf is
+recognised by that test alone, and stepping from a leaf leaves a row where
+it is.
+
+`write_artifact()` writes into a temporary directory and renames it into
+place, so overwriting an artifact never mixes old and new files.
+
+Supported models: DecisionTreeClassifier, RandomForestClassifier (and
+ExtraTreesClassifier) and XGBClassifier, or a fitted `GridSearchCV` around
+any of them.
+'''
+
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from labtools.inference import CompiledEnsemble
+
+
+FORMAT_VERSION = 1
+
+ARRAY_NAMES = ('feature', 'threshold', 'left', 'right', 'default_left',
+               'value', 'roots', 'tree_group')
+
+
+def _unwrap(model_object):
+    '''
+    Returns the fitted estimator inside a search object, or the model itself.
+    '''
+    return getattr(model_object, 'best_estimator_', model_object)
+
+
+def _json_safe(values):
+    return [v.item() if hasattr(v, 'item') else v for v in values]
+
+
+def _flatten_sklearn(estimator):
+    '''
+    Concatenates the trees of a fitted sklearn tree or forest classifier.
+    '''
+    trees = getattr(estimator, 'estimators_', [estimator])
+    features, thresholds, lefts, rights, defaults, values, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree in trees:
+        t = tree.tree_
+        n = t.node_count
+        is_leaf = t.children_left == -1
+        own = np.arange(offset, offset + n, dtype=np.int32)
+        features.append(np.where(is_leaf, 0, t.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, 0.0, t.threshold))
+        lefts.append(np.where(is_leaf, own, t.children_left + offset).astype(np.int32))
+        rights.append(np.where(is_leaf, own, t.children_right + offset).astype(np.int32))
+        missing_left = getattr(t, 'missing_go_to_left', None)
+        if missing_left is None:
+            missing_left = np.zeros(n, dtype=bool)
+        defaults.append(np.asarray(missing_left, dtype=bool))
+        value = t.value[:, 0, :]
+        values.append(value / value.sum(axis=1, keepdims=True))
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, t.max_depth)
+
+    arrays = {'feature': np.concatenate(features),
+              'threshold': np.concatenate(thresholds),
+              'left': np.concatenate(lefts),
+              'right': np.concatenate(rights),
+              'default_left': np.concatenate(defaults),
+              'value': np.concatenate(values),
+              'roots': np.array(roots, dtype=np.int32),
+              'tree_group': np.zeros(len(trees), dtype=np.int32),
+              }
+    meta = {'kind': 'sklearn',
+            'estimator': type(estimator).__name__,
+            'link': 'mean',
+            'classes': _json_safe(estimator.classes_),
+            'n_features': int(estimator.n_features_in_),
+            'feature_names': _json_safe(getattr(estimator, 'feature_names_in_', [])),
+            'n_outputs': len(estimator.classes_),
+            'base_margin': [0.0] * len(estimator.classes_),
+            'max_depth': int(max_depth),
+            }
+    return arrays, meta
+
+
+def _parse_base_score(raw):
+    # xgboost >= 3 writes a bracketed vector, older versions a bare float
+    return [float(v) for v in raw.strip('[]').split(',')]
+
+
+def _flatten_xgboost(estimator):
+    '''
+    Concatenates the trees of a fitted XGBClassifier from its JSON model.
+    '''
+    booster = estimator.get_booster()
+    learner = json.loads(booster.save_raw('json'))['learner']
+    objective = learner['objective']['name']
+    model = learner['gradient_booster']['model']
+    params = learner['learner_model_param']
+
+    n_classes = int(params['num_class'])
+    n_outputs = max(n_classes, 1)
+    base_score = _parse_base_score(params['base_score'])
+    if objective in ('binary:logistic', 'reg:logistic'):
+        link = 'logistic'
+        base_margin = [float(np.log(p / (1 - p))) for p in base_score]
+    elif objective in ('multi:softprob', 'multi:softmax'):
+        link = 'softmax'
+        base_margin = base_score
+    else:
+        raise ValueError(f'Unsupported xgboost objective: {objective}')
+    if len(base_margin) == 1:
+        base_margin = base_margin * n_outputs
+
+    # Match XGBClassifier.predict(): use only the trees up to the best
+    # iteration when the model was trained with early stopping.
+    n_trees = len(model['trees'])
+    best_iteration = booster.attributes().get('best_iteration')
+    if best_iteration is not None and 'iteration_indptr' in model:
+        n_trees = model['iteration_indptr'][int(best_iteration) + 1]
+
+    features, thresholds, lefts, rights, defaults, values, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree in model['trees'][:n_trees]:
+        if any(tree['split_type']):
+            raise ValueError('Categorical splits are not supported')
+        left = np.array(tree['left_children'], dtype=np.int64)
+        right = np.array(tree['right_children'], dtype=np.int64)
+        cond = np.array(tree['split_conditions'], dtype=np.float32)
+        n = left.size
+        is_leaf = left == -1
+        own = np.arange(offset, offset + n, dtype=np.int32)
+        features.append(np.where(is_leaf, 0, tree['split_indices']).astype(np.int32))
+        # xgboost sends x left when float32(x) < cond. For float32 x that is
+        # the same as x <= the largest float32 below cond.
+        below = np.nextafter(cond, np.float32(-np.inf))
+        thresholds.append(np.where(is_leaf, 0.0, below.astype(np.float64)))
+        lefts.append(np.where(is_leaf, own, left + offset).astype(np.int32))
+        rights.append(np.where(is_leaf, own, right + offset).astype(np.int32))
+        defaults.append(np.array(tree['default_left'], dtype=bool))
+        values.append(np.where(is_leaf, cond, 0.0).astype(np.float64)[:, None])
+        roots.append(offset)
+        offset += n
+
+        depth = np.zeros(n, dtype=np.int64)
+        for node in range(n):
+            if not is_leaf[node]:
+                depth[left[node]] = depth[right[node]] = depth[node] + 1
+        max_depth = max(max_depth, int(depth.max()))
+
+    arrays = {'feature': np.concatenate(features),
+              'threshold': np.concatenate(thresholds),
+              'left': np.concatenate(lefts),
+              'right': np.concatenate(rights),
+              'default_left': np.concatenate(defaults),
+              'value': np.concatenate(values),
+              'roots': np.array(roots, dtype=np.int32),
+              'tree_group': np.array(model['tree_info'][:n_trees], dtype=np.int32),
+              }
+    meta = {'kind': 'xgboost',
+            'estimator': type(estimator).__name__,
+            'link': link,
+            'classes': _json_safe(getattr(estimator, 'classes_', range(max(n_classes, 2)))),
+            'n_features': int(params['num_feature']),
+            'feature_names': learner.get('feature_names', []),
+            'n_outputs': n_outputs,
+            'base_margin': base_margin,
+            'max_depth': max_depth,
+            }
+    return arrays, meta
+
+
+def flatten_model(model_object):
+    '''
+    Converts a fitted tree model into flat node arrays.
+
+    Args:
+        model_object: A fitted DecisionTreeClassifier, RandomForestClassifier,
+                      XGBClassifier, or a GridSearchCV around one of them
+    Returns:
+        arrays: (dict)  - Node arrays keyed by the names in ARRAY_NAMES
+        meta:   (dict)  - JSON-serializable model metadata
+    '''
+    estimator = _unwrap(model_object)
+    if hasattr(estimator, 'get_booster'):
+        arrays, meta = _flatten_xgboost(estimator)
+    elif hasattr(estimator, 'tree_') or hasattr(estimator, 'estimators_'):
+        arrays, meta = _flatten_sklearn(estimator)
+    else:
+        raise TypeError(f'Unsupported model type: {type(estimator).__name__}')
+    meta['format_version'] = FORMAT_VERSION
+    meta['n_trees'] = int(arrays['roots'].size)
+    meta['n_nodes'] = int(arrays['feature'].size)
+    return arrays, meta
+
+
+class TreeArtifact(CompiledEnsemble):
+    '''
+    A flattened tree model that scores rows straight from its node arrays.
+
+    Instances come from `read_artifact()` (arrays memory-mapped from disk) or
+    `TreeArtifact.from_model()` (arrays built in memory). Scoring is done by
+    `labtools.inference.CompiledEnsemble`.
+    '''
+
+    @classmethod
+    def from_model(cls, model_object):
+        return cls(*flatten_model(model_object))
+
+
+def write_directory(directory, arrays, meta):
+    '''
+    Writes arrays as `.npy` files plus `meta.json` into `directory`,
+    replacing whatever it held.
+
+    Everything is written into a new sibling directory first, which is then
+    renamed into place. A reader (or a crash) never sees new arrays under old
+    metadata: the directory holds either the complete old artifact or the
+    complete new one, and is only briefly missing while an old one is
+    swapped out. Processes that already memory-mapped the old arrays keep
+    reading them.
+
+    Args:
+        directory: (string) - Artifact directory to (re)write
+        arrays:    (dict)   - Maps each file stem to its np.ndarray
+        meta:      (dict)   - JSON-serializable metadata
+    Returns:
+        directory: (string)
+    '''
+    staging = f'{directory}.tmp-{uuid.uuid4().hex}'
+    os.makedirs(staging)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, name + '.npy'), array)
+        with open(os.path.join(staging, 'meta.json'), 'w') as to_write:
+            json.dump(meta, to_write)
+        if os.path.isdir(directory):
+            # A directory cannot be renamed over a non-empty one, so move
+            # the old artifact aside first
+            retired = staging + '.old'
+            os.rename(directory, retired)
+            os.rename(staging, directory)
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            os.rename(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return directory
+
+
+def write_artifact(path, model_object, save_as:str):
+    '''
+    In:
+        path:         path of folder where you want to save the artifact
+        model_object: a fitted tree model, or a GridSearchCV around one
+        save_as:      name for the artifact (saved as `<save_as>.forest/`)
+
+    Out:
+        directory: the artifact directory that was written
+    '''
+    arrays, meta = flatten_model(model_object)
+    os.makedirs(path, exist_ok=True)
+    return write_directory(os.path.join(path, save_as + '.forest'),
+                           {name: np.ascontiguousarray(arrays[name]) for name in ARRAY_NAMES},
+                           meta)
+
+
+def read_artifact(path, saved_model_name:str, mmap:bool=True):
+    '''
+    In:
+        path:             path to folder where you want to read from
+        saved_model_name: name the artifact was saved as
+        mmap:             memory-map the arrays (True) or read them into RAM
+
+    Out:
+        model: a TreeArtifact ready to predict
+    '''
+    directory = os.path.join(path, saved_model_name + '.forest')
+    with open(os.path.join(directory, 'meta.json')) as to_read:
+        meta = json.load(to_read)
+    if meta['format_version'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format version {meta['format_version']}")
+    mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode)
+              for name in ARRAY_NAMES}
+    return TreeArtifact(arrays, meta)
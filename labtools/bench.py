@@ -0,0 +1,224 @@
+'''
+End-to-end benchmark suite for the project labs.
+
+Each lab's pipeline from `labtools.labs` (load, clean, feature engineering,
+encoding, split, fit, evaluate) is run without its stage cache on
+synthetic data from `labtools.synthetic` at several multiples of the real
+files' sizes. For every (lab, scale) the suite records the wall time of
+each stage and of the whole pipeline, the memory each stage allocates, and
+the peak resident memory of the process that ran it.
+
+    python -m labtools.bench --scales 1 10 --out bench.csv
+    python -m labtools.bench --scales 1 10 --baseline bench.csv
+
+With `--baseline`, the new results are compared with an earlier run, and
+the command exits with status 1 when any stage got slower or hungrier than
+the tolerance allows. That lets the suite run as a regression check before
+a change ships.
+
+The fit stages train one fixed, modest configuration per model (see
+RF_PARAMS and XGB_PARAMS, and the first candidate of any other grid)
+instead of the labs' full grid searches. A grid
+search costs roughly its number of candidates × folds times one such fit,
+and a single fit is enough to show how training scales with rows while
+keeping 100× runs feasible.
+
+Stages are recorded with `labtools.instrument`. Timing and memory come
+from separate runs. Memory is traced in a fresh subprocess, because
+tracing slows the code down, and a separate process gives a clean peak
+RSS.
+'''
+
+import argparse
+import gc
+import multiprocessing
+import os
+import sys
+import tempfile
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from labtools import pipeline, synthetic
+from labtools.instrument import Recorder, peak_rss
+from labtools.labs import PIPELINES, TAXI_FILE
+
+# One fixed configuration per model family, used by every fit stage
+RF_PARAMS = {'n_estimators': 25, 'max_depth': 8, 'max_features': 0.3,
+             'max_samples': 0.7, 'random_state': 0, 'n_jobs': -1}
+XGB_PARAMS = {'n_estimators': 100, 'max_depth': 6, 'learning_rate': 0.1,
+              'tree_method': 'hist', 'random_state': 0, 'n_jobs': -1}
+
+# Lab name -> {data parameter: synthetic file}. The first file sets the row count.
+LABS = {
+    'taxi_report': {'data_path': TAXI_FILE},
+    'fare_regression': {'data_path': TAXI_FILE},
+    'tip_classifier': {'data_path': TAXI_FILE, 'means_path': 'nyc_preds_means.csv'},
+    'waze_churn': {'data_path': 'waze_dataset.csv'},
+    'tiktok_claims': {'data_path': 'tiktok_dataset.csv'},
+    'salifort_attrition': {'data_path': 'HR_capstone_dataset.csv'},
+    'kmeans_penguins': {'data_path': 'penguins.csv'},
+    'penguin_segments': {'data_path': 'penguins.csv'},
+    'color_compression': {'image_path': 'tulips.npy'},
+    'taxi_ttest': {'data_path': TAXI_FILE},
+    'tiktok_ttest': {'data_path': 'tiktok_dataset.csv'},
+    'aqi_confidence_interval': {'data_path': 'c4_epa_air_quality.csv'},
+    }
+
+
+def _bench_params(lab, paths):
+    '''
+    Returns the parameters a lab's pipeline is benchmarked with: the
+    synthetic files, a single fit per model instead of a grid search, and
+    the fixed RF_PARAMS and XGB_PARAMS configurations.
+    '''
+    defaults = PIPELINES[lab].params
+    params = dict(paths)
+    if 'cv' in defaults:
+        params['cv'] = None
+    if 'rf_grid' in defaults:
+        params['rf_grid'] = {name: [value] for name, value in RF_PARAMS.items()}
+    if 'xgb_grid' in defaults:
+        params['xgb_grid'] = {name: [value] for name, value in XGB_PARAMS.items()}
+    return params
+
+
+def _run_pipeline(lab, paths, trace_memory=False):
+    log = Recorder(trace_memory=trace_memory)
+    gc.collect()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        pipeline.run(PIPELINES[lab], _bench_params(lab, paths), use_cache=False, recorder=log)
+    return log
+
+
+def _measure_memory(lab, paths):
+    '''
+    Runs one traced pass of a pipeline. Meant to run in a fresh process.
+    '''
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    log = _run_pipeline(lab, paths, trace_memory=True)
+    tracemalloc.stop()
+    allocated = {record['stage']: record['alloc_mb'] for record in log.records}
+    return allocated, (log.traced_peak - start) / 1e6, (peak_rss() or np.nan) / 1e6
+
+
+def run(labs=None, scales=(1, 10, 100), repeats=3, memory=True, data_dir=None, seed=0,
+        verbose=False):
+    '''
+    Runs the benchmark suite.
+
+    Args:
+        labs:     (list)    - Lab names, keys of LABS (default: all)
+        scales:   (tuple)   - Multiples of the real files' row counts
+        repeats:  (int)     - Timed runs per (lab, scale); the median is kept
+        memory:   (bool)    - Also run one memory-traced pass in a subprocess
+        data_dir: (string)  - Where synthetic files are written and reused
+                              (default: a folder in the system temp directory)
+        seed:     (int)     - Seed for the synthetic data
+        verbose:  (bool)    - Print each (lab, scale) total as it finishes
+    Returns:
+        results: (pd.DataFrame) - One row per (lab, scale, stage), plus a
+                                  'total' stage per (lab, scale), with
+                                  wall_s, cpu_s, alloc_mb and (for the total)
+                                  max_rss_mb
+    '''
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), 'labtools_bench')
+    records = []
+    for lab in labs or LABS:
+        files = LABS[lab]
+        for scale in scales:
+            paths = {param: synthetic.write_dataset(name, scale, data_dir, seed)
+                     for param, name in files.items()}
+            runs = [_run_pipeline(lab, paths).records for _ in range(repeats)]
+            seconds = pd.DataFrame([dict(record, run=i) for i, run_ in enumerate(runs)
+                                    for record in run_])
+            # Stages can repeat within a run; add them up first
+            per_run = seconds.groupby(['run', 'stage'], sort=False)[['wall_s', 'cpu_s']].sum()
+            timing = per_run.groupby(level='stage', sort=False).median()
+            total = per_run.groupby(level='run').sum().median()
+
+            allocated, peak_mb, max_rss_mb = {}, np.nan, np.nan
+            if memory:
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    allocated, peak_mb, max_rss_mb = executor.submit(
+                        _measure_memory, lab, paths).result()
+
+            rows = int(round(synthetic.DATASETS[next(iter(files.values()))][1] * scale))
+            for name, values in timing.iterrows():
+                records.append({'lab': lab, 'scale': scale, 'rows': rows, 'stage': name,
+                                'wall_s': values['wall_s'], 'cpu_s': values['cpu_s'],
+                                'alloc_mb': allocated.get(name, np.nan), 'max_rss_mb': np.nan})
+            records.append({'lab': lab, 'scale': scale, 'rows': rows, 'stage': 'total',
+                            'wall_s': total['wall_s'], 'cpu_s': total['cpu_s'],
+                            'alloc_mb': peak_mb, 'max_rss_mb': max_rss_mb})
+            if verbose:
+                print(f"{lab:>24} x{scale:<5g} {rows:>10,} rows  {total['wall_s']:9.2f} s  "
+                      f'{max_rss_mb:9.0f} MB max RSS', flush=True)
+    return pd.DataFrame(records)
+
+
+def compare(results, baseline, tolerance=0.25):
+    '''
+    Compares a run with an earlier one.
+
+    Args:
+        results:   (pd.DataFrame) - Output of `run()`
+        baseline:  (pd.DataFrame) - Earlier output of `run()`
+        tolerance: (float)        - Allowed relative increase before a stage
+                                    counts as a regression
+    Returns:
+        comparison: (pd.DataFrame) - Stages found in both runs, with the
+                                     time and memory ratios (new / baseline)
+                                     and a `regressed` flag
+    '''
+    keys = ['lab', 'scale', 'stage']
+    merged = results.merge(baseline, on=keys, suffixes=('', '_baseline'))
+    merged['wall_ratio'] = merged['wall_s'] / merged['wall_s_baseline']
+    merged['alloc_ratio'] = merged['alloc_mb'] / merged['alloc_mb_baseline']
+    # Very short stages are too noisy to judge on their ratio alone
+    slower = (merged['wall_ratio'] > 1 + tolerance) & (merged['wall_s'] > 0.05)
+    hungrier = (merged['alloc_ratio'] > 1 + tolerance) & (merged['alloc_mb'] > 1)
+    merged['regressed'] = slower | hungrier
+    return merged[keys + ['wall_s', 'wall_s_baseline', 'wall_ratio',
+                          'alloc_mb', 'alloc_mb_baseline', 'alloc_ratio', 'regressed']]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--labs', nargs='+', choices=list(LABS), default=None)
+    parser.add_argument('--scales', nargs='+', type=float, default=[1, 10, 100])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the memory-traced subprocess run')
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help='write the results to this CSV file')
+    parser.add_argument('--baseline', default=None, help='CSV from an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = run(args.labs, tuple(args.scales), args.repeats, not args.no_memory,
+                  args.data_dir, args.seed, verbose=True)
+    if args.out:
+        results.to_csv(args.out, index=False)
+    with pd.option_context('display.width', 160, 'display.max_rows', None):
+        print(results.to_string(index=False, float_format='{:.3f}'.format))
+        if args.baseline:
+            comparison = compare(results, pd.read_csv(args.baseline), args.tolerance)
+            regressions = comparison[comparison['regressed']]
+            print()
+            print(comparison.to_string(index=False, float_format='{:.3f}'.format))
+            if len(regressions):
+                print(f'\n{len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}')
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,608 @@
+'''
+K-means model selection over a range of k in one call.
+
+The K-means labs pick k by fitting `KMeans(n_clusters=k, random_state=42)`
+separately for k = 2…10 and reading each model's inertia. `kmeans_sweep()`
+fits every k in one call and keeps all of the models, so inertia, labels
+and centers can be read for any k without fitting it again:
+
+    sweep = kmeans_sweep(X_scaled, range(2, 11))
+    sweep.inertia                # pd.Series indexed by k
+    sweep.labels(6)              # same as KMeans(6, random_state=42).fit(X).labels_
+    kmeans6 = sweep[6]           # the fitted KMeans, with predict() etc.
+
+Each k is fitted exactly as the labs fit it, so the results are unchanged.
+With `n_jobs`, the values of k are fitted in parallel worker processes,
+each of which receives X once when it starts rather than once per k.
+`warm_start=True` instead fits the values of k in increasing order, seeding
+each from the previous k's centroids plus k-means++ draws for the new ones
+(row norms computed once for the whole sweep), with a single KMeans run per
+k. It skips most of each k's k-means++ seeding, but with KMeans' default
+single initialization the Lloyd iterations dominate, so the saving is small,
+and a warm-started k can settle in a worse optimum than a fresh fit. It is
+opt-in, and its results differ from the labs'.
+
+`kmeans_scores()` replaces the labs' `kmeans_inertia()` and `kmeans_sil()`
+helpers, which fit the same nine models twice: once to read `inertia_` and
+once for the labels that `silhouette_score()` needs. It fits each k once and
+scores it four ways:
+
+    k_scores = kmeans_scores(num_clusters, X_scaled)
+    inertia = k_scores['inertia'].tolist()
+    sil_score = k_scores['silhouette'].tolist()
+
+The Calinski-Harabasz index (higher is better) and the Davies-Bouldin
+index (lower is better) are two more ways to compare k, and cost a single
+pass over the data, where the silhouette score needs every pairwise
+distance.
+
+That makes the silhouette score O(n²) in time, and the labs' call holds
+large blocks of the distance matrix at once. `silhouette()` computes the
+same score one fixed-size block of distances at a time, folding each block
+into running per-cluster distance sums, so memory stays at a few blocks
+whatever n is. For a million points the time is still out of reach, so
+`silhouette_estimate()` scores a stratified random sample of points
+(exactly, against every point) and returns the mean with a confidence
+interval. `kmeans_scores(..., silhouette_sample=2000)` uses it for every k.
+
+Once a model is chosen, `CentroidAssigner` labels new records without the
+fitted scaler and KMeans objects. It keeps only the scaler's mean and scale
+and the centroids, as float32, and assigns a whole batch with one matrix
+product. `write_centroids()` saves it as `.npy` files plus a small
+`meta.json`, which `read_centroids()` memory-maps:
+
+    write_centroids('.', kmeans5, scaler, save_as='kmeans5')
+    assigner = read_centroids('.', 'kmeans5')
+    labels, distance, margin = assigner.assign(new_data)
+
+`stream_segments()` runs the whole standardize-cluster-label workflow on a
+table too large to load, one chunk at a time: a StandardScaler
+`partial_fit()` pass, MiniBatchKMeans `partial_fit()` epochs over the
+scaled chunks until the clustering stops improving, and a labelling pass
+that appends each chunk with its cluster IDs to an output file while
+tallying the `groupby(['cluster', 'species'])`-style summaries.
+'''
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from scipy import stats
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score
+from sklearn.preprocessing import StandardScaler
+from sklearn.utils import check_random_state
+
+from labtools.artifacts import write_directory
+
+
+class KMeansSweep:
+    '''
+    The fitted K-means models of a sweep, by k.
+
+    Attributes:
+        models:   (dict)         - Maps each k to its fitted KMeans
+        k_values: (list)         - The values of k, in the order given
+        inertia:  (pd.Series)    - Inertia of each k, indexed by k
+        scores:   (pd.DataFrame) - The `kmeans_scores()` table, when the
+                                   sweep was run with `scores=True`
+    '''
+
+    def __init__(self, models, scores=None):
+        self.models = models
+        self.k_values = list(models)
+        self.inertia = pd.Series({k: model.inertia_ for k, model in models.items()},
+                                 name='inertia').rename_axis('k')
+        self.scores = scores
+
+    def __getitem__(self, k):
+        return self.models[k]
+
+    def labels(self, k):
+        return self.models[k].labels_
+
+    def centers(self, k):
+        return self.models[k].cluster_centers_
+
+
+def kmeans_sweep(X, k_values, random_state=42, n_jobs=1, scores=False, silhouette_sample=None,
+                 warm_start=False, **params):
+    '''
+    Fits a K-means model for every value of k.
+
+    Args:
+        X:            (array-like) - Data to cluster (already scaled)
+        k_values:     (iterable)   - The values of k
+        random_state: (int)        - As in KMeans
+        n_jobs:       (int)        - Worker processes fitting different k at
+                                     once (None for one per CPU). Each KMeans
+                                     fit already uses every CPU for its own
+                                     distance computations, so this pays off
+                                     mostly for small data and many k.
+        scores:       (bool)       - Also score each k, in the same worker
+                                     that fits it (see `kmeans_scores()`)
+        silhouette_sample: (int)   - As in `kmeans_scores()`
+        warm_start:   (bool)       - Fit the values of k in increasing order,
+                                     starting each from the previous k's
+                                     centroids plus new k-means++ draws,
+                                     with one KMeans run per k. Can land
+                                     in a worse optimum than a fresh fit,
+                                     so inertia and labels differ from the
+                                     labs'. Runs in one process; n_jobs is
+                                     ignored.
+        **params:                  - Further KMeans parameters (max_iter, tol…)
+    Returns:
+        sweep: (KMeansSweep) - The fitted models
+    '''
+    k_values = [int(k) for k in k_values]
+    X = np.asarray(X, dtype=np.float64)
+    if warm_start:
+        return _warm_sweep(X, k_values, random_state, scores, silhouette_sample, params)
+    workers = n_jobs or os.cpu_count() or 1
+    tasks = [(k, random_state, params, scores, silhouette_sample) for k in k_values]
+    if workers == 1 or len(k_values) == 1:
+        results = [_fit_k(*task, X=X) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(k_values)),
+                                 initializer=_share_data, initargs=(X,)) as executor:
+            results = list(executor.map(_fit_k, *zip(*tasks)))
+    models = dict(zip(k_values, (model for model, _ in results)))
+    table = pd.DataFrame([row for _, row in results]) if scores else None
+    return KMeansSweep(models, table)
+
+
+def _warm_sweep(X, k_values, random_state, scores, silhouette_sample, params):
+    rng = check_random_state(random_state)
+    # Squared row norms, computed once for every k-means++ draw of the sweep
+    x_squared_norms = np.einsum('ij,ij->i', X, X)
+    results = {}
+    centers = closest = None
+    for k in sorted(set(k_values)):
+        if centers is None:
+            model = KMeans(n_clusters=k, random_state=random_state, **params).fit(X)
+        else:
+            init = [centers]
+            for _ in range(k - len(centers)):
+                # One k-means++ draw: a row picked with probability
+                # proportional to its squared distance to the nearest center
+                total = closest.sum()
+                row = rng.randint(len(X)) if total <= 0 else rng.choice(len(X), p=closest / total)
+                new_center = X[row:row + 1]
+                init.append(new_center)
+                closest = np.minimum(closest,
+                                     _squared_distances(X, x_squared_norms, new_center)[:, 0])
+            model = KMeans(n_clusters=k, init=np.vstack(init), n_init=1,
+                           random_state=random_state, **params).fit(X)
+        centers = model.cluster_centers_
+        closest = _squared_distances(X, x_squared_norms, centers).min(axis=1)
+        results[k] = _score_k(model, X, random_state, scores, silhouette_sample)
+    results = [results[k] for k in k_values]
+    models = dict(zip(k_values, (model for model, _ in results)))
+    table = pd.DataFrame([row for _, row in results]) if scores else None
+    return KMeansSweep(models, table)
+
+
+def _squared_distances(X, x_squared_norms, centers):
+    # ||x - c||² from the precomputed ||x||², without an n × k × d temporary
+    distances = (x_squared_norms[:, None] - 2 * (X @ centers.T)
+                 + np.einsum('ij,ij->i', centers, centers))
+    return np.maximum(distances, 0)
+
+
+def kmeans_scores(num_clusters, x_vals, random_state=42, n_jobs=1, silhouette_sample=None):
+    '''
+    Fits a KMeans model for each value of k, once, and scores it.
+
+    Args:
+        num_clusters: (list of ints) - The different k values to try (each
+                                       at least 2)
+        x_vals:       (array)        - The training data
+        random_state: (int)          - As in KMeans
+        n_jobs:       (int)          - Worker processes fitting and scoring
+                                       different k at once
+        silhouette_sample: (int)     - If set, estimate each silhouette score
+                                       from this many sampled points
+                                       (`silhouette_estimate()`) instead of
+                                       scoring every point
+    Returns:
+        scores: (pd.DataFrame) - One row per k, with the columns k, inertia,
+                                 silhouette, calinski_harabasz and
+                                 davies_bouldin (plus silhouette_low and
+                                 silhouette_high, the 95% confidence
+                                 interval, when sampling)
+    '''
+    return kmeans_sweep(x_vals, num_clusters, random_state=random_state, n_jobs=n_jobs,
+                        scores=True, silhouette_sample=silhouette_sample).scores
+
+
+# The data each sweep worker process fits, sent once when the worker starts
+_DATA = None
+
+
+def _share_data(X):
+    global _DATA
+    _DATA = X
+
+
+def _fit_k(k, random_state, params, scores, silhouette_sample, X=None):
+    X = _DATA if X is None else X
+    model = KMeans(n_clusters=k, random_state=random_state, **params).fit(X)
+    return _score_k(model, X, random_state, scores, silhouette_sample)
+
+
+def _score_k(model, X, random_state, scores, silhouette_sample):
+    k = model.n_clusters
+    if not scores:
+        return model, None
+    row = {'k': k, 'inertia': model.inertia_}
+    if silhouette_sample is None:
+        row['silhouette'] = silhouette(X, model.labels_)
+    else:
+        row['silhouette'], (row['silhouette_low'], row['silhouette_high']) = (
+            silhouette_estimate(X, model.labels_, n_samples=silhouette_sample,
+                                random_state=random_state))
+    row['calinski_harabasz'] = calinski_harabasz_score(X, model.labels_)
+    row['davies_bouldin'] = davies_bouldin_score(X, model.labels_)
+    return model, row
+
+
+def silhouette_values(X, labels, rows=None, block_size=1024):
+    '''
+    Computes the silhouette coefficient of each point in `rows`, measured
+    against every point of X, with at most block_size × block_size
+    distances in memory at a time.
+
+    Each block of distances is multiplied by the one-hot cluster matrix of
+    its columns, which adds it to running per-cluster distance sums. A
+    point's mean distance to its own cluster (a) and to the nearest other
+    cluster (b) then come from those sums, and s = (b - a) / max(a, b).
+    Points alone in their cluster score 0, as in scikit-learn.
+
+    Args:
+        X:          (array-like) - Data, shape (n, n_features)
+        labels:     (array-like) - Cluster label of each point (at least two
+                                   distinct labels)
+        rows:       (array-like) - Positions of the points to score
+                                   (default: all of them)
+        block_size: (int)        - Rows and columns per block of distances
+    Returns:
+        values: (np.ndarray) - Silhouette coefficient of each row
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    clusters, codes = np.unique(np.asarray(labels), return_inverse=True)
+    if len(clusters) < 2:
+        raise ValueError('The silhouette needs at least 2 clusters')
+    counts = np.bincount(codes, minlength=len(clusters)).astype(np.float64)
+    rows = np.arange(len(X)) if rows is None else np.asarray(rows)
+    row_norms = np.einsum('ij,ij->i', X, X)
+
+    sums = np.zeros((len(rows), len(clusters)))
+    for start in range(0, len(rows), block_size):
+        block_rows = rows[start:start + block_size]
+        points = -2 * X[block_rows]
+        for col in range(0, len(X), block_size):
+            cols = slice(col, col + block_size)
+            # |x - y|² = |x|² - 2 x·y + |y|², in place in one buffer
+            dist = points @ X[cols].T
+            dist += row_norms[block_rows, None]
+            dist += row_norms[None, cols]
+            np.maximum(dist, 0, out=dist)
+            np.sqrt(dist, out=dist)
+            one_hot = np.zeros((dist.shape[1], len(clusters)))
+            one_hot[np.arange(dist.shape[1]), codes[cols]] = 1
+            sums[start:start + len(block_rows)] += dist @ one_hot
+
+    own = codes[rows]
+    at = np.arange(len(rows))
+    own_size = counts[own]
+    a = sums[at, own] / np.maximum(own_size - 1, 1)
+    means = sums / counts
+    means[at, own] = np.inf
+    b = means.min(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = (b - a) / np.maximum(a, b)
+    values[own_size == 1] = 0
+    return np.nan_to_num(values)
+
+
+def silhouette(X, labels, block_size=1024):
+    '''
+    Returns the mean silhouette coefficient, equal to scikit-learn's
+    `silhouette_score(X, labels)`, in memory bounded by `block_size`.
+    '''
+    return float(silhouette_values(X, labels, block_size=block_size).mean())
+
+
+def silhouette_estimate(X, labels, n_samples=2000, confidence=0.95, random_state=0,
+                        block_size=1024):
+    '''
+    Estimates the mean silhouette coefficient from a stratified sample.
+
+    Each cluster contributes points in proportion to its size (at least two
+    per cluster), and every sampled point is scored exactly, against all
+    points. The estimate is the size-weighted mean of the clusters' sample
+    means, and the interval comes from the stratified standard error, with
+    the finite population correction. Time is O(n_samples × n) rather than
+    O(n²).
+
+    Args:
+        X:            (array-like) - Data, shape (n, n_features)
+        labels:       (array-like) - Cluster label of each point
+        n_samples:    (int)        - Points to score in total
+        confidence:   (float)      - Confidence level of the interval
+        random_state: (int)        - Seed for the sample
+        block_size:   (int)        - As in `silhouette_values()`
+    Returns:
+        estimate: (float) - Estimated mean silhouette coefficient
+        interval: (tuple) - Lower and upper confidence bounds
+    '''
+    labels = np.asarray(labels)
+    clusters, codes = np.unique(labels, return_inverse=True)
+    sizes = np.bincount(codes, minlength=len(clusters))
+    if n_samples >= len(labels):
+        value = silhouette(X, labels, block_size)
+        return value, (value, value)
+    rng = np.random.default_rng(random_state)
+    # Proportional allocation, at least two points per cluster when it has them
+    takes = np.minimum(np.maximum(np.round(n_samples * sizes / sizes.sum()).astype(int), 2),
+                       sizes)
+    strata = [rng.choice(np.flatnonzero(codes == c), take, replace=False)
+              for c, take in enumerate(takes)]
+    values = silhouette_values(X, labels, np.concatenate(strata), block_size)
+    weights = sizes / sizes.sum()
+    means, variances = np.empty(len(clusters)), np.empty(len(clusters))
+    start = 0
+    for c, take in enumerate(takes):
+        stratum = values[start:start + take]
+        start += take
+        means[c] = stratum.mean()
+        variances[c] = stratum.var(ddof=1) if take > 1 else 0.0
+    estimate = float(weights @ means)
+    standard_error = np.sqrt(np.sum(weights ** 2 * variances / takes * (1 - takes / sizes)))
+    if standard_error == 0:
+        return estimate, (estimate, estimate)
+    low, high = stats.norm.interval(confidence, loc=estimate, scale=standard_error)
+    return estimate, (float(low), float(high))
+
+
+class CentroidAssigner:
+    '''
+    Assigns records to the nearest centroid of a fitted K-means model,
+    scaling them first the way the model's training data was scaled.
+
+    Distances come from the expansion |z - c|² = |z|² - 2 z·c + |c|², so a
+    batch needs one float32 matrix product with the centroids rather than a
+    KMeans `predict()` and `transform()` call per record.
+
+    Args:
+        centers: (np.ndarray) - Centroids in scaled units, (n_clusters, n_features)
+        mean:    (np.ndarray) - Mean subtracted before scaling (default: 0)
+        scale:   (np.ndarray) - Divisor applied after it (default: 1)
+    '''
+
+    def __init__(self, centers, mean=None, scale=None):
+        self.centers = np.asarray(centers, dtype=np.float32)
+        n_features = self.centers.shape[1]
+        self.mean = (np.zeros(n_features, np.float32) if mean is None
+                     else np.asarray(mean, dtype=np.float32))
+        self.scale = (np.ones(n_features, np.float32) if scale is None
+                      else np.asarray(scale, dtype=np.float32))
+        self._center_norms = np.einsum('ij,ij->i', self.centers, self.centers)
+        # Filled in from meta.json by read_centroids()
+        self.meta = {}
+
+    @classmethod
+    def from_model(cls, kmeans, scaler=None):
+        '''
+        Builds an assigner from a fitted KMeans and the fitted StandardScaler
+        (if any) its training data went through.
+        '''
+        if scaler is None:
+            return cls(kmeans.cluster_centers_)
+        mean = scaler.mean_ if scaler.with_mean else None
+        scale = scaler.scale_ if scaler.with_std else None
+        return cls(kmeans.cluster_centers_, mean, scale)
+
+    def assign(self, X, batch_size=65_536):
+        '''
+        Assigns each row of X to its nearest centroid.
+
+        Args:
+            X:          (array-like) - Unscaled records, (n_rows, n_features)
+            batch_size: (int)        - Rows handled per matrix product
+        Returns:
+            labels:   (np.ndarray) - int32 index of the nearest centroid
+            distance: (np.ndarray) - float32 distance to it, in scaled units
+            margin:   (np.ndarray) - float32 distance to the second-nearest
+                                     centroid minus `distance` (inf with a
+                                     single centroid); small margins mark
+                                     records near a cluster boundary
+        '''
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        labels = np.empty(len(X), dtype=np.int32)
+        distance = np.empty(len(X), dtype=np.float32)
+        margin = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), batch_size):
+            rows = slice(start, start + batch_size)
+            labels[rows], distance[rows], margin[rows] = self._assign_batch(X[rows])
+        return labels, distance, margin
+
+    def iter_assign(self, batches):
+        '''
+        Yields `assign()`'s (labels, distance, margin) for each batch of an
+        iterable, such as the chunks of `pd.read_csv(..., chunksize=...)`.
+        '''
+        for batch in batches:
+            yield self.assign(batch)
+
+    def _assign_batch(self, X):
+        Z = (X - self.mean) / self.scale
+        sq_dist = Z @ (-2 * self.centers.T)
+        sq_dist += self._center_norms
+        sq_dist += np.einsum('ij,ij->i', Z, Z)[:, None]
+        np.maximum(sq_dist, 0, out=sq_dist)
+        labels = np.argmin(sq_dist, axis=1)
+        nearest = sq_dist[np.arange(len(Z)), labels]
+        if sq_dist.shape[1] == 1:
+            second = np.full(len(Z), np.inf, dtype=np.float32)
+        else:
+            second = np.partition(sq_dist, 1, axis=1)[:, 1]
+        distance = np.sqrt(nearest)
+        return labels, distance, np.sqrt(second) - distance
+
+
+CENTROID_ARRAYS = ('centers', 'mean', 'scale')
+
+
+def write_centroids(path, kmeans, scaler=None, save_as:str='kmeans'):
+    '''
+    In:
+        path:    path of folder where you want to save the artifact
+        kmeans:  a fitted KMeans
+        scaler:  the fitted StandardScaler of its training data, if any
+        save_as: name for the artifact (saved as `<save_as>.centroids/`)
+
+    Out:
+        directory: the artifact directory that was written
+    '''
+    assigner = CentroidAssigner.from_model(kmeans, scaler)
+    meta = {'n_clusters': int(assigner.centers.shape[0]),
+            'n_features': int(assigner.centers.shape[1])}
+    feature_names = getattr(scaler if scaler is not None else kmeans, 'feature_names_in_', None)
+    if feature_names is not None:
+        meta['feature_names'] = [str(name) for name in feature_names]
+    os.makedirs(path, exist_ok=True)
+    return write_directory(os.path.join(path, save_as + '.centroids'),
+                           {name: getattr(assigner, name) for name in CENTROID_ARRAYS}, meta)
+
+
+def read_centroids(path, saved_model_name:str, mmap:bool=True):
+    '''
+    In:
+        path:             path to folder where you want to read from
+        saved_model_name: name the artifact was saved as
+        mmap:             memory-map the arrays (True) or read them into RAM
+
+    Out:
+        assigner: a CentroidAssigner ready to assign records
+    '''
+    directory = os.path.join(path, saved_model_name + '.centroids')
+    with open(os.path.join(directory, 'meta.json')) as to_read:
+        meta = json.load(to_read)
+    mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode)
+              for name in CENTROID_ARRAYS}
+    assigner = CentroidAssigner(arrays['centers'], arrays['mean'], arrays['scale'])
+    assigner.meta = meta
+    return assigner
+
+
+def stream_segments(read_chunks, features, n_clusters, out_path=None, group_by=None,
+                    max_epochs=10, tol=1e-3, random_state=42):
+    '''
+    Standardizes and clusters a table chunk by chunk, then labels it.
+
+    Only one chunk is in memory at a time. The table is read 2 + (number of
+    epochs) times:
+        1. StandardScaler `partial_fit()` on every chunk
+        2. MiniBatchKMeans `partial_fit()` on every scaled chunk, repeated
+           for up to `max_epochs` epochs. Before each update, the chunk's
+           squared distances to the current centers are added to the
+           epoch's inertia. Training stops once an epoch lowers the mean
+           inertia by less than `tol` (relative to the previous epoch).
+        3. `predict()` on every chunk. The chunk's kept rows are appended,
+           with a `cluster` column, to `out_path`, and the cluster counts
+           and feature sums are tallied.
+
+    Args:
+        read_chunks: (callable)        - Returns a fresh iterable of DataFrame
+                                         chunks each time it is called, e.g.
+                                         `lambda: pd.read_csv(path, chunksize=100_000)`
+        features:    (callable)        - Maps a chunk to its numeric feature
+                                         frame. It may drop rows (such as rows
+                                         with missing values); the frame's
+                                         index says which rows were kept.
+        n_clusters:  (int)             - Number of clusters
+        out_path:    (string)          - CSV file for the labelled rows
+                                         (default: not written)
+        group_by:    (list of strings) - Columns to count within each cluster,
+                                         like `groupby(['cluster', 'species'])`
+        max_epochs:  (int)             - Most passes of mini-batch training
+        tol:         (float)           - Relative inertia improvement below
+                                         which training stops
+        random_state: (int)            - Seed for MiniBatchKMeans
+    Returns:
+        segments: (dict) - scaler: the fitted StandardScaler,
+                           kmeans: the fitted MiniBatchKMeans,
+                           history: inertia per epoch (pd.DataFrame),
+                           cluster_sizes: rows per cluster (pd.Series),
+                           cluster_means: mean features per cluster, in
+                                          the original units (pd.DataFrame),
+                           summary: row counts by cluster and `group_by`
+                                    (pd.Series, when `group_by` is given)
+    '''
+    scaler = StandardScaler()
+    for chunk in read_chunks():
+        X = features(chunk)
+        if len(X):
+            scaler.partial_fit(X)
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, n_init=1)
+    history = []
+    for epoch in range(1, max_epochs + 1):
+        inertia, n_rows = 0.0, 0
+        for chunk in read_chunks():
+            X = features(chunk)
+            if not len(X):
+                continue
+            X_scaled = scaler.transform(X)
+            if hasattr(kmeans, 'cluster_centers_'):
+                # score() is minus the inertia of the rows
+                inertia -= kmeans.score(X_scaled)
+                n_rows += len(X_scaled)
+            kmeans.partial_fit(X_scaled)
+        if n_rows == 0:
+            # The first epoch only seeded the centers on its first chunk
+            history.append({'epoch': epoch, 'mean_inertia': np.nan})
+            continue
+        history.append({'epoch': epoch, 'mean_inertia': inertia / n_rows})
+        previous = history[-2]['mean_inertia'] if len(history) > 1 else np.nan
+        if not np.isnan(previous) and previous - history[-1]['mean_inertia'] < tol * previous:
+            break
+
+    group_by = list(group_by or [])
+    sizes = np.zeros(n_clusters, dtype=np.int64)
+    sums = None
+    summary = None
+    first = True
+    for chunk in read_chunks():
+        X = features(chunk)
+        if not len(X):
+            continue
+        labels = kmeans.predict(scaler.transform(X))
+        labelled = chunk.loc[X.index].assign(cluster=labels)
+        if out_path is not None:
+            labelled.to_csv(out_path, mode='w' if first else 'a', header=first, index=False)
+        first = False
+        sizes += np.bincount(labels, minlength=n_clusters)
+        chunk_sums = X.astype(np.float64).groupby(labels).sum().reindex(range(n_clusters),
+                                                                         fill_value=0)
+        sums = chunk_sums if sums is None else sums + chunk_sums
+        if group_by:
+            counts = labelled.groupby(['cluster'] + group_by).size()
+            summary = counts if summary is None else summary.add(counts, fill_value=0)
+
+    cluster_sizes = pd.Series(sizes, name='size').rename_axis('cluster')
+    segments = {'scaler': scaler,
+                'kmeans': kmeans,
+                'history': pd.DataFrame(history),
+                'cluster_sizes': cluster_sizes,
+                'cluster_means': sums.div(np.maximum(sizes, 1), axis=0).rename_axis('cluster'),
+                }
+    if group_by:
+        segments['summary'] = summary.astype(np.int64).sort_index()
+    return segments
@@ -0,0 +1,406 @@
+'''
+Fast color quantization for the K-means color compression guide.
+
+The guide fits KMeans to every pixel of the photo, then rebuilds the image
+with one boolean mask per cluster (`new_img[kmeans.labels_ == i] = ...`),
+so each k costs a full K-means run over millions of points plus k passes
+over the image. `ColorQuantizer` does the same compression in two cheap
+steps:
+    - fit: the pixels are tallied into a histogram of RGB cells (32 levels
+      per channel by default), and KMeans is fitted to the cells' mean
+      colors weighted by their pixel counts. At most 32,768 weighted
+      points, however large the photo. (`method='sample'` fits to a random
+      subsample of pixels instead.)
+    - quantize: every distinct color in the image is assigned to its
+      nearest center once, and the pixels are then looked up by their
+      packed 24-bit color and replaced with a single gather of the uint8
+      palette by label (`palette_[labels]`), with no per-cluster masks.
+
+    quantizer = ColorQuantizer(n_colors=3).fit(img)
+    new_img = quantizer.quantize(img)
+
+Tallying the distinct colors of the photo is half the work and does not
+depend on k. To compress one photo for several k, tally it once:
+
+    colors = ImageColors(img)
+    images = {k: ColorQuantizer(n_colors=k).fit_quantize(colors) for k in range(2, 11)}
+
+The centers are not exactly those of KMeans fitted to every pixel, since
+pixels in the same cell count as one point at the cell's mean, and K-means
+can settle in a different (about as good) local optimum from the smaller
+input. Assignment is exact: each pixel gets its nearest center.
+
+For photos too large to hold in memory (or to copy for every k), the tiled
+functions keep memory proportional to a band of rows instead:
+
+    img = open_image('huge_photo.jpg')                 # memory-mapped uint8
+    quantizer = ColorQuantizer(n_colors=8).fit(sample_pixels(img))
+    new_img = quantize_tiled(quantizer, img, 'huge_photo_k8.npy')
+
+`pixel_cloud()` draws an image's colors in 3-D RGB space with one marker
+per occupied cell of `ImageColors.histogram()` (at most 32,768) instead of
+one per pixel, sized by the cell's pixel count, so the figure stays the
+same size whatever the resolution of the photo.
+'''
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.base import BaseEstimator
+from sklearn.cluster import KMeans
+
+
+# Distinct colors assigned per block, bounding the distance matrix
+_CHUNK = 1 << 16
+
+# Image rows read or written at a time by the tiled functions
+_TILE_ROWS = 256
+
+
+def pack_rgb(img):
+    '''
+    Packs the RGB channels of each pixel into one 24-bit integer.
+
+    Args:
+        img: (np.ndarray) - uint8 image of shape (..., 3)
+    Returns:
+        codes: (np.ndarray) - int32 code of each pixel, shape img.shape[:-1]
+    '''
+    img = np.asarray(img)
+    if img.dtype != np.uint8 or img.shape[-1] != 3:
+        raise ValueError(f'Expected a uint8 RGB image, got {img.dtype} with shape {img.shape}')
+    return ((img[..., 0].astype(np.int32) << 16)
+            | (img[..., 1].astype(np.int32) << 8)
+            | img[..., 2])
+
+
+def unpack_rgb(codes):
+    '''
+    Inverse of `pack_rgb()`: splits 24-bit codes into an (..., 3) array.
+    '''
+    codes = np.asarray(codes)
+    return np.stack([codes >> 16, (codes >> 8) & 255, codes & 255], axis=-1)
+
+
+class ImageColors:
+    '''
+    The distinct colors of an image and their pixel counts, tallied once so
+    that quantizers for several k can share them.
+
+    Args:
+        img: (np.ndarray) - uint8 RGB image of shape (height, width, 3)
+
+    Attributes:
+        shape:  (tuple)      - Shape of the image
+        codes:  (np.ndarray) - Packed 24-bit color of each pixel (`pack_rgb()`)
+        packed: (np.ndarray) - Ascending packed codes of the distinct colors
+        counts: (np.ndarray) - Pixels of each distinct color
+        colors: (np.ndarray) - The distinct colors, shape (n_colors, 3)
+    '''
+
+    def __init__(self, img):
+        self.shape = np.shape(img)
+        self.codes = pack_rgb(img)
+        if self.codes.size >= 1 << 22:
+            counts = np.bincount(self.codes.ravel(), minlength=1 << 24)
+            self.packed = np.flatnonzero(counts)
+            self.counts = counts[self.packed]
+        else:
+            # Sorting is cheaper than a 2**24-entry tally for a few pixels
+            self.packed, self.counts = np.unique(self.codes, return_counts=True)
+        self.colors = unpack_rgb(self.packed)
+
+    def histogram(self, bits=5):
+        '''
+        Tallies the pixels into cells of RGB space with `bits` levels per
+        channel.
+
+        Args:
+            bits: (int) - Bits kept per channel, 1 to 8 (8 keeps every
+                          distinct color)
+        Returns:
+            colors: (np.ndarray) - float64 mean color of each occupied cell,
+                                   shape (n_cells, 3)
+            counts: (np.ndarray) - Pixels in each occupied cell
+        '''
+        if not 1 <= bits <= 8:
+            raise ValueError(f'bits must be between 1 and 8, got {bits}')
+        cells = self.colors >> (8 - bits)
+        cell = (cells[:, 0] << (2 * bits)) | (cells[:, 1] << bits) | cells[:, 2]
+        n_cells = 1 << (3 * bits)
+        counts = np.bincount(cell, weights=self.counts, minlength=n_cells)
+        occupied = np.flatnonzero(counts)
+        sums = np.stack([np.bincount(cell, weights=self.counts * self.colors[:, c],
+                                     minlength=n_cells)[occupied]
+                         for c in range(3)], axis=1)
+        return sums / counts[occupied, None], counts[occupied]
+
+
+def nearest_center(points, centers):
+    '''
+    Returns the index of the nearest center to each point, from the
+    expanded squared distance |p|² - 2 p·c + |c|² (|p|² is the same for
+    every center, so it is left out).
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    centers = np.asarray(centers, dtype=np.float64)
+    return np.argmin((centers ** 2).sum(axis=1) - 2 * points @ centers.T, axis=1)
+
+
+class ColorQuantizer(BaseEstimator):
+    '''
+    Reduces an RGB image to `n_colors` colors found by K-means.
+
+    Args:
+        n_colors:     (int)    - Number of colors (K-means clusters)
+        method:       (string) - 'histogram' fits to the weighted cells of
+                                 `ImageColors.histogram()`, 'sample' fits
+                                 to a random subsample of pixels
+        bits:         (int)    - Bits per channel of the histogram cells
+        sample:       (int)    - Pixels drawn by the 'sample' method
+        random_state: (int)    - Seed for K-means and the subsample
+
+    Attributes set by `fit()`:
+        cluster_centers_: (np.ndarray) - float64 centers, shape (n_colors, 3)
+        palette_:         (np.ndarray) - The centers rounded to uint8
+        inertia_:         (float)      - K-means inertia on the fitted points
+    '''
+
+    def __init__(self, n_colors=3, method='histogram', bits=5, sample=100_000,
+                 random_state=42):
+        self.n_colors = n_colors
+        self.method = method
+        self.bits = bits
+        self.sample = sample
+        self.random_state = random_state
+
+    def fit(self, img, y=None):
+        '''
+        Fits the palette to an image, or to the `ImageColors` of one.
+        '''
+        colors = _image_colors(img)
+        if self.method == 'histogram':
+            points, weights = colors.histogram(self.bits)
+        elif self.method == 'sample':
+            rng = np.random.default_rng(self.random_state)
+            n_pixels = colors.codes.size
+            rows = rng.choice(n_pixels, min(self.sample, n_pixels), replace=False)
+            points, weights = unpack_rgb(colors.codes.ravel()[rows]).astype(np.float64), None
+        else:
+            raise ValueError(f"method must be 'histogram' or 'sample', got {self.method!r}")
+        # Fewer occupied cells than colors: each cell is its own center
+        n_clusters = min(self.n_colors, len(points))
+        kmeans = KMeans(n_clusters=n_clusters, random_state=self.random_state)
+        kmeans.fit(points, sample_weight=weights)
+        self.cluster_centers_ = kmeans.cluster_centers_
+        self.palette_ = np.clip(np.rint(self.cluster_centers_), 0, 255).astype(np.uint8)
+        self.inertia_ = kmeans.inertia_
+        return self
+
+    def predict(self, img):
+        '''
+        Returns the index of the nearest center to each pixel of an image
+        (or of its `ImageColors`), shape height × width. Each distinct color
+        is assigned once.
+        '''
+        colors = _image_colors(img)
+        # Assign the distinct colors, then look every pixel up by its code
+        return self.lookup_table(colors.packed, colors.colors)[colors.codes]
+
+    def lookup_table(self, packed, colors=None):
+        '''
+        Returns a table of the nearest center to each packed 24-bit color,
+        indexed by the code. Only the codes in `packed` are filled in.
+
+        Args:
+            packed: (np.ndarray) - Distinct packed codes to assign
+            colors: (np.ndarray) - The same colors unpacked, if at hand
+        Returns:
+            lookup: (np.ndarray) - Center index by code, 2**24 entries
+        '''
+        lookup = np.zeros(1 << 24, dtype=np.uint8 if len(self.palette_) <= 256 else np.int32)
+        for start in range(0, len(packed), _CHUNK):
+            block = slice(start, start + _CHUNK)
+            points = unpack_rgb(packed[block]) if colors is None else colors[block]
+            lookup[packed[block]] = nearest_center(points, self.cluster_centers_)
+        return lookup
+
+    def quantize(self, img):
+        '''
+        Returns a uint8 image with every pixel replaced by the color of its
+        nearest center.
+        '''
+        # np.take is several times faster than palette_[labels] here
+        return np.take(self.palette_, self.predict(img), axis=0)
+
+    def fit_quantize(self, img):
+        colors = _image_colors(img)
+        return self.fit(colors).quantize(colors)
+
+
+def _image_colors(img):
+    return img if isinstance(img, ImageColors) else ImageColors(img)
+
+
+def open_image(path, cache_dir='.lab_cache'):
+    '''
+    Opens an RGB image as a read-only, memory-mapped uint8 array, so its
+    pixels are read from disk as they are used rather than held in memory.
+
+    A `.npy` file is mapped directly. Any other image is decoded once into a
+    `.npy` file in `cache_dir` (reused while it is newer than the image),
+    row band by row band, and that file is mapped. The decoder itself
+    (Pillow, or matplotlib when Pillow is missing) holds the decoded image
+    while it runs.
+
+    Args:
+        path:      (string) - Image file
+        cache_dir: (string) - Folder for decoded images
+    Returns:
+        img: (np.memmap) - uint8 array of shape (height, width, 3)
+    '''
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    cached = os.path.join(cache_dir, os.path.basename(path) + '.npy')
+    if not (os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path)):
+        os.makedirs(cache_dir, exist_ok=True)
+        decoded = _decode(path)
+        partial = cached + '.partial'
+        out = np.lib.format.open_memmap(partial, mode='w+', dtype=np.uint8,
+                                        shape=decoded.shape[:2] + (3,))
+        for start in range(0, out.shape[0], _TILE_ROWS):
+            band = np.asarray(decoded[start:start + _TILE_ROWS])[..., :3]
+            if band.dtype != np.uint8:
+                # matplotlib reads PNGs as floats in [0, 1]
+                band = np.clip(np.rint(band * 255), 0, 255).astype(np.uint8)
+            out[start:start + len(band)] = band
+        out.flush()
+        del out, decoded
+        os.replace(partial, cached)
+    return np.load(cached, mmap_mode='r')
+
+
+def _decode(path):
+    try:
+        from PIL import Image
+    except ImportError:
+        import matplotlib.pyplot as plt
+        return plt.imread(path)
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def sample_pixels(img, n_samples=200_000, random_state=42, tile_rows=None):
+    '''
+    Draws a uniform random sample of pixels without replacement, reading
+    the image one band of rows at a time.
+
+    Args:
+        img:          (np.ndarray) - RGB image, e.g. from `open_image()`
+        n_samples:    (int)        - Pixels to draw
+        random_state: (int)        - Seed
+        tile_rows:    (int)        - Rows read at a time
+    Returns:
+        pixels: (np.ndarray) - Sampled pixels, shape (n_samples, 3)
+    '''
+    height, width = img.shape[:2]
+    tile_rows = tile_rows or _TILE_ROWS
+    rng = np.random.default_rng(random_state)
+    picks = np.sort(rng.choice(height * width, min(n_samples, height * width), replace=False))
+    pixels = np.empty((len(picks), 3), dtype=img.dtype)
+    bounds = np.searchsorted(picks, np.arange(0, height + tile_rows, tile_rows) * width)
+    for band, start in enumerate(range(0, height, tile_rows)):
+        chosen = slice(bounds[band], bounds[band + 1])
+        tile = np.asarray(img[start:start + tile_rows]).reshape(-1, 3)
+        pixels[chosen] = tile[picks[chosen] - start * width]
+    return pixels
+
+
+def quantize_tiled(quantizer, img, out_path, tile_rows=None, n_jobs=None):
+    '''
+    Quantizes an image band by band into a memory-mapped `.npy` file, with
+    the bands processed in a pool of threads.
+
+    A first pass marks which 24-bit colors occur (a 16 MB table, whatever
+    the image size); those colors are assigned to their nearest centers
+    once, and a second pass looks each band's pixels up in the resulting
+    table and writes their palette colors. Memory is a few bands per thread
+    plus the fixed-size tables.
+
+    Args:
+        quantizer: (ColorQuantizer) - Fitted quantizer
+        img:       (np.ndarray)     - uint8 RGB image, e.g. from `open_image()`
+        out_path:  (string)         - `.npy` file to write
+        tile_rows: (int)            - Rows per band
+        n_jobs:    (int)            - Threads (default: one per CPU)
+    Returns:
+        new_img: (np.memmap) - The quantized image, mapped from `out_path`
+    '''
+    height = img.shape[0]
+    tile_rows = tile_rows or _TILE_ROWS
+    starts = range(0, height, tile_rows)
+    workers = n_jobs or os.cpu_count() or 1
+
+    seen = np.zeros(1 << 24, dtype=bool)
+
+    def mark(start):
+        # Every thread only ever sets entries to True
+        seen[pack_rgb(img[start:start + tile_rows])] = True
+
+    out = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.uint8, shape=img.shape)
+
+    def write(start):
+        labels = lookup[pack_rgb(img[start:start + tile_rows])]
+        out[start:start + len(labels)] = np.take(quantizer.palette_, labels, axis=0)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(mark, starts))
+        lookup = quantizer.lookup_table(np.flatnonzero(seen))
+        list(executor.map(write, starts))
+    out.flush()
+    return out
+
+
+def rgb_strings(colors):
+    '''
+    Formats an (n, 3) array of RGB values as '#rrggbb' color strings in one
+    vectorized call, for plotly's `marker.color`.
+    '''
+    codes = pack_rgb(np.clip(np.rint(colors), 0, 255).astype(np.uint8))
+    return np.char.mod('#%06x', codes)
+
+
+def pixel_cloud(img, bits=5, centers=None, max_size=12, opacity=0.8):
+    '''
+    Builds a plotly 3-D scatter of an image's colors with one marker per
+    occupied RGB cell, placed at the mean color of the cell's pixels and
+    sized by the square root of their count.
+
+    Args:
+        img:      (np.ndarray)  - uint8 RGB image, or its `ImageColors`
+        bits:     (int)         - Bits per channel of the cells (5: 32³ cells)
+        centers:  (np.ndarray)  - K-means centroids. If given, each marker
+                                  takes the color of its nearest centroid,
+                                  showing the clusters instead of the colors.
+        max_size: (int)         - Marker size of the most populous cell
+        opacity:  (float)       - Marker opacity
+    Returns:
+        trace: (go.Scatter3d) - Trace to add to a plotly figure
+    '''
+    import plotly.graph_objects as go
+
+    colors, counts = _image_colors(img).histogram(bits)
+    if centers is None:
+        shown = colors
+    else:
+        centers = np.asarray(centers, dtype=np.float64)
+        shown = centers[nearest_center(colors, centers)]
+    sizes = 1 + (max_size - 1) * np.sqrt(counts / counts.max())
+    return go.Scatter3d(x=colors[:, 0], y=colors[:, 1], z=colors[:, 2],
+                        mode='markers',
+                        marker=dict(size=sizes, color=rgb_strings(shown), opacity=opacity,
+                                    line=dict(width=0)),
+                        customdata=counts,
+                        hovertemplate='rgb(%{x:.0f}, %{y:.0f}, %{z:.0f})<br>'
+                                      '%{customdata} pixels<extra></extra>')
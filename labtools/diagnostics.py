@@ -0,0 +1,205 @@
+'''
+Assumption checks for the Waze logistic regression, vectorized.
+
+The Course 5 Waze lab computes each user's logit with a Python loop over
+the rows of `predict_proba()`:
+
+    logit_data['logit'] = [np.log(prob[1] / prob[0]) for prob in training_probabilities]
+
+then checks that the logit is linear in one feature with a regplot, and
+checks multicollinearity on a correlation heatmap. For a binary
+LogisticRegression, log(p1 / p0) is exactly the model's
+`decision_function()`, X @ coef + intercept, so `logits()` gets it from one
+matrix product, without the probabilities or their rounding near 0 and 1:
+
+    logit_data['logit'] = logits(model, X_train)
+
+`logit_curves()` checks the linearity assumption for every feature in one
+call. Each feature is cut into quantile bins, and the mean feature value and
+mean logit of each bin are tallied with `np.bincount`. The result is one
+curve per feature, the binned version of the lab's regplot, with the R² of a
+straight line through each curve (weighted by the bin counts) as a summary.
+
+`collinearity()` computes the correlation matrix, the variance inflation
+factor of each feature, and the feature pairs above the lab's |r| > 0.7
+threshold, all from one covariance matrix of the columns. The VIF of a
+feature, 1 / (1 - R²) of regressing it on the others, is read off the
+diagonal of the inverse correlation matrix instead of fitting a regression
+per feature.
+
+`logit_diagnostics()` runs all three on a fitted model:
+
+    diagnostics = logit_diagnostics(model, X_train)
+    diagnostics['linearity']        # R² of each feature's curve
+    diagnostics['vif']
+
+Each of these is a few passes over the data, so a few million users take
+seconds.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def logits(model, X):
+    '''
+    Returns the log-odds of the positive class for each row, the lab's
+    `np.log(prob[1] / prob[0])`.
+
+    Args:
+        model: (LogisticRegression) - Fitted binary classifier
+        X:     (array-like)         - Features, as passed to the model
+    Returns:
+        logit: (np.ndarray) - float64 log-odds of each row
+    '''
+    return np.asarray(model.decision_function(X), dtype=np.float64)
+
+
+def _columns(X):
+    if isinstance(X, pd.DataFrame):
+        return X.to_numpy(dtype=np.float64), list(X.columns)
+    X = np.asarray(X, dtype=np.float64)
+    return X, [f'x{i}' for i in range(X.shape[1])]
+
+
+def logit_curves(X, logit, bins=20):
+    '''
+    Bins every feature by its quantiles and averages the logit in each bin.
+
+    Features with fewer distinct values than `bins` (such as day counts and
+    flags) get one bin per value wherever the quantiles coincide.
+
+    Args:
+        X:     (array-like) - Features, rows × features
+        logit: (array-like) - Log-odds of each row, e.g. from `logits()`
+        bins:  (int)        - Most bins per feature
+    Returns:
+        curves: (pd.DataFrame) - One row per non-empty bin, with columns
+                                 feature, bin, count, feature_mean and
+                                 logit_mean
+    '''
+    values, names = _columns(X)
+    logit = np.asarray(logit, dtype=np.float64)
+    # Interior quantiles of every feature in one call
+    cuts = np.quantile(values, np.arange(1, bins) / bins, axis=0)
+    curves = []
+    for j, name in enumerate(names):
+        codes = np.searchsorted(np.unique(cuts[:, j]), values[:, j], side='right')
+        counts = np.bincount(codes, minlength=bins)
+        kept = np.flatnonzero(counts)
+        curves.append(pd.DataFrame({
+            'feature': name,
+            'bin': kept,
+            'count': counts[kept],
+            'feature_mean': np.bincount(codes, weights=values[:, j], minlength=bins)[kept] / counts[kept],
+            'logit_mean': np.bincount(codes, weights=logit, minlength=bins)[kept] / counts[kept],
+            }))
+    return pd.concat(curves, ignore_index=True)
+
+
+def curve_linearity(curves):
+    '''
+    Scores how straight each feature's logit curve is.
+
+    Args:
+        curves: (pd.DataFrame) - Output of `logit_curves()`
+    Returns:
+        linearity: (pd.DataFrame) - Indexed by feature, with the count-weighted
+                                    slope of logit_mean on feature_mean, the R²
+                                    of that line, and the number of bins
+                                    (R² is NaN for features with one bin)
+    '''
+    weight = curves['count'].to_numpy(np.float64)
+    x = curves['feature_mean'].to_numpy()
+    y = curves['logit_mean'].to_numpy()
+    codes, features = pd.factorize(curves['feature'])
+
+    def total(values):
+        return np.bincount(codes, weights=weight * values, minlength=len(features))
+
+    n = total(1.0)
+    x_mean, y_mean = total(x) / n, total(y) / n
+    dx, dy = x - x_mean[codes], y - y_mean[codes]
+    sxx, syy, sxy = total(dx * dx), total(dy * dy), total(dx * dy)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = sxy / sxx
+        r2 = np.where((sxx > 0) & (syy > 0), sxy ** 2 / (sxx * syy), np.nan)
+    return pd.DataFrame({'slope': slope, 'r2': r2, 'bins': np.bincount(codes)},
+                        index=pd.Index(features, name='feature'))
+
+
+def collinearity(X, threshold=0.7):
+    '''
+    Correlation, variance inflation factors and strongly correlated pairs
+    of features, from one covariance matrix.
+
+    Args:
+        X:         (array-like) - Numeric features, rows × features
+        threshold: (float)      - Report pairs with |r| above this (the lab
+                                  uses 0.7)
+    Returns:
+        collinearity: (dict) - correlation: Pearson correlation matrix
+                                            (pd.DataFrame), as `df.corr()`,
+                               vif: variance inflation factor of each feature
+                                    (pd.Series; inf for features that are
+                                    exact combinations of others, NaN for
+                                    constant features),
+                               pairs: feature pairs with |r| > threshold,
+                                      strongest first (pd.DataFrame)
+    '''
+    values, names = _columns(X)
+    centered = values - values.mean(axis=0)
+    covariance = centered.T @ centered
+    del centered
+    scale = np.sqrt(np.diag(covariance))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = covariance / np.outer(scale, scale)
+    np.fill_diagonal(correlation, np.where(scale > 0, 1.0, np.nan))
+
+    vif = np.full(len(names), np.nan)
+    varying = np.flatnonzero(scale > 0)
+    if len(varying):
+        eigenvalues, eigenvectors = np.linalg.eigh(correlation[np.ix_(varying, varying)])
+        kept = eigenvalues > len(varying) * np.finfo(np.float64).eps * eigenvalues.max()
+        # Diagonal of the (pseudo-)inverse. Features with weight in a null
+        # direction are exact combinations of the others.
+        inverse = (eigenvectors[:, kept] ** 2 / eigenvalues[kept]).sum(axis=1)
+        dependent = np.abs(eigenvectors[:, ~kept]).max(axis=1, initial=0) > 1e-6
+        vif[varying] = np.where(dependent, np.inf, inverse)
+
+    upper = np.triu_indices(len(names), k=1)
+    r = correlation[upper]
+    strong = np.flatnonzero(np.abs(r) > threshold)
+    strong = strong[np.argsort(-np.abs(r[strong]), kind='stable')]
+    pairs = pd.DataFrame({'feature_1': np.asarray(names, dtype=object)[upper[0][strong]],
+                          'feature_2': np.asarray(names, dtype=object)[upper[1][strong]],
+                          'r': r[strong]})
+    return {'correlation': pd.DataFrame(correlation, index=names, columns=names),
+            'vif': pd.Series(vif, index=names, name='vif'),
+            'pairs': pairs,
+            }
+
+
+def logit_diagnostics(model, X, bins=20, threshold=0.7):
+    '''
+    Runs the lab's post-fit assumption checks on a fitted logistic regression.
+
+    Args:
+        model:     (LogisticRegression) - Fitted binary classifier
+        X:         (array-like) - Features the model was fitted on (X_train)
+        bins:      (int)        - Most bins per feature for the logit curves
+        threshold: (float)      - |r| above which features count as collinear
+    Returns:
+        diagnostics: (dict) - logit: log-odds of each row (np.ndarray),
+                              curves: binned logit curves (`logit_curves()`),
+                              linearity: per-feature line fit of the curves
+                                         (`curve_linearity()`),
+                              correlation, vif, pairs: as `collinearity()`
+    '''
+    logit = logits(model, X)
+    curves = logit_curves(X, logit, bins=bins)
+    return {'logit': logit,
+            'curves': curves,
+            'linearity': curve_linearity(curves),
+            **collinearity(X, threshold=threshold),
+            }
@@ -0,0 +1,414 @@
+'''
+Stage timing and memory instrumentation for the labs.
+
+Wrap the expensive steps of a lab in `stage()` instead of a `%%time` cell
+magic. That works the same in a notebook and in a plain script, and the
+measurements are recorded, not only printed:
+
+    from labtools.instrument import enable, stage
+
+    enable(echo=True, jsonl='stages.jsonl')
+
+    with stage('fit', rows=len(X_train)):
+        rf_cv.fit(X_train, y_train)
+
+`stage()` also works as a decorator. Each stage records its wall time, CPU
+time (all threads of the process), peak resident memory, and an optional
+row count. The records can be:
+    - printed when each stage ends (`echo=True`), like `%%time` did
+    - appended to a JSON lines file, one object per stage
+    - written to a Prometheus text-format file, which node_exporter's
+      textfile collector can pick up
+    - collected into a DataFrame with `summary()`
+
+Until `enable()` is called, `stage()` does nothing. A disabled stage costs
+one small object and two attribute lookups.
+
+Instrumentation can also be set up once for every lab, script and pipeline
+run from a shell, without touching the code, through environment
+variables read when this module is first imported:
+
+    LABTOOLS_STAGE_ECHO=1             print each stage as it ends (0 to stop)
+    LABTOOLS_STAGE_LOG=stages.jsonl   append the records to a JSON lines file
+    LABTOOLS_STAGE_PROM=stages.prom   keep a Prometheus text file up to date
+
+    LABTOOLS_STAGE_ECHO=1 LABTOOLS_STAGE_LOG=stages.jsonl python lab.py
+
+The labs then only import `stage`. In a notebook or another interactive
+session (IPython, `python -i`), stages are printed as they end unless
+LABTOOLS_STAGE_ECHO=0, so the cells converted from `%%time` still show
+their runtime.
+
+Peak RSS is per stage on Linux, where the kernel's high-water mark can be
+reset when a stage starts. Elsewhere it is the process's peak so far.
+'''
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+_CLEAR_REFS = '/proc/self/clear_refs'
+_STATUS = '/proc/self/status'
+
+
+def peak_rss():
+    '''
+    Returns the process's resident-memory high-water mark in bytes (None if
+    the platform does not report it).
+
+    Reads VmHWM on Linux, which starts afresh when a process execs and can
+    be reset. `ru_maxrss` is only a fallback, because on Linux a spawned
+    child inherits its parent's value.
+    '''
+    try:
+        with open(_STATUS) as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+
+
+def _reset_hwm():
+    '''
+    Resets the high-water mark to the current RSS. Returns False if the
+    platform does not allow it.
+    '''
+    try:
+        with open(_CLEAR_REFS, 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _rows_of(value):
+    shape = getattr(value, 'shape', None)
+    if shape:
+        return int(shape[0])
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+class _Stage:
+    '''
+    One timed stage. Usable as a context manager or as a decorator.
+
+    Created by `stage()` or `Recorder.stage()`. Set `.rows` inside the
+    `with` block when the row count is only known once the stage has run.
+    '''
+
+    __slots__ = ('name', 'rows', 'labels', '_owner', '_recorder', '_wall', '_cpu',
+                 '_peak', '_traced_before', '_traced_peak')
+
+    def __init__(self, name, rows=None, labels=None, owner=None):
+        self.name = name
+        self.rows = rows
+        self.labels = labels
+        self._owner = owner
+        self._recorder = None
+
+    def __enter__(self):
+        self._recorder = self._owner or _active
+        if self._recorder is not None:
+            self._recorder._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._recorder is not None:
+            self._recorder._exit(self, failed=exc_type is not None)
+            self._recorder = None
+        return False
+
+    def __call__(self, func):
+        name, rows, labels, owner = self.name, self.rows, self.labels, self._owner
+
+        def wrapper(*args, **kwargs):
+            # A fresh stage per call, so recursive and threaded calls work
+            with _Stage(name, rows, labels, owner) as current:
+                result = func(*args, **kwargs)
+                if current.rows is None:
+                    current.rows = _rows_of(result)
+                return result
+
+        wrapper.__name__ = getattr(func, '__name__', 'stage')
+        wrapper.__doc__ = getattr(func, '__doc__', None)
+        wrapper.__wrapped__ = func
+        return wrapper
+
+
+class Recorder:
+    '''
+    Records stages and sends each finished stage to the configured outputs.
+
+    Args:
+        jsonl:        (string) - Append one JSON object per stage to this file
+        prometheus:   (string) - Rewrite this Prometheus text file after each
+                                 stage with the latest value of every stage
+        echo:         (bool)   - Print a one-line summary when a stage ends
+        trace_memory: (bool)   - Also record the bytes each stage allocates,
+                                 using tracemalloc (slows Python code down)
+        labels:       (dict)   - Extra fields added to every record, such as
+                                 {'lab': 'waze_churn'}
+    '''
+
+    def __init__(self, jsonl=None, prometheus=None, echo=False, trace_memory=False,
+                 labels=None):
+        self.jsonl = jsonl
+        self.prometheus = prometheus
+        self.echo = echo
+        self.trace_memory = trace_memory
+        self.labels = dict(labels or {})
+        self.records = []
+        # Highest tracemalloc reading seen by any stage, in bytes
+        self.traced_peak = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._can_reset_hwm = _reset_hwm()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name, rows=None, **labels):
+        '''
+        Returns a stage recorded by this recorder, whatever is enabled globally.
+        '''
+        return _Stage(name, rows, labels, owner=self)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, current):
+        stack = self._stack()
+        if stack and self._can_reset_hwm:
+            # Keep the enclosing stage's peak so far before resetting
+            parent = stack[-1]
+            parent._peak = max(parent._peak or 0, peak_rss() or 0)
+        if self._can_reset_hwm:
+            _reset_hwm()
+        current._peak = None
+        if self.trace_memory:
+            if stack:
+                stack[-1]._traced_peak = max(stack[-1]._traced_peak,
+                                             tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            current._traced_before = tracemalloc.get_traced_memory()[0]
+            current._traced_peak = 0
+        stack.append(current)
+        current._cpu = time.process_time()
+        current._wall = time.perf_counter()
+
+    def _exit(self, current, failed=False):
+        wall = time.perf_counter() - current._wall
+        cpu = time.process_time() - current._cpu
+        stack = self._stack()
+        stack.pop()
+        peak = max(current._peak or 0, peak_rss() or 0) or None
+        record = {'stage': current.name,
+                  'parent': stack[-1].name if stack else None,
+                  'wall_s': wall,
+                  'cpu_s': cpu,
+                  'peak_rss_mb': peak / 1e6 if peak else None,
+                  'rows': current.rows,
+                  'failed': failed,
+                  'time': time.time(),
+                  }
+        if self.trace_memory:
+            traced_peak = max(current._traced_peak, tracemalloc.get_traced_memory()[1])
+            record['alloc_mb'] = (traced_peak - current._traced_before) / 1e6
+            self.traced_peak = max(self.traced_peak, traced_peak)
+            if stack:
+                stack[-1]._traced_peak = max(stack[-1]._traced_peak, traced_peak)
+        if stack and peak:
+            stack[-1]._peak = max(stack[-1]._peak or 0, peak)
+        record.update(self.labels)
+        if current.labels:
+            record.update(current.labels)
+        self._emit(record)
+
+    def _emit(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.jsonl:
+                with open(self.jsonl, 'a') as to_write:
+                    to_write.write(json.dumps(record, default=str) + '\n')
+            if self.prometheus:
+                self.write_prometheus(self.prometheus)
+        if self.echo:
+            print(_format(record), flush=True)
+
+    def write_prometheus(self, path):
+        '''
+        Writes the latest record of every stage in Prometheus text format.
+        '''
+        latest = {}
+        for record in self.records:
+            key = tuple(sorted((k, str(v)) for k, v in record.items()
+                               if k not in _VALUE_FIELDS and v is not None))
+            latest[key] = record
+        lines = []
+        for metric, field, scale, help_text in _PROMETHEUS_METRICS:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} gauge')
+            for key, record in latest.items():
+                if record.get(field) is None:
+                    continue
+                labels = ','.join(f'{k}="{_escape(v)}"' for k, v in key)
+                lines.append(f'{metric}{{{labels}}} {record[field] * scale:.6g}')
+        partial = path + '.partial'
+        with open(partial, 'w') as to_write:
+            to_write.write('\n'.join(lines) + '\n')
+        os.replace(partial, path)
+
+    def summary(self):
+        '''
+        Returns the records as a DataFrame, one row per finished stage.
+        '''
+        import pandas as pd
+        return pd.DataFrame(self.records)
+
+
+# Record fields that are measurements rather than labels
+_VALUE_FIELDS = {'wall_s', 'cpu_s', 'peak_rss_mb', 'rows', 'alloc_mb', 'time'}
+
+_PROMETHEUS_METRICS = [
+    ('labtools_stage_wall_seconds', 'wall_s', 1, 'Wall time of the stage'),
+    ('labtools_stage_cpu_seconds', 'cpu_s', 1, 'CPU time of the process during the stage'),
+    ('labtools_stage_peak_rss_bytes', 'peak_rss_mb', 1e6, 'Peak resident memory during the stage'),
+    ('labtools_stage_rows', 'rows', 1, 'Rows processed by the stage'),
+    ('labtools_stage_alloc_bytes', 'alloc_mb', 1e6, 'Bytes allocated by the stage (tracemalloc)'),
+    ]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_seconds(seconds):
+    if seconds >= 60:
+        return f'{int(seconds // 60)}min {seconds % 60:.0f}s'
+    if seconds >= 1:
+        return f'{seconds:.2f} s'
+    return f'{seconds * 1000:.0f} ms'
+
+
+def _format(record):
+    parts = [f"wall {_format_seconds(record['wall_s'])}",
+             f"CPU {_format_seconds(record['cpu_s'])}"]
+    if record['peak_rss_mb'] is not None:
+        parts.append(f"peak RSS {record['peak_rss_mb']:,.0f} MB")
+    if record['rows'] is not None:
+        parts.append(f"{record['rows']:,} rows")
+    failed = ' (failed)' if record['failed'] else ''
+    return f"{record['stage']}{failed}: " + ', '.join(parts)
+
+
+_active = None
+
+
+def enable(jsonl=None, prometheus=None, echo=False, trace_memory=False, labels=None):
+    '''
+    Starts recording `stage()` blocks and returns the active Recorder.
+
+    Args:
+        jsonl:        (string) - JSON lines file to append stage records to
+        prometheus:   (string) - Prometheus text file to keep up to date
+        echo:         (bool)   - Print each stage as it ends
+        trace_memory: (bool)   - Record per-stage allocations with tracemalloc
+        labels:       (dict)   - Fields added to every record
+    Returns:
+        recorder: (Recorder)
+    '''
+    global _active
+    _active = Recorder(jsonl, prometheus, echo, trace_memory, labels)
+    return _active
+
+
+def disable():
+    '''
+    Stops recording. `stage()` blocks become no-ops again.
+    '''
+    global _active
+    _active = None
+
+
+def active():
+    '''
+    Returns the active Recorder, or None when recording is disabled.
+    '''
+    return _active
+
+
+def stage(name, rows=None, **labels):
+    '''
+    Times a block of code, or every call of a decorated function.
+
+    Args:
+        name:    (string) - Stage name, e.g. 'load', 'clean', 'encode', 'fit',
+                            'predict' or 'score'
+        rows:    (int)    - Rows processed. A decorated function whose result
+                            has a length or shape gets its row count from it.
+        labels:  Extra fields for this stage's record, such as model='rf'
+    Returns:
+        A context manager that is also a decorator. It records into
+        whichever Recorder is active when the block starts.
+    '''
+    return _Stage(name, rows, labels)
+
+
+def summary():
+    '''
+    Returns the active recorder's stages as a DataFrame (empty if disabled).
+    '''
+    if _active is None:
+        import pandas as pd
+        return pd.DataFrame()
+    return _active.summary()
+
+
+def _interactive():
+    # A Jupyter kernel or IPython shell, or the plain Python prompt
+    ipython = sys.modules.get('IPython')
+    if ipython is not None and getattr(ipython, 'get_ipython', lambda: None)() is not None:
+        return True
+    return hasattr(sys, 'ps1') or bool(sys.flags.interactive)
+
+
+def enable_from_env(environ=None):
+    '''
+    Enables recording as the LABTOOLS_STAGE_* environment variables ask
+    (see the module docstring). Does nothing when none of them is set,
+    except in an interactive session, where stages are echoed.
+
+    Returns:
+        recorder: (Recorder) - The active recorder, or None
+    '''
+    environ = os.environ if environ is None else environ
+    echo = environ.get('LABTOOLS_STAGE_ECHO')
+    echo = _interactive() if echo is None else echo.lower() not in ('', '0', 'false', 'no')
+    jsonl = environ.get('LABTOOLS_STAGE_LOG') or None
+    prometheus = environ.get('LABTOOLS_STAGE_PROM') or None
+    if echo or jsonl or prometheus:
+        return enable(jsonl=jsonl, prometheus=prometheus, echo=echo)
+    return _active
+
+
+enable_from_env()
@@ -0,0 +1,874 @@
+'''
+The core of each project lab as a `labtools.pipeline.Pipeline`.
+
+Every pipeline reproduces a lab's load, clean, feature, split, fit and
+evaluate cells without plots or printing, so it runs headless and can be
+cached stage by stage:
+
+    python -m labtools.pipeline waze_churn --list
+    python -m labtools.pipeline waze_churn --param data_path=waze_dataset.csv
+
+Data files are parameters ending in `_path`, with the file name the lab
+reads as default (the labs read them from the working directory). Model
+grids are parameters too (`rf_grid`, `xgb_grid`, `tree_grid`) and default
+to the grids the labs search. `cv=None` fits the first candidate of each
+grid once instead of running the grid search, which `labtools.bench` uses
+to time single fits. Otherwise the folds are built once per training split,
+saved in the dataset's `labtools.splits.SplitRegistry`, and every model in a
+lab's comparison is searched over the same `PredefinedSplit`.
+
+`max_bins=255` quantile-bins the split's feature matrices to uint8 once
+(see `labtools.binning`; the TikTok lab's sparse n-gram matrices stay
+sparse), and every model in the lab's comparison then fits on the binned
+matrix, XGBoost through `labtools.binning.xgb_classifier()` so it reads the
+codes losslessly. Only XGBoost keeps the uint8 matrix while fitting;
+scikit-learn's trees copy it to float32.
+
+Stage functions are named after their pipeline (`waze_churn_load`) and
+registered under the stage name (`load`), so no two labs' stages share a
+module-level name.
+
+`PIPELINES` maps lab names to pipelines.
+'''
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import (accuracy_score, f1_score, precision_score, recall_score,
+                             roc_auc_score)
+from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from labtools.binning import QuantileBinner
+from labtools.clustering import kmeans_sweep, stream_segments
+from labtools.color import ColorQuantizer, ImageColors
+from labtools.pipeline import Pipeline
+from labtools.regression import StreamingLinearRegression, residual_scores
+from labtools.splits import SplitRegistry, fold_assignment, index_fingerprint
+from labtools.thresholds import threshold_sweep
+from labtools.tree_tuning import TreePathSearchCV
+from labtools.tiktok import ngram_features
+from labtools.waze import WazeFeatures
+
+
+TAXI_FILE = '2017_Yellow_Taxi_Trip_Data.csv'
+TAXI_TIME_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+CLASSIFICATION_SCORING = ['accuracy', 'precision', 'recall', 'f1']
+
+
+def _xgb_classifier(max_bins=None, **kwargs):
+    # Imported here so pipelines without XGBoost run without it installed
+    if max_bins is not None:
+        # Reads the uint8 codes of bin_split() losslessly, with MISSING as missing
+        from labtools.binning import xgb_classifier
+        return xgb_classifier(**kwargs)
+    from xgboost import XGBClassifier
+    return XGBClassifier(objective='binary:logistic', **kwargs)
+
+
+def _xgb_search(*args, **kwargs):
+    from labtools.xgb_search import XGBSearchCV
+    return XGBSearchCV(*args, **kwargs)
+
+
+def cv_folds(data_path, X_train, y_train, cv):
+    '''
+    Returns the saved cross-validation folds of a training split, building
+    and saving them in the dataset's SplitRegistry on first use.
+
+    The folds are those `GridSearchCV(cv=cv)` builds for a classifier, so
+    searches score the same as with an integer `cv`.
+
+    Args:
+        data_path: (string)     - Dataset the training rows come from
+        X_train:   (pd.DataFrame or pd.Series) - Training rows, with the
+                                  dataset's index
+        y_train:   (pd.Series)  - Training target, used for stratification
+        cv:        (int)        - Number of folds, or None for no folds
+    Returns:
+        split: (PredefinedSplit) - Ready for `cv=`, or None when cv is None
+    '''
+    if cv is None:
+        return None
+    registry = SplitRegistry(data_path)
+    # One assignment per distinct training split, so pipelines run with
+    # other split parameters never load folds built for different rows
+    name = f'cv{cv}_{index_fingerprint(X_train.index)}'
+    registry.get_or_build(name, X_train.index, lambda: fold_assignment(y_train, n_splits=cv))
+    return registry.predefined_split(name, X_train.index)
+
+
+def fit_search(estimator, grid, X, y, cv, scoring, refit, search=GridSearchCV):
+    '''
+    Fits a grid search, or with cv=None the grid's first candidate alone.
+
+    Args:
+        estimator: Unfitted estimator
+        grid:      (dict)  - Hyperparameter grid, as for GridSearchCV
+        X, y:      Training data
+        cv:        (int or splitter) - Folds, such as the PredefinedSplit
+                                       from `cv_folds()`, or None for a
+                                       single fit
+        scoring:   (list)  - Metrics recorded by the search
+        refit:     (str)   - Metric used to pick the best candidate
+        search:    (class) - GridSearchCV, or a drop-in replacement such as
+                             labtools.xgb_search.XGBSearchCV
+    Returns:
+        model: The fitted search, or the fitted estimator
+    '''
+    if cv is None:
+        estimator.set_params(**{name: values[0] for name, values in grid.items()})
+        return estimator.fit(X, y)
+    return search(estimator, grid, scoring=scoring, cv=cv, refit=refit).fit(X, y)
+
+
+def classification_scores(model_name, y_true, y_pred):
+    '''
+    Returns one row of accuracy, precision, recall and F1, like the labs'
+    `get_test_scores()`.
+    '''
+    return pd.DataFrame({'model': [model_name],
+                         'precision': [precision_score(y_true, y_pred, zero_division=0)],
+                         'recall': [recall_score(y_true, y_pred)],
+                         'F1': [f1_score(y_true, y_pred)],
+                         'accuracy': [accuracy_score(y_true, y_pred)],
+                         })
+
+
+def _best(model):
+    return getattr(model, 'best_estimator_', model)
+
+
+def bin_split(split, max_bins):
+    '''
+    Quantile-bins the feature matrices of a split to uint8 codes, with bins
+    learned on the training rows, so every model in a comparison fits on the
+    same binned matrix. max_bins=None returns the split unchanged.
+
+    Args:
+        split:    (tuple or dict) - (X_train, X_test, y_train, y_test), or a
+                                    dict whose 'X_*' entries are matrices
+        max_bins: (int)           - Bins per feature, at most 255
+    Returns:
+        split: The same structure with binned matrices
+    '''
+    if max_bins is None:
+        return split
+    if isinstance(split, dict):
+        binner = QuantileBinner(max_bins=max_bins).fit(split['X_train'])
+        return {name: binner.transform(value) if name.startswith('X_') else value
+                for name, value in split.items()}
+    X_train, X_test, y_train, y_test = split
+    binner = QuantileBinner(max_bins=max_bins).fit(X_train)
+    return binner.transform(X_train), binner.transform(X_test), y_train, y_test
+
+
+# ---------------------------------------------------------------------------
+# Taxi report (Scenario projects/Automatidata project scenario/Build_dataframe.py)
+# ---------------------------------------------------------------------------
+
+taxi_report = Pipeline('taxi_report', params={'data_path': TAXI_FILE})
+
+
+@taxi_report.stage(name='load')
+def taxi_report_load(data_path):
+    return pd.read_csv(data_path)
+
+
+@taxi_report.stage(name='evaluate')
+def taxi_report_evaluate(load):
+    df = load
+    credit_card = df[df['payment_type']==1]
+    return {
+        'longest_trips': df.sort_values(by=['trip_distance'], ascending=False).head(10),
+        'top_total_amounts': df.sort_values(['total_amount'], ascending=False)['total_amount'].head(20),
+        'payment_type_counts': df['payment_type'].value_counts(),
+        'avg_cc_tip': df[df['payment_type']==1]['tip_amount'].mean(),
+        'avg_cash_tip': df[df['payment_type']==2]['tip_amount'].mean(),
+        'vendor_counts': df['VendorID'].value_counts(),
+        'vendor_mean_total': df.groupby(['VendorID']).mean(numeric_only=True)[['total_amount']],
+        'cc_passenger_counts': credit_card['passenger_count'].value_counts(),
+        'cc_tip_by_passengers': credit_card.groupby(['passenger_count']).mean(numeric_only=True)[['tip_amount']],
+        }
+
+
+# ---------------------------------------------------------------------------
+# Fare regression (regression'/Course 5 Automatidata project lab.py)
+# ---------------------------------------------------------------------------
+
+fare_regression = Pipeline('fare_regression', params={
+    'data_path': TAXI_FILE,
+    'iqr_factor': 6,
+    'test_size': 0.2,
+    'random_state': 0,
+    'chunksize': 100_000,
+    })
+
+
+def _rush_hourizer(hour):
+    if 6 <= hour['rush_hour'] < 10:
+        val = 1
+    elif 16 <= hour['rush_hour'] < 20:
+        val = 1
+    else:
+        val = 0
+    return val
+
+
+def _outlier_imputer(df, column_list, iqr_factor):
+    for col in column_list:
+        df.loc[df[col] < 0, col] = 0
+        q1 = df[col].quantile(0.25)
+        q3 = df[col].quantile(0.75)
+        upper_threshold = q3 + (iqr_factor * (q3 - q1))
+        df.loc[df[col] > upper_threshold, col] = upper_threshold
+
+
+@fare_regression.stage(name='load')
+def fare_regression_load(data_path):
+    return pd.read_csv(data_path)
+
+
+@fare_regression.stage(name='clean')
+def fare_regression_clean(load, iqr_factor):
+    df = load.copy()
+    df['tpep_pickup_datetime'] = pd.to_datetime(df['tpep_pickup_datetime'], format=TAXI_TIME_FORMAT)
+    df['tpep_dropoff_datetime'] = pd.to_datetime(df['tpep_dropoff_datetime'], format=TAXI_TIME_FORMAT)
+    df['duration'] = (df['tpep_dropoff_datetime'] - df['tpep_pickup_datetime'])/np.timedelta64(1,'m')
+    _outlier_imputer(df, ['fare_amount'], iqr_factor)
+    _outlier_imputer(df, ['duration'], iqr_factor)
+    return df
+
+
+@fare_regression.stage(name='features')
+def fare_regression_features(clean):
+    df = clean.copy()
+    df['pickup_dropoff'] = df['PULocationID'].astype(str) + ' ' + df['DOLocationID'].astype(str)
+    grouped = df.groupby('pickup_dropoff').mean(numeric_only=True)[['trip_distance']]
+    df['mean_distance'] = df['pickup_dropoff'].map(grouped.to_dict()['trip_distance'])
+    grouped = df.groupby('pickup_dropoff').mean(numeric_only=True)[['duration']]
+    df['mean_duration'] = df['pickup_dropoff'].map(grouped.to_dict()['duration'])
+    df['day'] = df['tpep_pickup_datetime'].dt.day_name().str.lower()
+    df['month'] = df['tpep_pickup_datetime'].dt.strftime('%b').str.lower()
+    df['rush_hour'] = df['tpep_pickup_datetime'].dt.hour.astype(int)
+    df.loc[df['day'].isin(['saturday', 'sunday']), 'rush_hour'] = 0
+    weekday = (df.day != 'saturday') & (df.day != 'sunday')
+    df.loc[weekday, 'rush_hour'] = df.apply(_rush_hourizer, axis=1)
+    return df
+
+
+@fare_regression.stage(name='encode')
+def fare_regression_encode(features):
+    df2 = features[['VendorID', 'passenger_count', 'fare_amount', 'mean_distance',
+                    'mean_duration', 'rush_hour']].copy()
+    X = df2.drop(columns=['fare_amount'])
+    y = df2[['fare_amount']]
+    X['VendorID'] = X['VendorID'].astype(str)
+    X = pd.get_dummies(X, drop_first=True)
+    return X, y
+
+
+@fare_regression.stage(name='split')
+def fare_regression_split(encode, test_size, random_state):
+    X, y = encode
+    return train_test_split(X, y, test_size=test_size, random_state=random_state)
+
+
+@fare_regression.stage(name='fit')
+def fare_regression_fit(split, chunksize):
+    # Same coefficients as StandardScaler + LinearRegression on the whole
+    # training frame, accumulated chunksize rows at a time
+    # (labtools.regression)
+    X_train, _, y_train, _ = split
+    return StreamingLinearRegression().fit(X_train, y_train, chunk_size=chunksize)
+
+
+@fare_regression.stage(name='evaluate')
+def fare_regression_evaluate(split, fit, chunksize):
+    _, X_test, _, y_test = split
+    chunks = ((X_test.iloc[start:start + chunksize], y_test.iloc[start:start + chunksize])
+              for start in range(0, len(X_test), chunksize))
+    scores = residual_scores(fit, chunks)
+    return pd.DataFrame({name: [score] for name, score in scores.items()})
+
+
+# ---------------------------------------------------------------------------
+# Tip classifier (nuts and bolts machine learning/project tasks/Course 6 Automatidata project lab.py)
+# ---------------------------------------------------------------------------
+
+tip_classifier = Pipeline('tip_classifier', params={
+    'data_path': TAXI_FILE,
+    'means_path': 'nyc_preds_means.csv',
+    'generous_threshold': 0.2,
+    'test_size': 0.2,
+    'random_state': 42,
+    'max_bins': None,
+    'cv': 4,
+    'refit': 'f1',
+    'rf_grid': {'max_depth': [None], 'max_features': [1.0], 'max_samples': [0.7],
+                'min_samples_leaf': [1], 'min_samples_split': [2], 'n_estimators': [300]},
+    'xgb_grid': {'learning_rate': [0.1], 'max_depth': [8], 'min_child_weight': [2],
+                 'n_estimators': [500]},
+    })
+
+
+def _hour_flag(start, stop):
+    def flag(hour):
+        hour = hour['hour']
+        if start < stop:
+            return 1 if start <= hour < stop else 0
+        return 1 if (hour >= start) or (hour < stop) else 0
+    return flag
+
+
+@tip_classifier.stage(name='load')
+def tip_classifier_load(data_path, means_path):
+    df0 = pd.read_csv(data_path)
+    nyc_preds_means = pd.read_csv(means_path)
+    return df0.merge(nyc_preds_means, left_index=True, right_index=True)
+
+
+@tip_classifier.stage(name='clean')
+def tip_classifier_clean(load, generous_threshold):
+    df1 = load[load['payment_type']==1].copy()
+    df1['tip_percent'] = round(df1['tip_amount'] / (df1['total_amount'] - df1['tip_amount']), 3)
+    df1['generous'] = (df1['tip_percent'] >= generous_threshold).astype(int)
+    return df1
+
+
+@tip_classifier.stage(name='features')
+def tip_classifier_features(clean):
+    df1 = clean.copy()
+    df1['tpep_pickup_datetime'] = pd.to_datetime(df1['tpep_pickup_datetime'], format=TAXI_TIME_FORMAT)
+    df1['tpep_dropoff_datetime'] = pd.to_datetime(df1['tpep_dropoff_datetime'], format=TAXI_TIME_FORMAT)
+    df1['day'] = df1['tpep_pickup_datetime'].dt.day_name().str.lower()
+    df1['hour'] = df1['tpep_pickup_datetime'].dt.hour
+    # The lab applies one row-wise function per time-of-day flag
+    for name, start, stop in [('am_rush', 6, 10), ('daytime', 10, 16),
+                              ('pm_rush', 16, 20), ('nighttime', 20, 6)]:
+        df1[name] = df1.apply(_hour_flag(start, stop), axis=1)
+    df1['month'] = df1['tpep_pickup_datetime'].dt.strftime('%b').str.lower()
+    return df1
+
+
+@tip_classifier.stage(name='encode')
+def tip_classifier_encode(features):
+    drop_cols = ['Unnamed: 0', 'tpep_pickup_datetime', 'tpep_dropoff_datetime',
+                 'payment_type', 'trip_distance', 'store_and_fwd_flag', 'fare_amount',
+                 'extra', 'mta_tax', 'tip_amount', 'tolls_amount', 'improvement_surcharge',
+                 'total_amount', 'tip_percent', 'hour']
+    df1 = features.drop(drop_cols, axis=1)
+    for col in ['RatecodeID', 'PULocationID', 'DOLocationID', 'VendorID']:
+        df1[col] = df1[col].astype('str')
+    return pd.get_dummies(df1, drop_first=True)
+
+
+@tip_classifier.stage(name='split')
+def tip_classifier_split(encode, test_size, random_state):
+    y = encode['generous']
+    X = encode.drop('generous', axis=1)
+    return train_test_split(X, y, stratify=y, test_size=test_size, random_state=random_state)
+
+
+@tip_classifier.stage(name='folds')
+def tip_classifier_folds(split, data_path, cv):
+    X_train, _, y_train, _ = split
+    return cv_folds(data_path, X_train, y_train, cv)
+
+
+@tip_classifier.stage(name='binned')
+def tip_classifier_binned(split, max_bins):
+    return bin_split(split, max_bins)
+
+
+@tip_classifier.stage(name='fit_rf')
+def tip_classifier_fit_rf(binned, folds, rf_grid, refit):
+    X_train, _, y_train, _ = binned
+    return fit_search(RandomForestClassifier(random_state=42), rf_grid, X_train, y_train,
+                      folds, CLASSIFICATION_SCORING, refit)
+
+
+@tip_classifier.stage(name='fit_xgb')
+def tip_classifier_fit_xgb(binned, folds, xgb_grid, refit, max_bins):
+    X_train, _, y_train, _ = binned
+    return fit_search(_xgb_classifier(max_bins, random_state=0), xgb_grid, X_train, y_train,
+                      folds, CLASSIFICATION_SCORING, refit, _xgb_search)
+
+
+@tip_classifier.stage(name='evaluate')
+def tip_classifier_evaluate(binned, fit_rf, fit_xgb):
+    _, X_test, _, y_test = binned
+    return pd.concat([classification_scores('RF test', y_test, _best(fit_rf).predict(X_test)),
+                      classification_scores('XGB test', y_test, _best(fit_xgb).predict(X_test))],
+                     axis=0)
+
+
+# ---------------------------------------------------------------------------
+# Waze churn (nuts and bolts machine learning/project tasks/Course 6 Waze project lab.py)
+# ---------------------------------------------------------------------------
+
+waze_churn = Pipeline('waze_churn', params={
+    'data_path': 'waze_dataset.csv',
+    'test_size': 0.2,
+    'val_size': 0.25,
+    'random_state': 42,
+    'max_bins': None,
+    'cv': 4,
+    'refit': 'recall',
+    'rf_grid': {'max_depth': [None], 'max_features': [1.0], 'max_samples': [1.0],
+                'min_samples_leaf': [2], 'min_samples_split': [2], 'n_estimators': [300]},
+    'xgb_grid': {'max_depth': [6, 12], 'min_child_weight': [3, 5],
+                 'learning_rate': [0.01, 0.1], 'n_estimators': [300]},
+    })
+
+
+@waze_churn.stage(name='load')
+def waze_churn_load(data_path):
+    return pd.read_csv(data_path)
+
+
+@waze_churn.stage(name='clean')
+def waze_churn_clean(load):
+    df = load.dropna(subset=['label'])
+    df['label2'] = np.where(df['label']=='churned', 1, 0)
+    return df.drop(['ID'], axis=1)
+
+
+@waze_churn.stage(name='features')
+def waze_churn_features(clean):
+    return WazeFeatures().fit(clean).transform(clean), clean['label2']
+
+
+@waze_churn.stage(name='split')
+def waze_churn_split(features, test_size, val_size, random_state):
+    X, y = features
+    X_tr, X_test, y_tr, y_test = train_test_split(X, y, stratify=y, test_size=test_size,
+                                                  random_state=random_state)
+    X_train, X_val, y_train, y_val = train_test_split(X_tr, y_tr, stratify=y_tr,
+                                                      test_size=val_size,
+                                                      random_state=random_state)
+    return {'X_train': X_train, 'X_val': X_val, 'X_test': X_test,
+            'y_train': y_train, 'y_val': y_val, 'y_test': y_test}
+
+
+@waze_churn.stage(name='folds')
+def waze_churn_folds(split, data_path, cv):
+    return cv_folds(data_path, split['X_train'], split['y_train'], cv)
+
+
+@waze_churn.stage(name='binned')
+def waze_churn_binned(split, max_bins):
+    return bin_split(split, max_bins)
+
+
+@waze_churn.stage(name='fit_rf')
+def waze_churn_fit_rf(binned, folds, rf_grid, refit):
+    return fit_search(RandomForestClassifier(random_state=42), rf_grid,
+                      binned['X_train'], binned['y_train'], folds, CLASSIFICATION_SCORING, refit)
+
+
+@waze_churn.stage(name='fit_xgb')
+def waze_churn_fit_xgb(binned, folds, xgb_grid, refit, max_bins):
+    return fit_search(_xgb_classifier(max_bins, random_state=42), xgb_grid,
+                      binned['X_train'], binned['y_train'], folds, CLASSIFICATION_SCORING, refit,
+                      _xgb_search)
+
+
+@waze_churn.stage(name='evaluate')
+def waze_churn_evaluate(binned, fit_rf, fit_xgb):
+    scores = pd.concat([
+        classification_scores('RF val', binned['y_val'], _best(fit_rf).predict(binned['X_val'])),
+        classification_scores('XGB val', binned['y_val'], _best(fit_xgb).predict(binned['X_val'])),
+        classification_scores('XGB test', binned['y_test'], _best(fit_xgb).predict(binned['X_test'])),
+        ], axis=0)
+    sweep = threshold_sweep(binned['y_test'], _best(fit_xgb).predict_proba(binned['X_test']))
+    return {'scores': scores, 'threshold_sweep': sweep}
+
+
+# ---------------------------------------------------------------------------
+# TikTok claims (nuts and bolts machine learning/project tasks/Course 6 TikTok project lab.py)
+# ---------------------------------------------------------------------------
+
+tiktok_claims = Pipeline('tiktok_claims', params={
+    'data_path': 'tiktok_dataset.csv',
+    'test_size': 0.2,
+    'val_size': 0.25,
+    'random_state': 0,
+    'ngram_range': (2, 3),
+    'max_features': 15,
+    'hash_features': None,
+    'max_bins': None,
+    'cv': 5,
+    'refit': 'recall',
+    'rf_grid': {'max_depth': [5, 7, None], 'max_features': [0.3, 0.6], 'max_samples': [0.7],
+                'min_samples_leaf': [1, 2], 'min_samples_split': [2, 3],
+                'n_estimators': [75, 100, 200]},
+    'xgb_grid': {'max_depth': [4, 8, 12], 'min_child_weight': [3, 5],
+                 'learning_rate': [0.01, 0.1], 'n_estimators': [300, 500]},
+    })
+
+
+@tiktok_claims.stage(name='load')
+def tiktok_claims_load(data_path):
+    return pd.read_csv(data_path)
+
+
+@tiktok_claims.stage(name='clean')
+def tiktok_claims_clean(load):
+    data = load.dropna(axis=0)
+    data['text_length'] = data['video_transcription_text'].str.len()
+    return data
+
+
+@tiktok_claims.stage(name='encode')
+def tiktok_claims_encode(clean):
+    X = clean.drop(['#', 'video_id'], axis=1)
+    X['claim_status'] = (X['claim_status'] == 'claim').astype(int)
+    X = pd.get_dummies(X, columns=['verified_status', 'author_ban_status'], drop_first=True)
+    return X.drop(['claim_status'], axis=1), X['claim_status']
+
+
+@tiktok_claims.stage(name='split')
+def tiktok_claims_split(encode, test_size, val_size, random_state):
+    X, y = encode
+    X_tr, X_test, y_tr, y_test = train_test_split(X, y, test_size=test_size,
+                                                  random_state=random_state)
+    X_train, X_val, y_train, y_val = train_test_split(X_tr, y_tr, test_size=val_size,
+                                                      random_state=random_state)
+    return {'X_train': X_train, 'X_val': X_val, 'X_test': X_test,
+            'y_train': y_train, 'y_val': y_val, 'y_test': y_test}
+
+
+@tiktok_claims.stage(name='folds')
+def tiktok_claims_folds(split, data_path, cv):
+    return cv_folds(data_path, split['X_train'], split['y_train'], cv)
+
+
+@tiktok_claims.stage(name='features')
+def tiktok_claims_features(split, ngram_range, max_features, hash_features):
+    ngrams = ngram_features(max_features=max_features, ngram_range=ngram_range,
+                            hash_features=hash_features)
+    return {'X_train': ngrams.fit_transform(split['X_train']),
+            'X_val': ngrams.transform(split['X_val']),
+            'X_test': ngrams.transform(split['X_test']),
+            'y_train': split['y_train'], 'y_val': split['y_val'], 'y_test': split['y_test'],
+            'feature_names': ngrams.get_feature_names_out()}
+
+
+@tiktok_claims.stage(name='binned')
+def tiktok_claims_binned(features, max_bins):
+    return bin_split(features, max_bins)
+
+
+@tiktok_claims.stage(name='fit_rf')
+def tiktok_claims_fit_rf(binned, folds, rf_grid, refit):
+    return fit_search(RandomForestClassifier(random_state=0), rf_grid,
+                      binned['X_train'], binned['y_train'], folds, CLASSIFICATION_SCORING, refit)
+
+
+@tiktok_claims.stage(name='fit_xgb')
+def tiktok_claims_fit_xgb(binned, folds, xgb_grid, refit, max_bins):
+    return fit_search(_xgb_classifier(max_bins, random_state=0), xgb_grid,
+                      binned['X_train'], binned['y_train'], folds, CLASSIFICATION_SCORING, refit,
+                      _xgb_search)
+
+
+@tiktok_claims.stage(name='evaluate')
+def tiktok_claims_evaluate(binned, fit_rf, fit_xgb):
+    return pd.concat([
+        classification_scores('RF val', binned['y_val'], _best(fit_rf).predict(binned['X_val'])),
+        classification_scores('XGB val', binned['y_val'], _best(fit_xgb).predict(binned['X_val'])),
+        classification_scores('RF test', binned['y_test'], _best(fit_rf).predict(binned['X_test'])),
+        ], axis=0)
+
+
+# ---------------------------------------------------------------------------
+# Salifort attrition (Capstone/Activity_ Course 7 Salifort Motors project lab.py)
+# ---------------------------------------------------------------------------
+
+salifort_attrition = Pipeline('salifort_attrition', params={
+    'data_path': 'HR_capstone_dataset.csv',
+    'overworked_hours': 175,
+    'test_size': 0.25,
+    'random_state': 0,
+    'max_bins': None,
+    'cv': 4,
+    'refit': 'roc_auc',
+    'tree_grid': {'max_depth': [4, 6, 8, None], 'min_samples_leaf': [2, 5, 1],
+                  'min_samples_split': [2, 4, 6]},
+    'rf_grid': {'max_depth': [3, 5, None], 'max_features': [1.0], 'max_samples': [0.7, 1.0],
+                'min_samples_leaf': [1, 2, 3], 'min_samples_split': [2, 3, 4],
+                'n_estimators': [300, 500]},
+    })
+
+
+@salifort_attrition.stage(name='load')
+def salifort_attrition_load(data_path):
+    return pd.read_csv(data_path)
+
+
+@salifort_attrition.stage(name='clean')
+def salifort_attrition_clean(load):
+    df0 = load.rename(columns={'Work_accident': 'work_accident',
+                               'average_montly_hours': 'average_monthly_hours',
+                               'time_spend_company': 'tenure',
+                               'Department': 'department'})
+    return df0.drop_duplicates(keep='first')
+
+
+@salifort_attrition.stage(name='encode')
+def salifort_attrition_encode(clean, overworked_hours):
+    df_enc = clean.copy()
+    df_enc['salary'] = (df_enc['salary'].astype('category')
+                        .cat.set_categories(['low', 'medium', 'high']).cat.codes)
+    df_enc = pd.get_dummies(df_enc, drop_first=False)
+    df2 = df_enc.drop('satisfaction_level', axis=1)
+    df2['overworked'] = (df2['average_monthly_hours'] > overworked_hours).astype(int)
+    return df2.drop('average_monthly_hours', axis=1)
+
+
+@salifort_attrition.stage(name='split')
+def salifort_attrition_split(encode, test_size, random_state):
+    y = encode['left']
+    X = encode.drop('left', axis=1)
+    return train_test_split(X, y, test_size=test_size, stratify=y, random_state=random_state)
+
+
+@salifort_attrition.stage(name='folds')
+def salifort_attrition_folds(split, data_path, cv):
+    X_train, _, y_train, _ = split
+    return cv_folds(data_path, X_train, y_train, cv)
+
+
+@salifort_attrition.stage(name='binned')
+def salifort_attrition_binned(split, max_bins):
+    return bin_split(split, max_bins)
+
+
+@salifort_attrition.stage(name='fit_tree')
+def salifort_attrition_fit_tree(binned, folds, tree_grid, refit):
+    X_train, _, y_train, _ = binned
+    # Picks the same tree as GridSearchCV, screening max_depth from one tree per fold
+    return fit_search(DecisionTreeClassifier(random_state=0), tree_grid, X_train, y_train,
+                      folds, CLASSIFICATION_SCORING + ['roc_auc'], refit, TreePathSearchCV)
+
+
+@salifort_attrition.stage(name='fit_rf')
+def salifort_attrition_fit_rf(binned, folds, rf_grid, refit):
+    X_train, _, y_train, _ = binned
+    return fit_search(RandomForestClassifier(random_state=0), rf_grid, X_train, y_train,
+                      folds, CLASSIFICATION_SCORING + ['roc_auc'], refit)
+
+
+@salifort_attrition.stage(name='evaluate')
+def salifort_attrition_evaluate(binned, fit_tree, fit_rf):
+    _, X_test, _, y_test = binned
+    rows = []
+    for name, model in [('decision tree2 test', fit_tree), ('random forest2 test', fit_rf)]:
+        scores = classification_scores(name, y_test, _best(model).predict(X_test))
+        scores['AUC'] = roc_auc_score(y_test, _best(model).predict_proba(X_test)[:, 1])
+        rows.append(scores)
+    return pd.concat(rows, axis=0)
+
+
+# ---------------------------------------------------------------------------
+# K-means on penguins (nuts and bolts machine learning/Build a K-means model.py)
+# ---------------------------------------------------------------------------
+
+kmeans_penguins = Pipeline('kmeans_penguins', params={
+    'data_path': 'penguins.csv',
+    'num_clusters': list(range(2, 11)),
+    'n_clusters': 6,
+    'random_state': 42,
+    })
+
+
+@kmeans_penguins.stage(name='load')
+def kmeans_penguins_load(data_path):
+    return pd.read_csv(data_path)
+
+
+@kmeans_penguins.stage(name='clean')
+def kmeans_penguins_clean(load):
+    penguins_subset = load.dropna(axis=0).reset_index(drop=True)
+    penguins_subset['sex'] = penguins_subset['sex'].str.upper()
+    penguins_subset = pd.get_dummies(penguins_subset, drop_first=True, columns=['sex'])
+    return penguins_subset.drop(['island'], axis=1)
+
+
+@kmeans_penguins.stage(name='encode')
+def kmeans_penguins_encode(clean):
+    return StandardScaler().fit_transform(clean.drop(['species'], axis=1))
+
+
+@kmeans_penguins.stage(name='fit')
+def kmeans_penguins_fit(encode, num_clusters, n_clusters, random_state):
+    # The final model is one of the sweep's, so it is not fitted again
+    return kmeans_sweep(encode, sorted(set(num_clusters) | {n_clusters}),
+                        random_state=random_state, scores=True)
+
+
+@kmeans_penguins.stage(name='evaluate')
+def kmeans_penguins_evaluate(clean, fit, num_clusters, n_clusters):
+    sweep = fit.scores.set_index('k').loc[num_clusters].reset_index()
+    penguins_subset = clean.copy()
+    penguins_subset['cluster'] = fit.labels(n_clusters)
+    return {'sweep': sweep,
+            'clusters_by_species': penguins_subset.groupby(by=['cluster', 'species']).size()}
+
+
+# The same segmentation streamed over a table too large to load
+# (labtools.clustering.stream_segments)
+penguin_segments = Pipeline('penguin_segments', params={
+    'data_path': 'penguins.csv',
+    'out_path': None,
+    'n_clusters': 6,
+    'chunksize': 100_000,
+    'max_epochs': 10,
+    'random_state': 42,
+    })
+
+PENGUIN_FEATURES = ['bill_length_mm', 'bill_depth_mm', 'flipper_length_mm', 'body_mass_g']
+
+
+def penguin_features(chunk):
+    '''
+    The lab's clustering features for one chunk of penguins.csv: rows with
+    missing values dropped, `sex` encoded as the lab's `sex_MALE` dummy.
+    The dummy is built directly rather than with `pd.get_dummies()`, which
+    would drop a different column from a chunk that lacks one of the sexes.
+    '''
+    chunk = chunk.dropna(axis=0)
+    features = chunk[PENGUIN_FEATURES].astype(np.float64)
+    features['sex_MALE'] = (chunk['sex'].str.upper() == 'MALE').astype(np.float64)
+    return features
+
+
+@penguin_segments.stage(name='fit')
+def penguin_segments_fit(data_path, out_path, n_clusters, chunksize, max_epochs, random_state):
+    return stream_segments(lambda: pd.read_csv(data_path, chunksize=chunksize),
+                           penguin_features, n_clusters, out_path=out_path,
+                           group_by=['species'], max_epochs=max_epochs,
+                           random_state=random_state)
+
+
+@penguin_segments.stage(name='evaluate')
+def penguin_segments_evaluate(fit):
+    return {'history': fit['history'],
+            'cluster_means': fit['cluster_means'],
+            'clusters_by_species': fit['summary']}
+
+
+# ---------------------------------------------------------------------------
+# Colour compression (nuts and bolts machine learning/Annotated follow-along
+# guide_ Use K-means for color compression with Python.py)
+# ---------------------------------------------------------------------------
+
+color_compression = Pipeline('color_compression', params={
+    'image_path': 'using_kmeans_for_color_compression_tulips_photo.jpg',
+    'n_clusters': 3,
+    'random_state': 42,
+    })
+
+
+@color_compression.stage(name='load')
+def color_compression_load(image_path):
+    if image_path.endswith('.npy'):
+        return np.load(image_path)
+    import matplotlib.pyplot as plt
+    return plt.imread(image_path)
+
+
+@color_compression.stage(name='encode')
+def color_compression_encode(load):
+    return ImageColors(load)
+
+
+@color_compression.stage(name='fit')
+def color_compression_fit(encode, n_clusters, random_state):
+    return ColorQuantizer(n_colors=n_clusters, random_state=random_state).fit(encode)
+
+
+@color_compression.stage(name='evaluate')
+def color_compression_evaluate(encode, fit):
+    return fit.quantize(encode)
+
+
+# ---------------------------------------------------------------------------
+# Statistics labs
+# ---------------------------------------------------------------------------
+
+taxi_ttest = Pipeline('taxi_ttest', params={'data_path': TAXI_FILE})
+
+
+@taxi_ttest.stage(name='load')
+def taxi_ttest_load(data_path):
+    return pd.read_csv(data_path, index_col=0)
+
+
+@taxi_ttest.stage(name='evaluate')
+def taxi_ttest_evaluate(load):
+    taxi_data = load
+    credit_card = taxi_data[taxi_data['payment_type'] == 1]['fare_amount']
+    cash = taxi_data[taxi_data['payment_type'] == 2]['fare_amount']
+    return {'describe': taxi_data.describe(include='all'),
+            'mean_fare_by_payment': taxi_data.groupby('payment_type')['fare_amount'].mean(),
+            'ttest': stats.ttest_ind(a=credit_card, b=cash, equal_var=False)}
+
+
+tiktok_ttest = Pipeline('tiktok_ttest', params={'data_path': 'tiktok_dataset.csv'})
+
+
+@tiktok_ttest.stage(name='load')
+def tiktok_ttest_load(data_path):
+    return pd.read_csv(data_path)
+
+
+@tiktok_ttest.stage(name='clean')
+def tiktok_ttest_clean(load):
+    return load.dropna(axis=0)
+
+
+@tiktok_ttest.stage(name='evaluate')
+def tiktok_ttest_evaluate(clean):
+    data = clean
+    not_verified = data[data['verified_status'] == 'not verified']['video_view_count']
+    verified = data[data['verified_status'] == 'verified']['video_view_count']
+    return {'mean_views': data.groupby('verified_status')['video_view_count'].mean(),
+            'ttest': stats.ttest_ind(a=not_verified, b=verified, equal_var=False)}
+
+
+aqi_confidence_interval = Pipeline('aqi_confidence_interval', params={
+    'data_path': 'c4_epa_air_quality.csv',
+    'state': 'California',
+    'confidence_level': 0.95,
+    })
+
+
+@aqi_confidence_interval.stage(name='load')
+def aqi_confidence_interval_load(data_path):
+    return pd.read_csv(data_path)
+
+
+@aqi_confidence_interval.stage(name='evaluate')
+def aqi_confidence_interval_evaluate(load, state, confidence_level):
+    aqi = load
+    rre_states = ['California', 'Florida', 'Michigan', 'Ohio', 'Pennsylvania', 'Texas']
+    aqi_rre = aqi[aqi['state_name'].isin(rre_states)]
+    aqi_state = aqi[aqi['state_name']==state]
+    sample_mean = aqi_state['aqi'].mean()
+    standard_error = aqi_state['aqi'].std() / np.sqrt(aqi_state.shape[0])
+    return {'describe': aqi.describe(include='all'),
+            'rre_means': aqi_rre.groupby(['state_name']).agg({'aqi': 'mean', 'state_name': 'count'}),
+            'interval': stats.norm.interval(confidence_level, loc=sample_mean,
+                                            scale=standard_error)}
+
+
+PIPELINES = {pipeline.name: pipeline for pipeline in [
+    taxi_report, fare_regression, tip_classifier, waze_churn, tiktok_claims,
+    salifort_attrition, kmeans_penguins, penguin_segments, color_compression, taxi_ttest,
+    tiktok_ttest, aqi_confidence_interval,
+    ]}
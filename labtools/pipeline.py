@@ -0,0 +1,365 @@
+'''
+Headless, cached pipeline runner for the labs.
+
+A lab is described as a `Pipeline` of named stages, each an ordinary
+function. A stage's arguments say what it needs. An argument named after an
+earlier stage receives that stage's output. Any other argument is a
+parameter, with its default declared on the pipeline:
+
+    waze = Pipeline('waze_churn', params={'data_path': 'waze_dataset.csv',
+                                          'test_size': 0.2})
+
+    @waze.stage()
+    def load(data_path):
+        return pd.read_csv(data_path)
+
+    @waze.stage()
+    def split(load, test_size):
+        ...
+
+    run(waze, {'data_path': 'data/waze_x10.csv'})
+
+Every stage output is cached on disk under a key that hashes:
+    - the stage's source code (plus an optional `version` to bump by hand)
+    - the source of every module in `labtools`, and in the package that
+      defines the stage
+    - the values of the parameters it takes; for parameters whose name ends
+      in `_path`, the content of the file they name
+    - the keys of the stages it depends on
+
+So a change to one parameter re-runs only the stages downstream of the
+first stage that uses it. Changing a model grid re-runs the fit and
+evaluate stages and loads everything before them from the cache. Keys are
+computed before anything runs, so a cached stage whose output nothing
+needs is never even loaded.
+
+So editing a `labtools` helper a stage calls (say, `labtools.binning`)
+invalidates the cache too, at the price of re-running every stage after any
+edit to the package. Code outside these packages, such as an installed
+library, is not hashed: pass `version=` to the stage decorator (or `force=`
+the stage) to invalidate it by hand.
+
+From the command line:
+
+    python -m labtools.pipeline waze_churn --param data_path=waze_dataset.csv
+    python -m labtools.pipeline waze_churn --param "xgb_grid={'max_depth': [6]}"
+
+Each stage runs inside a `labtools.instrument` stage, so enabling
+instrumentation records how long every stage took and whether it was
+cached.
+'''
+
+import argparse
+import ast
+import functools
+import glob
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import textwrap
+
+from labtools import instrument
+
+
+DEFAULT_CACHE_DIR = '.lab_cache'
+
+
+class _StageDef:
+    def __init__(self, name, func, deps, params, code_hash):
+        self.name = name
+        self.func = func
+        self.deps = deps
+        self.params = params
+        self.code_hash = code_hash
+
+
+@functools.lru_cache(maxsize=None)
+def _package_digest(module_name):
+    # Hashes the source of every module in the top-level package of
+    # `module_name`, or the module's own file when it is not in a package
+    module = sys.modules.get(module_name.partition('.')[0])
+    if module is None:
+        return ''
+    if hasattr(module, '__path__'):
+        roots = list(module.__path__)
+    else:
+        roots = [os.path.dirname(module.__file__)] if getattr(module, '__file__', None) else []
+    digest = hashlib.sha1()
+    for root in roots:
+        if hasattr(module, '__path__'):
+            files = sorted(glob.glob(os.path.join(root, '**', '*.py'), recursive=True))
+        else:
+            files = [module.__file__]
+        for path in files:
+            if not os.path.isfile(path):
+                continue
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _code_hash(func, version):
+    try:
+        code = textwrap.dedent(inspect.getsource(func))
+    except (OSError, TypeError):
+        code = repr(func.__code__.co_code) + repr(func.__code__.co_consts)
+    sources = _package_digest(__package__) + _package_digest(func.__module__)
+    return hashlib.sha1(f'{version}\n{sources}\n{code}'.encode()).hexdigest()
+
+
+class Pipeline:
+    '''
+    A named DAG of stages with default parameters.
+
+    Args:
+        name:   (string) - Pipeline name, also its folder in the cache
+        params: (dict)   - Every parameter a stage may take, with its default
+    '''
+
+    def __init__(self, name, params=None):
+        self.name = name
+        self.params = dict(params or {})
+        self.stages = {}
+
+    def stage(self, name=None, version=0):
+        '''
+        Registers a function as the next stage. Stages must be registered
+        after the stages they depend on.
+
+        Args:
+            name:    (string) - Stage name (default: the function's name)
+            version: (int)    - Bump to invalidate cached outputs by hand
+        '''
+        def register(func):
+            stage_name = name or func.__name__
+            arguments = list(inspect.signature(func).parameters)
+            deps = [a for a in arguments if a in self.stages]
+            params = [a for a in arguments if a not in self.stages]
+            unknown = [p for p in params if p not in self.params]
+            if unknown:
+                raise ValueError(f'Stage {stage_name!r} takes {unknown}, which are neither '
+                                 f'earlier stages nor parameters of {self.name!r}')
+            self.stages[stage_name] = _StageDef(stage_name, func, deps, params,
+                                                _code_hash(func, version))
+            return func
+        return register
+
+    def sinks(self):
+        '''
+        Returns the stages no other stage depends on.
+        '''
+        used = {dep for stage in self.stages.values() for dep in stage.deps}
+        return [name for name in self.stages if name not in used]
+
+    def upstream(self, targets):
+        '''
+        Returns `targets` and every stage they depend on, in run order.
+        '''
+        needed = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise KeyError(f'{self.name!r} has no stage {name!r}')
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].deps)
+        return [name for name in self.stages if name in needed]
+
+
+# (path, size, mtime) -> content hash, so each input file is read once
+_file_hashes = {}
+
+
+def _file_hash(path):
+    stat = os.stat(path)
+    memo = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo not in _file_hashes:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as to_read:
+            for block in iter(lambda: to_read.read(1 << 20), b''):
+                digest.update(block)
+        _file_hashes[memo] = digest.hexdigest()
+    return _file_hashes[memo]
+
+
+def _fingerprint(name, value):
+    if name.endswith('_path') and isinstance(value, str) and os.path.isfile(value):
+        return 'file:' + _file_hash(value)
+    return json.dumps(value, sort_keys=True, default=repr)
+
+
+def stage_keys(pipeline, params=None):
+    '''
+    Returns the cache key of every stage for the given parameters.
+    '''
+    values = dict(pipeline.params, **(params or {}))
+    keys = {}
+    for name, stage in pipeline.stages.items():
+        digest = hashlib.sha1()
+        digest.update(f'{pipeline.name}\n{name}\n{stage.code_hash}\n'.encode())
+        for param in stage.params:
+            digest.update(f'{param}={_fingerprint(param, values[param])}\n'.encode())
+        for dep in stage.deps:
+            digest.update(f'{dep}:{keys[dep]}\n'.encode())
+        keys[name] = digest.hexdigest()[:16]
+    return keys
+
+
+class PipelineRun:
+    '''
+    The outcome of `run()`.
+
+    Attributes:
+        outputs: (dict) - Output of every stage that was run or loaded
+        status:  (dict) - 'ran', 'cached' or 'skipped' (cached and not
+                          needed) for each stage upstream of the targets
+        keys:    (dict) - Cache key of each of those stages
+    '''
+
+    def __init__(self, outputs, status, keys):
+        self.outputs = outputs
+        self.status = status
+        self.keys = keys
+
+    def __getitem__(self, name):
+        return self.outputs[name]
+
+
+def _cache_path(cache_dir, pipeline, name, key):
+    return os.path.join(cache_dir, pipeline.name, name, key + '.pkl')
+
+
+def _load(path):
+    with open(path, 'rb') as to_read:
+        return pickle.load(to_read)
+
+
+def _save(path, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.partial'
+    with open(partial, 'wb') as to_write:
+        pickle.dump(value, to_write, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(partial, path)
+
+
+def run(pipeline, params=None, targets=None, cache_dir=DEFAULT_CACHE_DIR, use_cache=True,
+        force=(), recorder=None):
+    '''
+    Runs the stages needed for `targets`, reusing cached outputs.
+
+    Args:
+        pipeline:  (Pipeline)
+        params:    (dict)     - Parameter values overriding the defaults
+        targets:   (list)     - Stages whose outputs are wanted (default: the
+                                stages nothing depends on)
+        cache_dir: (string)   - Root folder of the stage cache
+        use_cache: (bool)     - Read and write the cache. False runs every
+                                stage and leaves the cache alone.
+        force:     (list)     - Stages to re-run even if cached. Stages
+                                downstream of them re-run too.
+        recorder:  (labtools.instrument.Recorder) - Records the stages.
+                                Default: the globally enabled recorder, if any.
+    Returns:
+        result: (PipelineRun)
+    '''
+    unknown = set(params or {}) - set(pipeline.params)
+    if unknown:
+        raise ValueError(f'{pipeline.name!r} has no parameters {sorted(unknown)}')
+    values = dict(pipeline.params, **(params or {}))
+    targets = list(targets or pipeline.sinks())
+    order = pipeline.upstream(targets)
+    keys = stage_keys(pipeline, params)
+    stage = recorder.stage if recorder is not None else instrument.stage
+
+    forced = set(force)
+    for name in order:
+        if any(dep in forced for dep in pipeline.stages[name].deps):
+            forced.add(name)
+
+    def cached(name):
+        return (use_cache and name not in forced
+                and os.path.exists(_cache_path(cache_dir, pipeline, name, keys[name])))
+
+    # Walk back from the targets to find which outputs are actually needed
+    needed = set(targets)
+    for name in reversed(order):
+        if name in needed and not cached(name):
+            needed.update(pipeline.stages[name].deps)
+
+    outputs, status = {}, {}
+    for name in order:
+        if name not in needed:
+            status[name] = 'skipped'
+            continue
+        definition = pipeline.stages[name]
+        path = _cache_path(cache_dir, pipeline, name, keys[name])
+        if cached(name):
+            with stage(name, pipeline=pipeline.name, cache='hit'):
+                outputs[name] = _load(path)
+            status[name] = 'cached'
+            continue
+        arguments = {dep: outputs[dep] for dep in definition.deps}
+        arguments.update({param: values[param] for param in definition.params})
+        with stage(name, pipeline=pipeline.name, cache='miss'):
+            outputs[name] = definition.func(**arguments)
+        if use_cache:
+            _save(path, outputs[name])
+        status[name] = 'ran'
+    return PipelineRun({name: outputs[name] for name in order if name in outputs},
+                       status, {name: keys[name] for name in order})
+
+
+def _parse_param(text):
+    name, _, raw = text.partition('=')
+    try:
+        value = ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        value = raw
+    return name, value
+
+
+def main(argv=None):
+    from labtools.labs import PIPELINES
+
+    parser = argparse.ArgumentParser(description='Run a lab pipeline without Jupyter.')
+    parser.add_argument('lab', choices=list(PIPELINES))
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a parameter (values are Python literals)')
+    parser.add_argument('--target', action='append', default=None,
+                        help='stage to produce (default: the final stages)')
+    parser.add_argument('--force', action='append', default=[],
+                        help='stage to re-run even if it is cached')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--list', action='store_true',
+                        help='print the stages and parameters and exit')
+    args = parser.parse_args(argv)
+
+    pipeline = PIPELINES[args.lab]
+    if args.list:
+        for name, definition in pipeline.stages.items():
+            print(f"{name:>12}  <- {', '.join(definition.deps + definition.params)}")
+        print()
+        for name, value in pipeline.params.items():
+            print(f'{name} = {value!r}')
+        return 0
+
+    # Echo stages unless LABTOOLS_STAGE_ECHO=0; honour the other settings
+    instrument.enable_from_env({'LABTOOLS_STAGE_ECHO': '1', **os.environ})
+    result = run(pipeline, dict(_parse_param(p) for p in args.param), args.target,
+                 args.cache_dir, not args.no_cache, args.force)
+    print()
+    for name, state in result.status.items():
+        print(f'{name:>12}  {state:<8} {result.keys[name]}')
+    for name in args.target or pipeline.sinks():
+        print(f'\n{name}:\n{result[name]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+'''
+Linear regression from accumulated normal equations.
+
+The Course 5 Automatidata lab standardizes the whole one-hot training frame
+with StandardScaler, fits LinearRegression on the scaled copy, then predicts
+every row again to score it. Each step holds a full rows × features array.
+Ordinary least squares only needs the features' means, their covariance and
+their covariance with the target, and those can be summed chunk by chunk:
+
+    model = StreamingLinearRegression()
+    for X_chunk, y_chunk in chunks:
+        model.partial_fit(X_chunk, y_chunk)
+    model.predict(X_new)
+
+`StreamingLinearRegression` keeps one (features + targets)² matrix of
+centered cross-products, so memory stays O(features²) however many rows
+pass through. The scaler's moments come from the same matrix (its diagonal),
+so no separate StandardScaler pass is needed. The coefficients are solved
+for the standardized features, like the lab's, with a Cholesky factorization
+and equal the in-memory fit to rounding. When the features are collinear
+(a gram eigenvalue below `RANK_TOLERANCE` of the largest), the solve drops
+the null directions and returns the minimum-norm coefficients, as
+LinearRegression does, however the rows were chunked. `scaler()` and `linear_model()` return the fitted StandardScaler
+and LinearRegression, for code that expects the lab's two objects.
+
+Accumulators are mergeable: chunks can be summed in separate processes and
+combined with `merge()`, in any order, with the same result.
+
+    parts = executor.map(fit_part, paths)      # each returns a partial_fit model
+    model = functools.reduce(StreamingLinearRegression.merge, parts)
+
+`ResidualStats` scores a fitted model in a second streaming pass, from
+running sums of the absolute and squared residuals and the target's
+moments, and reports the lab's R², MAE, MSE and RMSE. `residual_scores()`
+runs that pass over an iterable of (X, y) chunks.
+'''
+
+import numpy as np
+import pandas as pd
+from scipy import linalg
+from sklearn.linear_model import LinearRegression
+from sklearn.preprocessing import StandardScaler
+
+
+# Gram eigenvalues below this fraction of the largest count as collinear directions
+RANK_TOLERANCE = 1e-10
+
+
+def _as_2d(values):
+    values = np.asarray(values, dtype=np.float64)
+    return values.reshape(-1, 1) if values.ndim == 1 else values
+
+
+def _merge_moments(n_a, mean_a, comoment_a, n_b, mean_b, comoment_b):
+    '''
+    Combines the row counts, means and centered cross-product matrices of
+    two sets of rows (Chan et al.'s pairwise update).
+    '''
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b / n)
+    comoment = comoment_a + comoment_b + np.outer(delta, delta) * (n_a * n_b / n)
+    return n, mean, comoment
+
+
+class StreamingLinearRegression:
+    '''
+    Least-squares regression on standardized features, fitted from chunks.
+
+    Equivalent to `StandardScaler().fit(X)` followed by
+    `LinearRegression().fit(scaler.transform(X), y)`, except that `predict()`
+    takes the unscaled features (the scaling is part of the model).
+
+    Attributes (after the first chunk):
+        n_samples_seen_: (int)        - Rows accumulated
+        mean_:           (np.ndarray) - Feature means, as StandardScaler.mean_
+        var_:            (np.ndarray) - Feature variances, as StandardScaler.var_
+        scale_:          (np.ndarray) - Feature standard deviations (1 for
+                                        constant features), as StandardScaler.scale_
+        coef_:           (np.ndarray) - Coefficients of the standardized
+                                        features, shaped like LinearRegression.coef_
+        intercept_:      (float or np.ndarray) - Intercept, likewise
+    '''
+
+    def __init__(self):
+        self.n_samples_seen_ = 0
+        self._mean = None
+        self._comoment = None
+        self._n_targets = None
+        self._y_ndim = None
+        self.feature_names_in_ = None
+
+    def partial_fit(self, X, y):
+        '''
+        Adds a chunk of rows to the accumulated moments.
+
+        Args:
+            X: (array-like) - Feature chunk, rows × features
+            y: (array-like) - Target chunk, a vector or rows × targets
+        Returns:
+            self
+        '''
+        if self.feature_names_in_ is None and isinstance(X, pd.DataFrame):
+            self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        X = _as_2d(X)
+        Y = _as_2d(y)
+        if not len(X):
+            return self
+        if self._y_ndim is None:
+            self._y_ndim = np.ndim(y)
+            self._n_targets = Y.shape[1]
+        Z = np.hstack([X, Y])
+        mean = Z.mean(axis=0)
+        Z -= mean
+        comoment = Z.T @ Z
+        if self._mean is None:
+            self.n_samples_seen_, self._mean, self._comoment = len(Z), mean, comoment
+        else:
+            self.n_samples_seen_, self._mean, self._comoment = _merge_moments(
+                self.n_samples_seen_, self._mean, self._comoment, len(Z), mean, comoment)
+        self._solve()
+        return self
+
+    def fit(self, X, y, chunk_size=100_000):
+        '''
+        Fits in-memory data `chunk_size` rows at a time, so no scaled or
+        float64 copy of the whole of `X` is made.
+        '''
+        self.__init__()
+        for start in range(0, len(X), chunk_size):
+            rows = slice(start, start + chunk_size)
+            self.partial_fit(X.iloc[rows] if isinstance(X, pd.DataFrame) else X[rows],
+                             y.iloc[rows] if isinstance(y, (pd.DataFrame, pd.Series)) else y[rows])
+        return self
+
+    def merge(self, other):
+        '''
+        Returns a model fitted on the rows of both `self` and `other`, which
+        must have the same features and targets. Neither input is changed.
+        '''
+        merged = StreamingLinearRegression()
+        merged.feature_names_in_ = (self.feature_names_in_ if self.feature_names_in_ is not None
+                                    else other.feature_names_in_)
+        if not other.n_samples_seen_ or not self.n_samples_seen_:
+            source = other if other.n_samples_seen_ else self
+            merged.n_samples_seen_ = source.n_samples_seen_
+            merged._mean, merged._comoment = source._mean, source._comoment
+            merged._n_targets, merged._y_ndim = source._n_targets, source._y_ndim
+        else:
+            merged.n_samples_seen_, merged._mean, merged._comoment = _merge_moments(
+                self.n_samples_seen_, self._mean, self._comoment,
+                other.n_samples_seen_, other._mean, other._comoment)
+            merged._n_targets, merged._y_ndim = self._n_targets, self._y_ndim
+        if merged.n_samples_seen_:
+            merged._solve()
+        return merged
+
+    def _solve(self):
+        n_features = len(self._mean) - self._n_targets
+        self.mean_ = self._mean[:n_features]
+        self.var_ = np.diag(self._comoment)[:n_features] / self.n_samples_seen_
+        # StandardScaler leaves (near-)constant features unscaled
+        scale = np.sqrt(self.var_)
+        self.scale_ = np.where(scale < 10 * np.finfo(scale.dtype).eps, 1.0, scale)
+        # Normal equations of the standardized features
+        gram = self._comoment[:n_features, :n_features] / np.outer(self.scale_, self.scale_)
+        moment = self._comoment[:n_features, n_features:] / self.scale_[:, None]
+        # Rank from the eigenvalues (Cholesky pivots can stay large on an exactly
+        # collinear gram). Summing the moments leaves the null eigenvalue of an
+        # exact combination a few eps from 0, relative to the largest, so the
+        # cut sits well above that: the normal equations of a gram conditioned
+        # worse than 1e10 have too few correct digits to be worth solving.
+        eigenvalues, eigenvectors = linalg.eigh(gram)
+        kept = eigenvalues > RANK_TOLERANCE * eigenvalues.max()
+        if kept.all():
+            coef = linalg.cho_solve(linalg.cho_factor(gram), moment)
+        else:
+            # Collinear features: the minimum-norm solution, as LinearRegression gives
+            basis = eigenvectors[:, kept]
+            coef = basis @ ((basis.T @ moment) / eigenvalues[kept, None])
+        intercept = self._mean[n_features:]
+        if self._y_ndim == 1:
+            self.coef_, self.intercept_ = coef[:, 0], float(intercept[0])
+        else:
+            self.coef_, self.intercept_ = coef.T, intercept
+
+    def predict(self, X):
+        '''
+        Predicts the target of unscaled features.
+        '''
+        X_scaled = (_as_2d(X) - self.mean_) / self.scale_
+        return X_scaled @ self.coef_.T + self.intercept_
+
+    def scaler(self):
+        '''
+        Returns the StandardScaler fitted to the same rows.
+        '''
+        scaler = StandardScaler()
+        scaler.mean_, scaler.var_, scaler.scale_ = self.mean_, self.var_, self.scale_
+        scaler.n_samples_seen_ = self.n_samples_seen_
+        scaler.n_features_in_ = len(self.mean_)
+        if self.feature_names_in_ is not None:
+            scaler.feature_names_in_ = self.feature_names_in_
+        return scaler
+
+    def linear_model(self):
+        '''
+        Returns the LinearRegression fitted to the scaled rows, which
+        predicts from `scaler().transform(X)` like the lab's model.
+        '''
+        lr = LinearRegression()
+        lr.coef_, lr.intercept_ = self.coef_, self.intercept_
+        lr.n_features_in_ = len(self.mean_)
+        lr.rank_ = np.linalg.matrix_rank(self._comoment[:len(self.mean_), :len(self.mean_)])
+        return lr
+
+
+class ResidualStats:
+    '''
+    Running regression scores over chunks of true and predicted values.
+
+    Keeps the row count, the sums of absolute and squared residuals, and the
+    target's mean and sum of squared deviations, per target. Scores equal
+    scikit-learn's `r2_score`, `mean_absolute_error` and
+    `mean_squared_error` on all the rows at once (averaged over targets).
+    '''
+
+    def __init__(self):
+        self.n = 0
+        self.abs_error = 0.0
+        self.sq_error = 0.0
+        self.mean = 0.0
+        self.sq_dev = 0.0
+
+    def partial_fit(self, y_true, y_pred):
+        '''
+        Adds a chunk of true and predicted values.
+        '''
+        y_true = _as_2d(y_true)
+        residual = y_true - _as_2d(y_pred)
+        n = len(y_true)
+        if not n:
+            return self
+        mean = y_true.mean(axis=0)
+        sq_dev = ((y_true - mean) ** 2).sum(axis=0)
+        self._add(n, np.abs(residual).sum(axis=0), (residual ** 2).sum(axis=0), mean, sq_dev)
+        return self
+
+    def _add(self, n, abs_error, sq_error, mean, sq_dev):
+        total = self.n + n
+        delta = mean - self.mean
+        self.sq_dev = self.sq_dev + sq_dev + delta ** 2 * (self.n * n / total)
+        self.mean = self.mean + delta * (n / total)
+        self.abs_error = self.abs_error + abs_error
+        self.sq_error = self.sq_error + sq_error
+        self.n = total
+
+    def merge(self, other):
+        '''
+        Returns the scores of the rows of both `self` and `other`.
+        '''
+        merged = ResidualStats()
+        for part in (self, other):
+            if part.n:
+                merged._add(part.n, part.abs_error, part.sq_error, part.mean, part.sq_dev)
+        return merged
+
+    def scores(self):
+        '''
+        Returns:
+            scores: (dict) - R^2, MAE, MSE and RMSE, named as the lab prints them
+        '''
+        mse = float(np.mean(self.sq_error / self.n))
+        return {'R^2': float(np.mean(1 - self.sq_error / self.sq_dev)),
+                'MAE': float(np.mean(self.abs_error / self.n)),
+                'MSE': mse,
+                'RMSE': float(np.sqrt(mse)),
+                }
+
+
+def residual_scores(model, chunks):
+    '''
+    Scores a fitted regressor over chunks of rows, one chunk in memory at
+    a time.
+
+    Args:
+        model:  (object)   - Anything with `predict(X)`, such as a
+                             StreamingLinearRegression
+        chunks: (iterable) - (X, y) chunks
+    Returns:
+        scores: (dict) - R^2, MAE, MSE and RMSE
+    '''
+    stats = ResidualStats()
+    for X, y in chunks:
+        stats.partial_fit(y, model.predict(X))
+    return stats.scores()
@@ -0,0 +1,407 @@
+'''
+Micro-batching HTTP scoring service for the Waze churn model.
+
+The service loads the model once. Every request is put on a queue, and a
+single batcher task drains that queue into micro-batches. A batch closes when
+it holds `max_batch` records or when `max_wait_ms` has passed since its first
+request arrived, whichever comes first. Each batch goes through
+`labtools.waze.WazeFeatures` and one `predict_proba()` call on a worker
+thread, so the event loop keeps accepting requests while a batch is scored.
+
+Endpoints (HTTP/1.1, keep-alive):
+
+    POST /score    body: one raw user record or a list of them (JSON)
+                   reply: {"churn_probability": [...], "churn": [...]}
+    GET  /metrics  latency percentiles, throughput and batch-size counters
+    GET  /health   {"status": "ok"}
+
+Run it with
+
+    python -m labtools.serving --model /path/waze_xgb.forest --port 8080
+
+and drive it with `load_test()`, which opens `concurrency` keep-alive
+connections and reports client-side latency percentiles.
+'''
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import pickle
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from labtools.artifacts import read_artifact
+from labtools.waze import MODEL_COLUMNS, NUMERIC_COLUMNS, RAW_COLUMNS, WazeFeatures
+
+
+# Decision threshold picked in the Course 6 Waze lab (recall ~0.5)
+DEFAULT_THRESHOLD = 0.194
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+
+
+def load_model(model_path):
+    '''
+    Loads a model artifact directory (`*.forest`) or a pickle.
+
+    A pickled GridSearchCV is unwrapped to its best estimator.
+
+    Args:
+        model_path: (string)  - Path to a `.forest` directory or `.pickle` file
+    Returns:
+        model: an object with a `predict_proba()` method
+    '''
+    model_path = model_path.rstrip('/')
+    if model_path.endswith('.forest'):
+        folder, name = os.path.split(model_path)
+        return read_artifact(folder, name[:-len('.forest')])
+    with open(model_path, 'rb') as to_read:
+        model = pickle.load(to_read)
+    return getattr(model, 'best_estimator_', model)
+
+
+def model_columns(model):
+    '''
+    Returns the feature order the model was trained with.
+    '''
+    meta = getattr(model, 'meta', {})
+    names = meta.get('feature_names') or list(getattr(model, 'feature_names_in_', []))
+    return names or MODEL_COLUMNS
+
+
+def validate_records(records):
+    '''
+    Checks a decoded `/score` body before it is queued.
+
+    Each record must be a JSON object with every raw column, a finite number
+    for each numeric column and a string for `device`; extra fields are
+    ignored. A NaN or infinity that reached the batcher would fail every
+    request in its batch.
+
+    Args:
+        records: A decoded JSON body, normally a list of records
+    Returns:
+        error: (string or None) - What is wrong with the first bad record,
+                                  or None when all of them are valid
+    '''
+    if not isinstance(records, list):
+        return 'body must be a record or a list of records'
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            return f'record {i} is not an object'
+        missing = [c for c in RAW_COLUMNS if c not in record]
+        if missing:
+            return f'record {i} is missing fields {missing}'
+        bad = [c for c in NUMERIC_COLUMNS
+               if isinstance(record[c], bool) or not isinstance(record[c], (int, float))]
+        if bad:
+            return f'record {i} has non-numeric fields {bad}'
+        bad = [c for c in NUMERIC_COLUMNS if not math.isfinite(record[c])]
+        if bad:
+            return f'record {i} has non-finite fields {bad}'
+        if not isinstance(record['device'], str):
+            return f'record {i} has a non-string device'
+    return None
+
+
+class LatencyStats:
+    '''
+    Rolling latency percentiles plus running throughput counters.
+
+    Args:
+        window: (int)  - Number of most recent requests kept for percentiles
+    '''
+
+    def __init__(self, window=10_000):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+
+    def record_batch(self, n_rows, latencies):
+        self.batches += 1
+        self.rows += n_rows
+        self.requests += len(latencies)
+        self.batch_sizes.append(n_rows)
+        self.latencies.extend(latencies)
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        latencies_ms = np.array(self.latencies) * 1000
+        p50, p99 = np.percentile(latencies_ms, [50, 99]) if latencies_ms.size else (0.0, 0.0)
+        return {'requests': self.requests,
+                'rows': self.rows,
+                'batches': self.batches,
+                'errors': self.errors,
+                'uptime_s': elapsed,
+                'requests_per_s': self.requests / elapsed,
+                'rows_per_s': self.rows / elapsed,
+                'latency_p50_ms': float(p50),
+                'latency_p99_ms': float(p99),
+                'mean_batch_rows': float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+                }
+
+
+class ScoringServer:
+    '''
+    Micro-batching churn scorer behind a minimal asyncio HTTP server.
+
+    Args:
+        model:       Fitted model (or TreeArtifact) with `predict_proba()`
+        threshold:   (float)  - Churn decision threshold
+        max_batch:   (int)    - Largest number of records scored together
+        max_wait_ms: (float)  - Longest time a request waits for a batch to fill
+        features:    (WazeFeatures) - The transformer fitted alongside the
+                                      model (default: an unclipped one)
+    '''
+
+    def __init__(self, model, threshold=DEFAULT_THRESHOLD, max_batch=512, max_wait_ms=2.0,
+                 features=None):
+        self.model = model
+        self.features = features if features is not None else WazeFeatures().fit(None)
+        self.columns = model_columns(model)
+        self.threshold = threshold
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.stats = LatencyStats()
+        self._queue = None
+        self._batcher = None
+
+    def score_frame(self, frame):
+        '''
+        Returns churn probabilities for a frame of raw records.
+        '''
+        X = self.features.transform(frame)[self.columns]
+        return self.model.predict_proba(X)[:, 1]
+
+    async def score(self, records):
+        '''
+        Queues raw records for the next batch and waits for their scores.
+        '''
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((records, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        # Block for the first request, then keep taking requests until the
+        # batch is full or the oldest one has waited max_wait. Requests that
+        # queued up while the previous batch was being scored are always
+        # taken, even if the deadline has already passed.
+        batch = [await self._queue.get()]
+        n_rows = len(batch[0][0])
+        deadline = batch[0][2] + self.max_wait
+        while n_rows < self.max_batch:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(item)
+            n_rows += len(item[0])
+        return batch, n_rows
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch, n_rows = await self._collect()
+            frame = pd.DataFrame([record for records, _, _ in batch for record in records])
+            try:
+                probs = await loop.run_in_executor(None, self.score_frame, frame)
+            except Exception as exc:
+                self.stats.errors += len(batch)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            done = time.perf_counter()
+            start = 0
+            for records, future, _ in batch:
+                if not future.done():
+                    future.set_result(probs[start:start + len(records)])
+                start += len(records)
+            self.stats.record_batch(n_rows, [done - queued for _, _, queued in batch])
+
+    async def _respond(self, writer, status, payload):
+        body = json.dumps(payload).encode()
+        head = (f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n\r\n')
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def _handle_request(self, method, target, body):
+        if target == '/health':
+            return 200, {'status': 'ok'}
+        if target == '/metrics':
+            return 200, self.stats.snapshot()
+        if target != '/score':
+            return 404, {'error': f'unknown path {target}'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        try:
+            records = json.loads(body)
+        except ValueError:
+            return 400, {'error': 'body is not valid JSON'}
+        if isinstance(records, dict):
+            records = [records]
+        # Reject bad records here so they cannot fail a whole batch
+        error = validate_records(records)
+        if error:
+            return 400, {'error': error}
+        if not records:
+            return 200, {'churn_probability': [], 'churn': []}
+        try:
+            probs = await self.score(records)
+        except Exception as exc:
+            return 500, {'error': repr(exc)}
+        return 200, {'churn_probability': probs.tolist(),
+                     'churn': (probs >= self.threshold).astype(int).tolist()}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'content-length':
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b''
+                try:
+                    status, payload = await self._handle_request(method, target, body)
+                except Exception as exc:
+                    # A bug in one request should not drop the connection
+                    self.stats.errors += 1
+                    status, payload = 500, {'error': repr(exc)}
+                await self._respond(writer, status, payload)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8080, unix_path=None):
+        '''
+        Starts the batcher and the listener; returns the asyncio server.
+        '''
+        # Score one dummy record so lazy initialisation (such as compiling
+        # the inference kernels) is not paid by the first real request.
+        warm_up = pd.DataFrame([{c: 1.0 for c in RAW_COLUMNS}]).assign(device='Android')
+        self.score_frame(warm_up)
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run_batches())
+        if unix_path:
+            return await asyncio.start_unix_server(self._handle_connection, path=unix_path)
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def stop(self, server):
+        '''
+        Stops accepting connections and cancels the batcher.
+        '''
+        server.close()
+        self._batcher.cancel()
+
+    async def serve_forever(self, host='127.0.0.1', port=8080, unix_path=None):
+        server = await self.start(host, port, unix_path)
+        async with server:
+            await server.serve_forever()
+
+
+async def _client(host, port, payloads, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for body in payloads:
+            start = time.perf_counter()
+            writer.write(f'POST /score HTTP/1.1\r\nHost: {host}\r\n'
+                         f'Content-Type: application/json\r\n'
+                         f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+            await writer.drain()
+            length = 0
+            status = await reader.readline()
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            if b' 200 ' not in status:
+                raise RuntimeError(f'server answered {status.decode().strip()}')
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def load_test(records, host='127.0.0.1', port=8080, n_requests=2000,
+                    concurrency=64, rows_per_request=1):
+    '''
+    Fires `n_requests` scoring requests over `concurrency` connections.
+
+    Args:
+        records:          (pd.DataFrame) - Raw Waze records to sample from
+        host, port:       Where the service listens
+        n_requests:       (int)  - Total number of requests
+        concurrency:      (int)  - Number of simultaneous keep-alive clients
+        rows_per_request: (int)  - Records sent in each request
+    Returns:
+        summary: (dict)  - Client-side p50/p99 latency and throughput
+    '''
+    rng = np.random.default_rng(42)
+    rows = records.to_dict(orient='records')
+    payloads = [json.dumps([rows[i] for i in rng.integers(0, len(rows), rows_per_request)],
+                           default=float).encode()
+                for _ in range(n_requests)]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(host, port, payloads[k::concurrency], latencies)
+                           for k in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {'requests': len(latencies),
+            'elapsed_s': elapsed,
+            'requests_per_s': len(latencies) / elapsed,
+            'rows_per_s': len(latencies) * rows_per_request / elapsed,
+            'latency_p50_ms': float(np.percentile(latencies_ms, 50)),
+            'latency_p99_ms': float(np.percentile(latencies_ms, 99)),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the Waze churn model over HTTP.')
+    parser.add_argument('--model', required=True,
+                        help='path to a .forest artifact directory or a .pickle file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', default=None)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--max-batch', type=int, default=512)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    server = ScoringServer(load_model(args.model), threshold=args.threshold,
+                           max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    asyncio.run(server.serve_forever(args.host, args.port, args.unix_socket))
+
+
+if __name__ == '__main__':
+    main()
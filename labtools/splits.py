@@ -0,0 +1,145 @@
+'''
+Train/validation/fold assignments that are built once and reused.
+
+A split is stored as one int8 per row of the training frame: -1 for rows
+that are always used for training, and 0, 1, ... for the fold (or the single
+validation set) a row is held out in. That is exactly the `test_fold` array
+`PredefinedSplit` expects, so the same assignment can be handed to every
+`GridSearchCV` in a model comparison, whether it tunes a decision tree, a
+random forest or XGBoost. All candidates are then scored on identical rows.
+
+`SplitRegistry` saves assignments next to the dataset they index, together
+with a fingerprint of that dataset's row index. Loading a split against a
+frame whose rows differ fails loudly instead of silently misaligning.
+
+    registry = SplitRegistry('waze_dataset.csv')
+    folds = registry.get_or_build('cv4', X_train.index,
+                                  lambda: fold_assignment(y_train, n_splits=4))
+    rf_cv = GridSearchCV(rf, rf_params, cv=registry.predefined_split('cv4', X_train.index))
+    xgb_cv = GridSearchCV(xgb, xgb_params, cv=registry.predefined_split('cv4', X_train.index))
+'''
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold, PredefinedSplit, StratifiedKFold
+
+
+def validation_split_index(train_index, val_index):
+    '''
+    Marks which rows of the training frame belong to the validation set.
+
+    Vectorized replacement for
+    `[0 if x in X_val.index else -1 for x in X_train.index]`.
+
+    Args:
+        train_index: (pd.Index)  - Index of the full training frame (X_train)
+        val_index:   (pd.Index)  - Index of the validation rows (X_val)
+    Returns:
+        split_index: (np.ndarray) - int8 array, 0 for validation rows and -1
+                                    for training rows
+    '''
+    return np.where(pd.Index(train_index).isin(val_index), 0, -1).astype(np.int8)
+
+
+def fold_assignment(y, n_splits=5, stratify=True, shuffle=False, random_state=None):
+    '''
+    Assigns every row to one of `n_splits` cross-validation folds.
+
+    With the defaults the folds are the same ones `GridSearchCV(cv=n_splits)`
+    uses for a classifier (StratifiedKFold without shuffling).
+
+    Args:
+        y:            (array-like)  - Target, used for stratification
+        n_splits:     (int)         - Number of folds
+        stratify:     (bool)        - Keep class proportions in every fold
+        shuffle:      (bool)        - Shuffle rows before assigning folds
+        random_state: (int)         - Seed used when shuffling
+    Returns:
+        folds: (np.ndarray)  - int8 array holding each row's fold number
+    '''
+    splitter_class = StratifiedKFold if stratify else KFold
+    splitter = splitter_class(n_splits=n_splits, shuffle=shuffle,
+                              random_state=random_state if shuffle else None)
+    y = np.asarray(y)
+    folds = np.empty(y.shape[0], dtype=np.int8)
+    for fold, (_, test_idx) in enumerate(splitter.split(np.zeros(y.shape[0]), y)):
+        folds[test_idx] = fold
+    return folds
+
+
+def index_fingerprint(index):
+    '''
+    Returns a short hash identifying the rows (and their order) of an index.
+    '''
+    hashed = pd.util.hash_pandas_object(pd.Index(index), index=False).to_numpy()
+    return hashlib.sha1(hashed.tobytes()).hexdigest()[:16]
+
+
+class SplitRegistry:
+    '''
+    Saves and reloads split assignments for one dataset.
+
+    Assignments live in `<dataset name>_splits/` next to the data file, one
+    `<name>.npy` (int8) plus `<name>.json` (fingerprint and fold sizes) each.
+
+    Args:
+        data_path: (string)  - Path of the dataset the splits index into
+    '''
+
+    def __init__(self, data_path):
+        self.directory = os.path.splitext(data_path)[0] + '_splits'
+
+    def _paths(self, name):
+        stem = os.path.join(self.directory, name)
+        return stem + '.npy', stem + '.json'
+
+    def save(self, name, assignment, index):
+        '''
+        Saves an assignment for the rows of `index`.
+        '''
+        assignment = np.asarray(assignment, dtype=np.int8)
+        if assignment.shape[0] != len(index):
+            raise ValueError('assignment and index must have the same length')
+        os.makedirs(self.directory, exist_ok=True)
+        array_path, meta_path = self._paths(name)
+        np.save(array_path, assignment)
+        values, counts = np.unique(assignment, return_counts=True)
+        with open(meta_path, 'w') as to_write:
+            json.dump({'fingerprint': index_fingerprint(index),
+                       'n_rows': int(assignment.shape[0]),
+                       'fold_sizes': {int(v): int(c) for v, c in zip(values, counts)},
+                       }, to_write)
+
+    def exists(self, name):
+        return all(os.path.exists(p) for p in self._paths(name))
+
+    def load(self, name, index):
+        '''
+        Loads an assignment, checking it was built for the rows of `index`.
+        '''
+        array_path, meta_path = self._paths(name)
+        with open(meta_path) as to_read:
+            meta = json.load(to_read)
+        if meta['fingerprint'] != index_fingerprint(index):
+            raise ValueError(f'Split {name!r} was built for different rows than the ones given')
+        return np.load(array_path)
+
+    def get_or_build(self, name, index, build):
+        '''
+        Loads an assignment, or builds it with `build()` and saves it first.
+        '''
+        if self.exists(name):
+            return self.load(name, index)
+        assignment = build()
+        self.save(name, assignment, index)
+        return np.asarray(assignment, dtype=np.int8)
+
+    def predefined_split(self, name, index):
+        '''
+        Returns a `PredefinedSplit` for a saved assignment, ready for `cv=`.
+        '''
+        return PredefinedSplit(self.load(name, index))
@@ -0,0 +1,292 @@
+'''
+Synthetic stand-ins for the datasets the labs read.
+
+Each generator returns a DataFrame with the same columns, dtypes and rough
+distributions as the file a lab loads, so a lab's pipeline runs unchanged on
+it. The values are random, not a resample of the real data, so model scores
+on synthetic data mean nothing. The generators exist to measure how runtime
+and memory grow with the number of rows.
+
+`DATASETS` maps each file name to its generator and the number of rows in
+the real file. `write_dataset()` writes `scale` times that many rows to disk
+in the same format the lab reads.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+_TAXI_TIME_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+_DEPARTMENTS = ['sales', 'technical', 'support', 'IT', 'product_mng', 'marketing',
+                'RandD', 'accounting', 'hr', 'management']
+
+_WORDS = ['someone', 'shared', 'with', 'me', 'that', 'the', 'world', 'largest',
+          'discovered', 'news', 'claim', 'friend', 'learned', 'read', 'media',
+          'colleague', 'internet', 'forum', 'opinion', 'think', 'believe', 'view',
+          'earth', 'moon', 'ocean', 'animal', 'human', 'body', 'country', 'city',
+          'year', 'percent', 'million', 'people', 'every', 'day', 'bees', 'octopus',
+          'planet', 'light', 'sound', 'tallest', 'building', 'river', 'desert']
+
+
+def _rng(seed):
+    return np.random.default_rng(seed)
+
+
+def taxi_trips(n, seed=0):
+    '''
+    Yellow taxi trips shaped like 2017_Yellow_Taxi_Trip_Data.csv.
+    '''
+    rng = _rng(seed)
+    pickup = (pd.Timestamp('2017-01-01')
+              + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, n), unit='s'))
+    distance = np.round(rng.gamma(1.3, 2.3, n), 2)
+    minutes = np.maximum(distance * rng.uniform(2.5, 6.0, n) + rng.normal(3, 2, n), 0.5)
+    dropoff = pickup + pd.to_timedelta(np.round(minutes * 60), unit='s')
+    ratecode = rng.choice([1, 2, 3, 4, 5, 99], n, p=[0.972, 0.02, 0.003, 0.002, 0.0029, 0.0001])
+    fare = np.round(np.where(ratecode == 2, 52.0, 2.5 + 2.5 * distance + 0.35 * minutes), 1)
+    payment = rng.choice([1, 2, 3, 4], n, p=[0.67, 0.32, 0.007, 0.003])
+    extra = rng.choice([0.0, 0.5, 1.0], n, p=[0.54, 0.31, 0.15])
+    tolls = np.where(rng.random(n) < 0.05, 5.76, 0.0)
+    tip = np.where(payment == 1, np.round(fare * rng.uniform(0.0, 0.3, n), 2), 0.0)
+    total = np.round(fare + extra + 0.5 + tip + tolls + 0.3, 2)
+    index = pd.Index(rng.choice(120_000_000, n, replace=False), name=None)
+    return pd.DataFrame({
+        'VendorID': rng.choice([1, 2], n, p=[0.44, 0.56]),
+        'tpep_pickup_datetime': pickup.strftime(_TAXI_TIME_FORMAT),
+        'tpep_dropoff_datetime': dropoff.strftime(_TAXI_TIME_FORMAT),
+        'passenger_count': rng.choice([0, 1, 2, 3, 4, 5, 6], n,
+                                      p=[0.002, 0.71, 0.143, 0.04, 0.02, 0.05, 0.035]),
+        'trip_distance': distance,
+        'RatecodeID': ratecode,
+        'store_and_fwd_flag': rng.choice(['N', 'Y'], n, p=[0.996, 0.004]),
+        'PULocationID': rng.integers(1, 266, n),
+        'DOLocationID': rng.integers(1, 266, n),
+        'payment_type': payment,
+        'fare_amount': fare,
+        'extra': extra,
+        'mta_tax': 0.5,
+        'tip_amount': tip,
+        'tolls_amount': tolls,
+        'improvement_surcharge': 0.3,
+        'total_amount': total,
+        }, index=index)
+
+
+def taxi_trip_means(n, seed=0):
+    '''
+    Per-trip route means and predicted fares, shaped like nyc_preds_means.csv
+    (the file the Course 5 Automatidata lab exports for Course 6).
+    '''
+    trips = taxi_trips(n, seed)
+    pickup = pd.to_datetime(trips['tpep_pickup_datetime'], format=_TAXI_TIME_FORMAT)
+    dropoff = pd.to_datetime(trips['tpep_dropoff_datetime'], format=_TAXI_TIME_FORMAT)
+    duration = (dropoff - pickup) / np.timedelta64(1, 'm')
+    route = [trips['PULocationID'], trips['DOLocationID']]
+    means = pd.DataFrame({
+        'mean_duration': duration.groupby(route).transform('mean'),
+        'mean_distance': trips['trip_distance'].groupby(route).transform('mean'),
+        })
+    means['predicted_fare'] = 2.5 + 2.5 * means['mean_distance'] + 0.35 * means['mean_duration']
+    return means.reset_index(drop=True)
+
+
+def waze_users(n, seed=0):
+    '''
+    Waze users shaped like waze_dataset.csv.
+    '''
+    rng = _rng(seed)
+    sessions = rng.negative_binomial(2, 0.025, n)
+    total_sessions = sessions + rng.gamma(2.0, 60.0, n)
+    drives = np.round(sessions * rng.uniform(0.7, 0.9, n)).astype(np.int64)
+    activity_days = rng.integers(0, 31, n)
+    driving_days = np.minimum(activity_days, rng.integers(0, 31, n))
+    driven_km = rng.gamma(2.0, 2000.0, n) + 60
+    churned = rng.random(n) < 0.177 + 0.2 * (activity_days < 8)
+    label = np.where(churned, 'churned', 'retained').astype(object)
+    label[rng.random(n) < 0.047] = np.nan
+    return pd.DataFrame({
+        'ID': np.arange(n),
+        'label': label,
+        'sessions': sessions,
+        'drives': drives,
+        'total_sessions': total_sessions,
+        'n_days_after_onboarding': rng.integers(4, 3501, n),
+        'total_navigations_fav1': rng.negative_binomial(1, 0.008, n),
+        'total_navigations_fav2': rng.negative_binomial(1, 0.03, n),
+        'driven_km_drives': driven_km,
+        'duration_minutes_drives': driven_km * rng.uniform(0.2, 0.6, n),
+        'activity_days': activity_days,
+        'driving_days': driving_days,
+        'device': rng.choice(['iPhone', 'Android'], n, p=[0.64, 0.36]),
+        })
+
+
+def tiktok_videos(n, seed=0):
+    '''
+    TikTok videos shaped like tiktok_dataset.csv.
+    '''
+    rng = _rng(seed)
+    claim = rng.random(n) < 0.5
+    lengths = rng.integers(8, 25, n)
+    words = rng.choice(len(_WORDS), (n, 24))
+    vocabulary = np.array(_WORDS, dtype=object)
+    text = np.array([' '.join(vocabulary[row[:k]]) for row, k in zip(words, lengths)], dtype=object)
+    views = np.where(claim, rng.uniform(1e3, 1e6, n), rng.uniform(20, 1e4, n)).round()
+    likes = (views * rng.uniform(0.0, 0.5, n)).round()
+    frame = pd.DataFrame({
+        '#': np.arange(1, n + 1),
+        'claim_status': np.where(claim, 'claim', 'opinion').astype(object),
+        'video_id': rng.choice(9_999_999_999 - 1_000_000_000, n, replace=False) + 1_000_000_000,
+        'video_duration_sec': rng.integers(5, 61, n),
+        'video_transcription_text': text,
+        'verified_status': rng.choice(['not verified', 'verified'], n, p=[0.94, 0.06]),
+        'author_ban_status': rng.choice(['active', 'under review', 'banned'], n, p=[0.81, 0.11, 0.08]),
+        'video_view_count': views,
+        'video_like_count': likes,
+        'video_share_count': (likes * rng.uniform(0.0, 0.3, n)).round(),
+        'video_download_count': (likes * rng.uniform(0.0, 0.02, n)).round(),
+        'video_comment_count': (likes * rng.uniform(0.0, 0.01, n)).round(),
+        })
+    missing = rng.random(n) < 0.015
+    frame.loc[missing, ['claim_status', 'video_transcription_text', 'video_view_count',
+                        'video_like_count', 'video_share_count', 'video_download_count',
+                        'video_comment_count']] = np.nan
+    return frame
+
+
+def hr_employees(n, seed=0):
+    '''
+    Employees shaped like HR_capstone_dataset.csv, including its ~20% of
+    exact duplicate rows.
+    '''
+    rng = _rng(seed)
+    unique = max(1, int(n * 0.8))
+    frame = pd.DataFrame({
+        'satisfaction_level': rng.integers(9, 101, unique) / 100,
+        'last_evaluation': rng.integers(36, 101, unique) / 100,
+        'number_project': rng.integers(2, 8, unique),
+        'average_montly_hours': rng.integers(96, 311, unique),
+        'time_spend_company': rng.choice([2, 3, 4, 5, 6, 7, 8, 10], unique,
+                                         p=[0.24, 0.42, 0.14, 0.1, 0.05, 0.015, 0.015, 0.02]),
+        'Work_accident': (rng.random(unique) < 0.15).astype(int),
+        'left': (rng.random(unique) < 0.17).astype(int),
+        'promotion_last_5years': (rng.random(unique) < 0.02).astype(int),
+        'Department': rng.choice(_DEPARTMENTS, unique),
+        'salary': rng.choice(['low', 'medium', 'high'], unique, p=[0.48, 0.43, 0.09]),
+        })
+    duplicates = frame.iloc[rng.integers(0, unique, n - unique)]
+    return pd.concat([frame, duplicates], ignore_index=True)
+
+
+def penguins(n, seed=0):
+    '''
+    Penguins shaped like penguins.csv (three species, a few missing values).
+    '''
+    rng = _rng(seed)
+    species = rng.choice(['Adelie', 'Chinstrap', 'Gentoo'], n, p=[0.44, 0.2, 0.36])
+    gentoo = species == 'Gentoo'
+    chinstrap = species == 'Chinstrap'
+    male = rng.random(n) < 0.5
+    frame = pd.DataFrame({
+        'species': species,
+        'island': np.where(gentoo, 'Biscoe',
+                           np.where(chinstrap, 'Dream', rng.choice(['Torgersen', 'Biscoe', 'Dream'], n))),
+        'bill_length_mm': np.round(38.8 + 8.9 * chinstrap + 8.7 * gentoo + 3 * male + rng.normal(0, 2.5, n), 1),
+        'bill_depth_mm': np.round(18.3 - 3.3 * gentoo + 1.2 * male + rng.normal(0, 0.8, n), 1),
+        'flipper_length_mm': np.round(190 + 6 * chinstrap + 27 * gentoo + 5 * male + rng.normal(0, 5, n)),
+        'body_mass_g': np.round(3700 + 1370 * gentoo + 600 * male + rng.normal(0, 300, n), -1),
+        'sex': np.where(male, 'male', 'female').astype(object),
+        })
+    frame.loc[rng.random(n) < 0.03, 'sex'] = np.nan
+    frame.loc[rng.random(n) < 0.006, ['bill_length_mm', 'bill_depth_mm',
+                                      'flipper_length_mm', 'body_mass_g']] = np.nan
+    return frame
+
+
+def air_quality(n, seed=0):
+    '''
+    Daily carbon monoxide readings shaped like c4_epa_air_quality.csv.
+    '''
+    rng = _rng(seed)
+    states = ['California', 'Arizona', 'Ohio', 'Florida', 'Texas', 'Michigan',
+              'Pennsylvania', 'New York', 'Colorado', 'Illinois']
+    state = rng.choice(states, n, p=[0.25, 0.05, 0.05, 0.05, 0.05, 0.04, 0.04, 0.04, 0.03, 0.4])
+    mean = np.round(rng.gamma(2.0, 0.2, n), 6)
+    return pd.DataFrame({
+        'date_local': '2018-01-01',
+        'state_name': state,
+        'county_name': 'County',
+        'city_name': 'City',
+        'local_site_name': 'Site',
+        'parameter_name': 'Carbon monoxide',
+        'units_of_measure': 'Parts per million',
+        'arithmetic_mean': mean,
+        'aqi': np.round(mean * 12 + rng.normal(0, 1.5, n)).clip(0).astype(int),
+        })
+
+
+def image(n_pixels, seed=0):
+    '''
+    An RGB uint8 photo-like image with about `n_pixels` pixels (4:3), made of
+    smooth colour regions plus noise.
+    '''
+    rng = _rng(seed)
+    height = max(1, int(round(np.sqrt(n_pixels * 3 / 4))))
+    width = max(1, int(round(n_pixels / height)))
+    palette = rng.integers(0, 256, (8, 3))
+    rows = (np.arange(height)[:, None] * 8 // height)
+    cols = (np.arange(width)[None, :] * 3 // width)
+    region = (rows + 5 * cols) % len(palette)
+    noise = rng.normal(0, 12, (height, width, 3))
+    return np.clip(palette[region] + noise, 0, 255).astype(np.uint8)
+
+
+# File name -> (generator, rows in the real file)
+DATASETS = {
+    '2017_Yellow_Taxi_Trip_Data.csv': (taxi_trips, 22_699),
+    'nyc_preds_means.csv': (taxi_trip_means, 22_699),
+    'waze_dataset.csv': (waze_users, 14_999),
+    'tiktok_dataset.csv': (tiktok_videos, 19_382),
+    'HR_capstone_dataset.csv': (hr_employees, 14_999),
+    'penguins.csv': (penguins, 344),
+    'c4_epa_air_quality.csv': (air_quality, 260),
+    # The colour compression lab reads a JPEG photo. A .npy array is used
+    # instead so no image library is needed.
+    'tulips.npy': (image, 320 * 240),
+    }
+
+
+def write_dataset(name, scale, directory, seed=0):
+    '''
+    Writes `scale` times the real number of rows of a dataset.
+
+    Files already written for the same name, scale and seed are reused.
+
+    Args:
+        name:      (string)  - File name, a key of DATASETS
+        scale:     (float)   - Multiple of the real file's row count
+        directory: (string)  - Folder to write into
+        seed:      (int)     - Random seed for the generator
+    Returns:
+        path: (string)  - Path of the written file
+    '''
+    generator, base_rows = DATASETS[name]
+    n = max(1, int(round(base_rows * scale)))
+    stem, extension = os.path.splitext(name)
+    path = os.path.join(directory, f'{stem}_x{scale:g}_s{seed}{extension}')
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    data = generator(n, seed)
+    partial = path + '.partial'
+    if extension == '.npy':
+        with open(partial, 'wb') as to_write:
+            np.save(to_write, data)
+    else:
+        # The taxi file keeps its unnamed index column, like the original
+        data.to_csv(partial, index=name == '2017_Yellow_Taxi_Trip_Data.csv')
+    os.replace(partial, path)
+    return path
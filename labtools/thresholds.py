@@ -0,0 +1,190 @@
+'''
+Decision-threshold analysis for binary classifiers.
+
+Every metric that depends on a decision threshold (precision, recall, F-beta,
+misclassification cost, alert volume) is a function of the confusion-matrix
+counts at that threshold. Sorting the scores once and taking cumulative sums
+gives those counts at every distinct threshold in a single pass, instead of
+re-thresholding the whole array and calling a scorer once per threshold.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def positive_scores(probabilities):
+    '''
+    Returns the positive-class scores as a 1-D float array.
+
+    Args:
+        probabilities: (array-like)  - Either the output of `predict_proba()`
+                                       (two columns) or a 1-D array of scores
+    Returns:
+        scores:        (np.ndarray)  - 1-D array of positive-class scores
+    '''
+    scores = np.asarray(probabilities, dtype=float)
+    if scores.ndim == 2:
+        scores = scores[:, 1]
+    return scores
+
+
+def predict_at_threshold(probabilities, threshold):
+    '''
+    Converts scores to {0, 1} predictions: 1 wherever score >= threshold.
+
+    Args:
+        probabilities: (array-like)  - `predict_proba()` output or 1-D scores
+        threshold:     (float)       - The decision threshold
+    Returns:
+        preds:         (np.ndarray)  - Array of int {0, 1} predictions
+    '''
+    return (positive_scores(probabilities) >= threshold).astype(int)
+
+
+def threshold_sweep(y_true, probabilities, beta=1.0, cost_fp=1.0, cost_fn=1.0):
+    '''
+    Computes threshold-dependent metrics at every distinct score.
+
+    Row i describes the classifier that predicts 1 for every score >= the
+    row's threshold. Rows are ordered from the highest threshold (fewest
+    alerts) to the lowest (every row flagged).
+
+    Args:
+        y_true:        (array-like)  - True {0, 1} labels
+        probabilities: (array-like)  - `predict_proba()` output or 1-D scores
+        beta:          (float)       - Weight of recall in the F-beta score
+        cost_fp:       (float)       - Cost of one false positive
+        cost_fn:       (float)       - Cost of one false negative
+    Returns:
+        sweep:         (pd.DataFrame) - One row per distinct threshold with the
+                                        columns threshold, tp, fp, fn, tn,
+                                        precision, recall, f_beta,
+                                        expected_cost (per scored row),
+                                        alerts and alert_rate
+    '''
+    y_true = np.asarray(y_true).astype(bool)
+    scores = positive_scores(probabilities)
+    if y_true.shape != scores.shape:
+        raise ValueError('y_true and probabilities must have the same length')
+
+    order = np.argsort(scores, kind='mergesort')[::-1]
+    scores = scores[order]
+    y_sorted = y_true[order]
+
+    # The last index of each run of tied scores is where a threshold boundary
+    # falls; everything up to and including it is flagged at that threshold.
+    boundaries = np.r_[np.flatnonzero(np.diff(scores)), scores.size - 1]
+    tp = np.cumsum(y_sorted)[boundaries]
+    alerts = boundaries + 1
+    fp = alerts - tp
+
+    n_pos = int(y_true.sum())
+    n = scores.size
+    fn = n_pos - tp
+    tn = n - n_pos - fp
+
+    precision = tp / alerts
+    recall = tp / n_pos if n_pos else np.zeros(tp.size)
+    b2 = beta ** 2
+    denom = b2 * precision + recall
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f_beta = np.where(denom > 0, (1 + b2) * precision * recall / denom, 0.0)
+
+    return pd.DataFrame({'threshold': scores[boundaries],
+                         'tp': tp,
+                         'fp': fp,
+                         'fn': fn,
+                         'tn': tn,
+                         'precision': precision,
+                         'recall': recall,
+                         'f_beta': f_beta,
+                         'expected_cost': (cost_fp * fp + cost_fn * fn) / n,
+                         'alerts': alerts,
+                         'alert_rate': alerts / n,
+                         })
+
+
+def threshold_for_target(sweep, recall=None, precision=None):
+    '''
+    Picks the operating point that meets a target recall or precision.
+
+    For a recall target this is the highest threshold whose recall is at
+    least the target (the most precise way to reach it). For a precision
+    target it is the lowest threshold whose precision is at least the target
+    (the most recall available at that precision).
+
+    Args:
+        sweep:     (pd.DataFrame)  - Output of `threshold_sweep()`
+        recall:    (float)         - Target recall, or None
+        precision: (float)         - Target precision, or None
+    Returns:
+        row:       (pd.Series)     - The chosen row of `sweep`
+    '''
+    if (recall is None) == (precision is None):
+        raise ValueError('Specify exactly one of recall or precision')
+
+    if recall is not None:
+        hits = np.flatnonzero(sweep['recall'].to_numpy() >= recall)
+        if hits.size == 0:
+            raise ValueError(f'No threshold reaches recall {recall}')
+        return sweep.iloc[hits[0]]
+
+    hits = np.flatnonzero(sweep['precision'].to_numpy() >= precision)
+    if hits.size == 0:
+        raise ValueError(f'No threshold reaches precision {precision}')
+    return sweep.iloc[hits[-1]]
+
+
+def closest_threshold(sweep, metric, desired, grid=None):
+    '''
+    Finds the threshold whose `metric` is closest to `desired`.
+
+    By default every distinct score is a candidate, and ties go to the
+    higher threshold. With `grid`, only the grid's thresholds are
+    candidates and ties go to the lowest one, which is exactly what the
+    labs' `threshold_finder()` did with `np.arange(0, 1, 0.001)`. Each grid
+    threshold is still looked up in the sweep rather than re-scored.
+
+    Args:
+        sweep:   (pd.DataFrame)  - Output of `threshold_sweep()`
+        metric:  (string)        - A column of `sweep`, e.g. 'recall'
+        desired: (float)         - The value you want `metric` to have
+        grid:    (array-like)    - Candidate thresholds, ascending (default:
+                                   every distinct score)
+    Returns:
+        threshold, score: (tuple) - The threshold and its exact metric value
+    '''
+    if grid is None:
+        idx = int(np.argmin(np.abs(sweep[metric].to_numpy() - desired)))
+        row = sweep.iloc[idx]
+        return row['threshold'], row[metric]
+
+    grid = np.asarray(grid, dtype=float)
+    values = metric_at(sweep, metric, grid)
+    idx = int(np.argmin(np.abs(values - desired)))
+    return grid[idx], values[idx]
+
+
+def metric_at(sweep, metric, thresholds):
+    '''
+    Reads `metric` off the sweep at arbitrary thresholds, predicting 1
+    wherever score >= threshold.
+
+    Thresholds above every score flag nothing. There, precision, recall and
+    F-beta are 0 (as scikit-learn's scorers report them) and other metrics
+    are NaN.
+
+    Args:
+        sweep:      (pd.DataFrame)  - Output of `threshold_sweep()`
+        metric:     (string)        - A column of `sweep`
+        thresholds: (array-like)    - Thresholds to evaluate
+    Returns:
+        values:     (np.ndarray)    - `metric` at each threshold
+    '''
+    ascending = sweep['threshold'].to_numpy()[::-1]
+    # Number of distinct scores >= each threshold; the sweep row for the
+    # lowest of them flags exactly the scores >= the threshold
+    flagged = ascending.size - np.searchsorted(ascending, np.asarray(thresholds, dtype=float))
+    empty = 0.0 if metric in ('precision', 'recall', 'f_beta') else np.nan
+    values = np.r_[sweep[metric].to_numpy(dtype=float), empty]
+    return values[np.where(flagged > 0, flagged - 1, -1)]
@@ -0,0 +1,214 @@
+'''
+TikTok claim features with sparse n-gram counts.
+
+The Course 6 TikTok lab tallies transcription n-grams with CountVectorizer,
+then densifies the counts with `.toarray()`, wraps them in a DataFrame and
+concatenates them onto the other features, once for each of the train,
+validation and test sets. Each copy is rows × n-grams, mostly zeros, which
+is why the lab keeps only the 15 most frequent n-grams.
+
+`ngram_features()` returns a ColumnTransformer that does the same in one
+step and keeps the result sparse: the n-gram counts and the remaining
+(numeric and dummy) columns are stacked into one CSR matrix. RandomForest
+and XGBoost both fit on CSR input directly, so thousands of n-grams cost
+memory in proportion to the n-grams that actually occur. (scikit-learn's
+sparse tree splitter is slower than its dense one, so with only a few dozen
+n-grams a random forest still fits faster on the dense matrix.)
+
+    ngrams = ngram_features(max_features=5000)
+    X_train_final = ngrams.fit_transform(X_train)
+    X_val_final = ngrams.transform(X_val)
+    rf.fit(X_train_final, y_train)
+
+Column names come from `ngrams.get_feature_names_out()`: the n-grams first,
+then the other columns in their original order.
+
+`ngram_features(hash_features=2**18)` hashes the n-grams into a fixed
+number of columns instead (`ParallelHashingVectorizer`). Hashing needs no
+vocabulary, so nothing has to be learned from the training text, memory
+does not grow with the number of distinct n-grams, and chunks of text can
+be tokenized in parallel worker processes. The vectorizer starts its pool
+once and reuses it for every transform; small inputs are tokenized in the
+calling process. `iter_transform()` featurizes a stream of new
+transcriptions block by block with a bounded number of chunks in flight.
+The columns are hash buckets rather than named n-grams, and distinct
+n-grams occasionally share one.
+
+XGBoost reads the entries a sparse matrix leaves out as missing rather than
+as 0. Trees learn which way missing values go at each split, so this only
+changes results where a split would separate zeros from the smallest
+non-zero values differently.
+'''
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+import numpy as np
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.compose import ColumnTransformer
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+
+
+TEXT_COLUMN = 'video_transcription_text'
+
+
+def _hash_chunk(vectorizer, texts):
+    return vectorizer.transform(texts)
+
+
+def _chunks(texts, chunk_size):
+    texts = iter(texts)
+    while True:
+        chunk = list(islice(texts, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ParallelHashingVectorizer(BaseEstimator, TransformerMixin):
+    '''
+    Hashes the n-grams of each text into a fixed number of count columns,
+    tokenizing chunks of texts in a pool of worker processes.
+
+    Stateless: `fit()` learns nothing, and the output for a text never
+    depends on the other texts. The result equals scikit-learn's
+    HashingVectorizer with the same settings (with `alternate_sign=False`
+    and no normalization, so each column is a plain count).
+
+    The worker pool is started on the first parallel transform and reused by
+    later ones, until `close()` is called or the vectorizer is garbage
+    collected. It is not pickled or cloned with the vectorizer.
+
+    Args:
+        n_features:        (int)    - Number of hash buckets (columns)
+        ngram_range:       (tuple)  - Shortest and longest n-grams, in words
+        stop_words:        (string) - As in CountVectorizer
+        chunk_size:        (int)    - Texts per task sent to a worker
+        n_jobs:            (int)    - Worker processes (default: one per
+                                      CPU). 1 tokenizes in this process.
+        min_parallel_rows: (int)    - Inputs with fewer texts than this are
+                                      tokenized in this process, where
+                                      sending them to workers would cost
+                                      more than it saves
+    '''
+
+    def __init__(self, n_features=2**18, ngram_range=(2, 3), stop_words='english',
+                 chunk_size=5_000, n_jobs=None, min_parallel_rows=20_000):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.stop_words = stop_words
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self.min_parallel_rows = min_parallel_rows
+
+    def _vectorizer(self):
+        return HashingVectorizer(n_features=self.n_features, ngram_range=tuple(self.ngram_range),
+                                 stop_words=self.stop_words, alternate_sign=False, norm=None,
+                                 dtype=np.float32)
+
+    def _workers(self):
+        return self.n_jobs or os.cpu_count() or 1
+
+    def _pool(self, workers):
+        executor = self.__dict__.get('_executor')
+        if executor is not None and self._executor_workers != workers:
+            self.close()
+            executor = None
+        if executor is None:
+            executor = self._executor = ProcessPoolExecutor(max_workers=workers)
+            self._executor_workers = workers
+        return executor
+
+    def close(self):
+        '''
+        Shuts the worker pool down. A later transform starts a new one.
+        '''
+        executor = self.__dict__.pop('_executor', None)
+        if executor is not None:
+            executor.shutdown()
+
+    def __del__(self):
+        self.close()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('_executor', None)
+        state.pop('_executor_workers', None)
+        return state
+
+    def fit(self, X=None, y=None):
+        return self
+
+    def get_feature_names_out(self, input_features=None):
+        return np.array([f'hash{i}' for i in range(self.n_features)], dtype=object)
+
+    def transform(self, X):
+        '''
+        Returns the CSR count matrix of an iterable of texts.
+        '''
+        blocks = list(self.iter_transform(X))
+        if not blocks:
+            return sparse.csr_matrix((0, self.n_features), dtype=np.float32)
+        return sparse.vstack(blocks, format='csr')
+
+    def iter_transform(self, texts):
+        '''
+        Yields one CSR block per `chunk_size` texts, in order, as the texts
+        arrive. `texts` can be any iterable, such as a generator reading new
+        transcriptions, and at most two chunks per worker are in flight.
+        '''
+        vectorizer = self._vectorizer()
+        workers = self._workers()
+        texts = iter(texts)
+        # Read up to min_parallel_rows texts first: a shorter input is
+        # tokenized here without involving the pool
+        head = list(islice(texts, self.min_parallel_rows)) if workers > 1 else []
+        if workers == 1 or len(head) < self.min_parallel_rows:
+            for chunk in _chunks(chain(head, texts), self.chunk_size):
+                yield vectorizer.transform(chunk)
+            return
+        executor = self._pool(workers)
+        pending = deque()
+        for chunk in _chunks(chain(head, texts), self.chunk_size):
+            pending.append(executor.submit(_hash_chunk, vectorizer, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def ngram_features(max_features=15, ngram_range=(2, 3), min_df=1, stop_words='english',
+                   hash_features=None, n_jobs=None, text_column=TEXT_COLUMN):
+    '''
+    Builds the lab's n-gram features as a sparse column transformer.
+
+    Args:
+        max_features:  (int)    - Keep the most frequent n-grams in the
+                                  training text (None for all of them)
+        ngram_range:   (tuple)  - Shortest and longest n-grams, in words
+        min_df:        (int)    - Drop n-grams found in fewer documents
+        stop_words:    (string) - As in CountVectorizer
+        hash_features: (int)    - If set, hash the n-grams into this many
+                                  columns with ParallelHashingVectorizer
+                                  instead of learning a vocabulary
+                                  (max_features and min_df are then unused)
+        n_jobs:        (int)    - Worker processes for hashing
+        text_column:   (string) - Column holding the text
+    Returns:
+        transformer: (ColumnTransformer) - Returns a CSR matrix from
+                                           `fit_transform()` and `transform()`
+    '''
+    if hash_features is not None:
+        counts = ParallelHashingVectorizer(n_features=hash_features, ngram_range=ngram_range,
+                                           stop_words=stop_words, n_jobs=n_jobs)
+    else:
+        counts = CountVectorizer(ngram_range=tuple(ngram_range), max_features=max_features,
+                                 min_df=min_df, stop_words=stop_words, dtype=np.float32)
+    return ColumnTransformer([('ngrams', counts, text_column)],
+                             remainder='passthrough',
+                             # Always stack sparse, however dense the result
+                             sparse_threshold=1.0,
+                             verbose_feature_names_out=False)
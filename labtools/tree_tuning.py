@@ -0,0 +1,370 @@
+'''
+Depth-cap and cost-complexity tuning for decision trees with few refits.
+
+A tree grown with `max_depth=d` is the top `d` levels of the tree grown with
+no depth limit, and a tree pruned with `ccp_alpha=a` is a subtree of the
+unpruned one. So instead of regrowing a tree for every grid point,
+`TreePathSearchCV` grows one full tree per fold (and per value of any other
+hyperparameter in the grid), then scores every `max_depth` / `ccp_alpha`
+pair by walking each validation row down that tree and stopping where the
+capped or pruned tree would have had its leaf.
+
+The path scores only screen the grid. Where a node has two candidate splits
+with exactly equal impurity improvement (common with dummy-encoded
+features), scikit-learn keeps the first one in a random feature order. That
+order comes from one random stream consumed node by node, so a capped fit,
+which stops splitting early, draws different orders further down than the
+one deep tree does, and picks different splits. Screened mean scores then
+differ from `GridSearchCV`'s by up to a few thousandths.
+
+So the leading candidates are refitted fold by fold, exactly as
+`GridSearchCV` fits them: first the best screened candidate, then every
+candidate screened within `margin` of the lowest refitted score, until no
+more qualify. The refitted candidates are the top of the ranking, and
+`best_params_`, `best_score_` and their `rank_test_*` entries match
+`GridSearchCV`'s as long as no screened score is off by more than `margin`.
+`confirmed_` marks them; the rest of `cv_results_` keeps the screened scores.
+'''
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import ParameterGrid, check_cv
+
+
+# Keys handled by re-scoring a fitted tree rather than by fitting a new one
+PATH_PARAMS = ('max_depth', 'ccp_alpha')
+
+LABEL_METRICS = ('accuracy', 'precision', 'recall', 'f1')
+PROBA_METRICS = ('roc_auc',)
+
+
+def label_scores(y_true, preds):
+    '''
+    Computes accuracy, precision, recall and F1 for {0, 1} labels.
+
+    Matches the scikit-learn scorers of the same names (positive label 1,
+    undefined ratios scored as 0) without their per-call validation overhead,
+    which dominates when thousands of variants are scored.
+
+    Args:
+        y_true: (np.ndarray)  - True {0, 1} labels
+        preds:  (np.ndarray)  - Predicted {0, 1} labels
+    Returns:
+        scores: (dict)  - Maps each metric name to its score
+    '''
+    actual = y_true == 1
+    flagged = preds == 1
+    tp = np.count_nonzero(actual & flagged)
+    n_flagged = np.count_nonzero(flagged)
+    n_actual = np.count_nonzero(actual)
+    precision = tp / n_flagged if n_flagged else 0.0
+    recall = tp / n_actual if n_actual else 0.0
+    f1 = 2 * tp / (n_flagged + n_actual) if n_flagged + n_actual else 0.0
+    return {'accuracy': np.count_nonzero(actual == flagged) / y_true.size,
+            'precision': precision,
+            'recall': recall,
+            'f1': f1,
+            }
+
+
+def node_depths(tree):
+    '''
+    Returns the depth of every node of a fitted sklearn tree.
+
+    Args:
+        tree: (DecisionTreeClassifier)  - A fitted tree
+    Returns:
+        depth: (np.ndarray)  - Depth of each node (the root has depth 0)
+    '''
+    t = tree.tree_
+    depth = np.zeros(t.node_count, dtype=np.int64)
+    frontier = np.array([0])
+    level = 0
+    while frontier.size:
+        depth[frontier] = level
+        internal = frontier[t.children_left[frontier] != -1]
+        frontier = np.concatenate([t.children_left[internal],
+                                   t.children_right[internal]])
+        level += 1
+    return depth
+
+
+def padded_paths(tree, X, max_depth):
+    '''
+    Returns each row's root-to-leaf path as a fixed-width array of node ids.
+
+    Column `d` holds the node the row reaches at depth `d`. Paths shorter
+    than `max_depth` are padded by repeating their leaf.
+
+    Args:
+        tree:      (DecisionTreeClassifier)  - A fitted tree
+        X:         (array-like)              - Rows to route through the tree
+        max_depth: (int)                     - Depth of the deepest leaf
+    Returns:
+        paths: (np.ndarray)  - Array of shape (n_rows, max_depth + 1)
+    '''
+    indicator = tree.decision_path(X).tocsr()
+    indicator.sort_indices()
+    indptr = indicator.indptr
+    lengths = np.diff(indptr)
+    # Node ids increase along every path, so sorted CSR indices are already
+    # in root-to-leaf order.
+    steps = np.minimum(np.arange(max_depth + 1)[None, :], lengths[:, None] - 1)
+    return indicator.indices[indptr[:-1, None] + steps]
+
+
+def terminal_nodes(tree, depth, caps, alphas):
+    '''
+    Marks which nodes are leaves of the capped-and-pruned subtree.
+
+    Minimal cost-complexity pruning is solved bottom-up: a node is collapsed
+    into a leaf whenever its own risk plus `alpha` is no worse than the
+    cheapest cost of its two children. A node at depth `cap` is always a leaf.
+
+    Args:
+        tree:   (DecisionTreeClassifier)  - A fitted, unpruned tree
+        depth:  (np.ndarray)              - Output of `node_depths(tree)`
+        caps:   (np.ndarray)              - Depth caps (np.inf for no cap)
+        alphas: (np.ndarray)              - ccp_alpha values
+    Returns:
+        terminal: (np.ndarray)  - Boolean array (n_nodes, n_caps, n_alphas)
+    '''
+    t = tree.tree_
+    weights = t.weighted_n_node_samples
+    risk = weights / weights[0] * t.impurity
+    shape = (t.node_count, caps.size, alphas.size)
+    cost = np.zeros(shape)
+    terminal = np.zeros(shape, dtype=bool)
+
+    for level in range(int(depth.max()), -1, -1):
+        nodes = np.flatnonzero(depth == level)
+        left = t.children_left[nodes]
+        right = t.children_right[nodes]
+        is_leaf = left == -1
+        leaf_cost = np.broadcast_to(risk[nodes, None, None] + alphas[None, None, :],
+                                    (nodes.size,) + shape[1:])
+        # Leaves have no children; point them at themselves, the result is
+        # discarded by the `prune` mask below.
+        left = np.where(is_leaf, nodes, left)
+        right = np.where(is_leaf, nodes, right)
+        child_cost = cost[left] + cost[right]
+        prune = (is_leaf[:, None, None]
+                 | (caps[None, :, None] <= level)
+                 | (leaf_cost <= child_cost))
+        cost[nodes] = np.where(prune, leaf_cost, child_cost)
+        terminal[nodes] = prune
+    return terminal
+
+
+def path_scores(tree, X_val, y_val, caps, alphas, scoring):
+    '''
+    Scores every (depth cap, ccp_alpha) variant of one fitted tree.
+
+    Args:
+        tree:    (DecisionTreeClassifier)  - A fitted, unpruned tree
+        X_val:   (array-like)              - Validation features
+        y_val:   (array-like)              - Validation labels
+        caps:    (np.ndarray)              - Depth caps (np.inf for no cap)
+        alphas:  (np.ndarray)              - ccp_alpha values
+        scoring: (list of strings)         - Metric names
+    Returns:
+        scores: (dict)  - Maps each metric to an array (n_caps, n_alphas)
+    '''
+    y_val = np.asarray(y_val)
+    depth = node_depths(tree)
+    paths = padded_paths(tree, X_val, int(depth.max()))
+    terminal = terminal_nodes(tree, depth, caps, alphas)
+    value = tree.tree_.value[:, 0, :]
+    proba = value / value.sum(axis=1, keepdims=True)
+    rows = np.arange(paths.shape[0])
+
+    scores = {name: np.empty((caps.size, alphas.size)) for name in scoring}
+    for ci in range(caps.size):
+        for ai in range(alphas.size):
+            # The row's leaf is the first terminal node on its path
+            stop = np.argmax(terminal[paths, ci, ai], axis=1)
+            leaf = paths[rows, stop]
+            preds = tree.classes_[np.argmax(value[leaf], axis=1)]
+            labels = label_scores(y_val, preds)
+            for name in scoring:
+                if name == 'roc_auc':
+                    scores[name][ci, ai] = roc_auc_score(y_val, proba[leaf, 1])
+                else:
+                    scores[name][ci, ai] = labels[name]
+    return scores
+
+
+def fold_scores(estimator, params, X, y, splits, scoring):
+    '''
+    Scores one candidate the way `GridSearchCV` does, with a fresh fit per fold.
+
+    Args:
+        estimator: (DecisionTreeClassifier)  - Unfitted base estimator
+        params:    (dict)                    - The candidate's hyperparameters
+        X, y:      (np.ndarray)              - Training features and labels
+        splits:    (list)                    - (train, validation) index pairs
+        scoring:   (list of strings)         - Metric names
+    Returns:
+        scores: (dict)  - Maps each metric to an array with one score per fold
+    '''
+    scores = {name: np.empty(len(splits)) for name in scoring}
+    for k, (train_idx, val_idx) in enumerate(splits):
+        tree = clone(estimator).set_params(**params).fit(X[train_idx], y[train_idx])
+        labels = label_scores(y[val_idx], tree.predict(X[val_idx]))
+        for name in scoring:
+            if name == 'roc_auc':
+                scores[name][k] = roc_auc_score(y[val_idx], tree.predict_proba(X[val_idx])[:, 1])
+            else:
+                scores[name][k] = labels[name]
+    return scores
+
+
+class TreePathSearchCV:
+    '''
+    `GridSearchCV` over decision-tree grids, screened from one tree per fold
+    (see the module docstring).
+
+    Exposes the same `cv_results_`, `best_index_`, `best_params_`,
+    `best_score_` and `best_estimator_` attributes, so helpers written
+    against a fitted `GridSearchCV` (such as the labs' `make_results()`) work
+    unchanged. Only one tree is fitted per fold for each combination of the
+    grid's non-path hyperparameters to screen `max_depth` and `ccp_alpha`;
+    the leading candidates are then refitted. `confirmed_` is a boolean array
+    over the candidates marking the refitted ones.
+
+    Args:
+        estimator:  (DecisionTreeClassifier)  - Unfitted base estimator
+        param_grid: (dict)              - Grid in `GridSearchCV` format
+        scoring:    (string or list)    - Metric name(s): accuracy, precision,
+                                          recall, f1, roc_auc
+        cv:         (int or splitter)   - As in `GridSearchCV`
+        refit:      (string or bool)    - Metric used to pick and refit the
+                                          best candidate. As in `GridSearchCV`,
+                                          False skips the refit, and with
+                                          several metrics also leaves the
+                                          `best_*` attributes unset and
+                                          confirms no candidate.
+        margin:     (float)             - How far below the lowest refitted
+                                          score a screened candidate must be
+                                          to be left unconfirmed
+    '''
+
+    def __init__(self, estimator, param_grid, scoring='accuracy', cv=5, refit=True,
+                 margin=0.005):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.scoring = scoring
+        self.cv = cv
+        self.refit = refit
+        self.margin = margin
+
+    def _metrics(self):
+        scoring = [self.scoring] if isinstance(self.scoring, str) else sorted(self.scoring)
+        unknown = set(scoring) - set(LABEL_METRICS) - set(PROBA_METRICS)
+        if unknown:
+            raise ValueError(f'Unsupported metric(s): {sorted(unknown)}')
+        if isinstance(self.refit, str):
+            if self.refit not in scoring:
+                raise ValueError(f'refit metric {self.refit!r} is not in scoring')
+            refit_metric = self.refit
+        elif not isinstance(self.refit, bool):
+            raise ValueError('refit must be a metric name, True or False')
+        elif len(scoring) == 1:
+            refit_metric = scoring[0]
+        elif not self.refit:
+            # Nothing to pick the best candidate by
+            refit_metric = None
+        else:
+            raise ValueError('refit must name a metric (or be False) when scoring has several')
+        return scoring, refit_metric
+
+    def fit(self, X, y):
+        scoring, refit_metric = self._metrics()
+        base = self.estimator.get_params()
+        caps_grid = list(self.param_grid.get('max_depth', [base['max_depth']]))
+        alpha_grid = list(self.param_grid.get('ccp_alpha', [base['ccp_alpha']]))
+        caps = np.array([np.inf if c is None else c for c in caps_grid], dtype=float)
+        alphas = np.array(alpha_grid, dtype=float)
+        other_grid = ParameterGrid({k: v for k, v in self.param_grid.items()
+                                    if k not in PATH_PARAMS})
+
+        cv = check_cv(self.cv, y, classifier=True)
+        splits = list(cv.split(X, y))
+        X_arr = X.to_numpy() if isinstance(X, pd.DataFrame) else np.asarray(X)
+        y_arr = np.asarray(y)
+        if not set(np.unique(y_arr)) <= {0, 1}:
+            raise ValueError('TreePathSearchCV expects binary {0, 1} labels')
+
+        # scores[(other params)][metric] -> array (n_splits, n_caps, n_alphas)
+        scores = {}
+        for other in other_grid:
+            key = tuple(sorted(other.items()))
+            per_fold = {name: [] for name in scoring}
+            for train_idx, val_idx in splits:
+                tree = clone(self.estimator).set_params(max_depth=None, ccp_alpha=0.0,
+                                                        **other)
+                tree.fit(X_arr[train_idx], y_arr[train_idx])
+                fold = path_scores(tree, X_arr[val_idx], y_arr[val_idx],
+                                   caps, alphas, scoring)
+                for name in scoring:
+                    per_fold[name].append(fold[name])
+            scores[key] = {name: np.stack(per_fold[name]) for name in scoring}
+
+        # Lay the results out in the same candidate order as GridSearchCV
+        candidates = list(ParameterGrid(self.param_grid))
+        results = {'params': candidates}
+        for param in sorted(self.param_grid):
+            results['param_' + param] = np.array([c[param] for c in candidates],
+                                                 dtype=object)
+        split_scores = {name: np.empty((len(candidates), len(splits))) for name in scoring}
+        for i, cand in enumerate(candidates):
+            key = tuple(sorted((k, v) for k, v in cand.items() if k not in PATH_PARAMS))
+            ci = caps_grid.index(cand.get('max_depth', base['max_depth']))
+            ai = alpha_grid.index(cand.get('ccp_alpha', base['ccp_alpha']))
+            for name in scoring:
+                split_scores[name][i] = scores[key][name][:, ci, ai]
+
+        # Refit the leading candidates fold by fold, until every candidate
+        # screened within `margin` of the lowest refitted score is refitted too
+        confirmed = np.zeros(len(candidates), dtype=bool)
+        while refit_metric is not None:
+            means = split_scores[refit_metric].mean(axis=1)
+            floor = means[confirmed].min() if confirmed.any() else means.max()
+            pending = np.flatnonzero(~confirmed & (means >= floor - self.margin))
+            if not pending.size:
+                break
+            for i in pending:
+                fold = fold_scores(self.estimator, candidates[i], X_arr, y_arr, splits, scoring)
+                for name in scoring:
+                    split_scores[name][i] = fold[name]
+            confirmed[pending] = True
+
+        for name in scoring:
+            for k in range(len(splits)):
+                results[f'split{k}_test_{name}'] = split_scores[name][:, k]
+            results[f'mean_test_{name}'] = split_scores[name].mean(axis=1)
+            results[f'std_test_{name}'] = split_scores[name].std(axis=1)
+            results[f'rank_test_{name}'] = pd.Series(
+                results[f'mean_test_{name}']).rank(method='min', ascending=False
+                                                   ).to_numpy(dtype=np.int32)
+
+        self.cv_results_ = results
+        self.confirmed_ = confirmed
+        self.n_splits_ = len(splits)
+        if refit_metric is None:
+            return self
+        self.best_index_ = int(np.flatnonzero(results[f'rank_test_{refit_metric}'] == 1)[0])
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = results[f'mean_test_{refit_metric}'][self.best_index_]
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+            self.best_estimator_.fit(X, y)
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
@@ -0,0 +1,187 @@
+'''
+Waze churn features, shared by the Waze labs and the scoring service.
+
+`WazeFeatures` derives every engineered feature from the Course 5 and
+Course 6 Waze labs in one pass over the raw columns. Each feature is written
+straight into a preallocated float32 matrix, and zero denominators are
+handled as the features are computed instead of by separate `== np.inf`
+fix-ups. It follows the sklearn fit/transform protocol, so the transformer
+fitted in a lab can be pickled and reused unchanged at inference time.
+
+`lab_features()` keeps the labs' original column-by-column code path as a
+reference, and `benchmark()` compares the two.
+'''
+
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+# Raw columns of waze_dataset.csv that the models consume, in file order
+RAW_COLUMNS = ['sessions', 'drives', 'total_sessions', 'n_days_after_onboarding',
+               'total_navigations_fav1', 'total_navigations_fav2', 'driven_km_drives',
+               'duration_minutes_drives', 'activity_days', 'driving_days', 'device']
+
+NUMERIC_COLUMNS = [c for c in RAW_COLUMNS if c != 'device']
+
+DERIVED_COLUMNS = ['km_per_driving_day', 'percent_sessions_in_last_month',
+                   'professional_driver', 'total_sessions_per_day', 'km_per_hour',
+                   'km_per_drive', 'percent_of_drives_to_favorite', 'device2']
+
+# Column order of `X` in the Course 6 lab
+MODEL_COLUMNS = NUMERIC_COLUMNS + DERIVED_COLUMNS
+
+# Columns the Course 5 lab caps at their 95th percentile
+COURSE5_CLIP_COLUMNS = ['sessions', 'drives', 'total_sessions', 'total_navigations_fav1',
+                        'total_navigations_fav2', 'driven_km_drives', 'duration_minutes_drives']
+
+
+def _ratio(numerator, denominator, out):
+    # Rows with a zero denominator get 0 rather than inf or NaN
+    out[:] = 0
+    np.divide(numerator, denominator, out=out, where=denominator != 0, casting='unsafe')
+
+
+class WazeFeatures(BaseEstimator, TransformerMixin):
+    '''
+    Builds the Waze model matrix from raw user records in a single pass.
+
+    Args:
+        derived:       (list)   - Engineered features to add, a subset of
+                                  DERIVED_COLUMNS (default: all of them)
+        passthrough:   (list)   - Raw numeric columns to keep (default: all)
+        clip_quantile: (float)  - If set, `fit()` learns this quantile of each
+                                  column in `clip_columns`, and `transform()`
+                                  caps the passed-through values at it
+        clip_columns:  (list)   - Columns to cap (default: the Course 5 list)
+        output:        (string) - 'frame' for a float32 DataFrame, 'array'
+                                  for the bare float32 matrix
+
+    Ratios are computed from the unclipped raw values, as in the Course 5 lab.
+    Any ratio with a zero denominator is 0. The labs only patched the
+    `inf` values of km_per_driving_day and km_per_drive and left NaN and inf
+    elsewhere (which XGBoost rejects).
+    '''
+
+    def __init__(self, derived=None, passthrough=None, clip_quantile=None,
+                 clip_columns=None, output='frame'):
+        self.derived = derived
+        self.passthrough = passthrough
+        self.clip_quantile = clip_quantile
+        self.clip_columns = clip_columns
+        self.output = output
+
+    def fit(self, X, y=None):
+        self.derived_ = list(DERIVED_COLUMNS if self.derived is None else self.derived)
+        unknown = set(self.derived_) - set(DERIVED_COLUMNS)
+        if unknown:
+            raise ValueError(f'Unknown derived features: {sorted(unknown)}')
+        self.passthrough_ = list(NUMERIC_COLUMNS if self.passthrough is None else self.passthrough)
+        self.feature_names_out_ = np.array(self.passthrough_ + self.derived_, dtype=object)
+
+        self.clip_values_ = {}
+        if self.clip_quantile is not None:
+            columns = COURSE5_CLIP_COLUMNS if self.clip_columns is None else self.clip_columns
+            for column in columns:
+                if column in self.passthrough_:
+                    self.clip_values_[column] = float(X[column].quantile(self.clip_quantile))
+        return self
+
+    def get_feature_names_out(self, input_features=None):
+        return self.feature_names_out_
+
+    def transform(self, X):
+        n = len(X)
+        col = {c: X[c].to_numpy(dtype=np.float64) for c in NUMERIC_COLUMNS if c in X}
+        # Column-major, so every feature is a contiguous run that pandas can
+        # wrap as a single float32 block without copying
+        out = np.empty((n, self.feature_names_out_.size), dtype=np.float32, order='F')
+        position = {name: i for i, name in enumerate(self.feature_names_out_)}
+
+        for name in self.passthrough_:
+            values = col[name]
+            if name in self.clip_values_:
+                values = np.minimum(values, self.clip_values_[name])
+            out[:, position[name]] = values
+
+        wanted = set(self.derived_)
+        if 'km_per_driving_day' in wanted:
+            _ratio(col['driven_km_drives'], col['driving_days'],
+                   out[:, position['km_per_driving_day']])
+        if 'percent_sessions_in_last_month' in wanted:
+            _ratio(col['sessions'], col['total_sessions'],
+                   out[:, position['percent_sessions_in_last_month']])
+        if 'professional_driver' in wanted:
+            out[:, position['professional_driver']] = (col['drives'] >= 60) & (col['driving_days'] >= 15)
+        if 'total_sessions_per_day' in wanted:
+            _ratio(col['total_sessions'], col['n_days_after_onboarding'],
+                   out[:, position['total_sessions_per_day']])
+        if 'km_per_hour' in wanted:
+            _ratio(col['driven_km_drives'], col['duration_minutes_drives'] / 60,
+                   out[:, position['km_per_hour']])
+        if 'km_per_drive' in wanted:
+            _ratio(col['driven_km_drives'], col['drives'], out[:, position['km_per_drive']])
+        if 'percent_of_drives_to_favorite' in wanted:
+            _ratio(col['total_navigations_fav1'] + col['total_navigations_fav2'],
+                   col['total_sessions'], out[:, position['percent_of_drives_to_favorite']])
+        if 'device2' in wanted:
+            out[:, position['device2']] = X['device'].to_numpy() != 'Android'
+
+        if self.output == 'array':
+            return out
+        return pd.DataFrame(out, columns=self.feature_names_out_, index=X.index, copy=False)
+
+
+def lab_features(df):
+    '''
+    The Course 6 lab's feature engineering, cell by cell, for comparison.
+
+    Args:
+        df: (pd.DataFrame)  - Raw Waze records
+    Returns:
+        X:  (pd.DataFrame)  - Model features in MODEL_COLUMNS order
+    '''
+    df = df.copy()
+    df['km_per_driving_day'] = df['driven_km_drives'] / df['driving_days']
+    df.loc[df['km_per_driving_day']==np.inf, 'km_per_driving_day'] = 0
+    df['percent_sessions_in_last_month'] = df['sessions'] / df['total_sessions']
+    df['professional_driver'] = np.where((df['drives'] >= 60) & (df['driving_days'] >= 15), 1, 0)
+    df['total_sessions_per_day'] = df['total_sessions'] / df['n_days_after_onboarding']
+    df['km_per_hour'] = df['driven_km_drives'] / (df['duration_minutes_drives'] / 60)
+    df['km_per_drive'] = df['driven_km_drives'] / df['drives']
+    df.loc[df['km_per_drive']==np.inf, 'km_per_drive'] = 0
+    df['percent_of_drives_to_favorite'] = (
+        df['total_navigations_fav1'] + df['total_navigations_fav2']) / df['total_sessions']
+    df['device2'] = np.where(df['device']=='Android', 0, 1)
+    return df[MODEL_COLUMNS]
+
+
+def benchmark(df, repeats=5):
+    '''
+    Times `lab_features()` against `WazeFeatures().transform()`.
+
+    Args:
+        df:      (pd.DataFrame)  - Raw Waze records
+        repeats: (int)           - Timed runs per code path (median kept)
+    Returns:
+        table: (pd.DataFrame)  - Median time in ms and output size in MB
+    '''
+    transformer = WazeFeatures().fit(df)
+    paths = {'lab_features': lambda: lab_features(df),
+             'WazeFeatures': lambda: transformer.transform(df),
+             }
+    records = []
+    for name, func in paths.items():
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+        records.append({'code_path': name,
+                        'rows': len(df),
+                        'median_ms': float(np.median(times)) * 1000,
+                        'output_mb': result.memory_usage(index=False).sum() / 1e6,
+                        })
+    return pd.DataFrame(records)
@@ -0,0 +1,315 @@
+'''
+Grid search for XGBoost that quantizes each fold once.
+
+`GridSearchCV` around an `XGBClassifier` hands every candidate × fold a
+pandas slice, which XGBoost converts into a fresh matrix and re-quantizes
+(sketches each feature into histogram bins) before the first tree is grown.
+`XGBSearchCV` instead:
+    - builds one `QuantileDMatrix` per fold, with bin boundaries sketched
+      from that fold's training rows only (as `GridSearchCV` does, so no
+      validation rows leak into the bins), bins the fold's validation rows
+      against them, and reuses both matrices for every candidate
+    - grows one booster per fold for each combination of the grid's other
+      hyperparameters, and scores every `n_estimators` value from it by
+      predicting with the first `n` trees only
+    - optionally stops each booster early on its validation fold
+    - refits the best candidate on a matrix of the whole training set
+
+When the matrices would not fit in memory, the rows are fed to XGBoost in
+chunks and the quantized pages are cached on disk (XGBoost's external
+memory mode), so only one chunk of raw rows is held at a time.
+
+Scores equal `GridSearchCV`'s over the same grid and folds, and so does the
+refit model, unless `early_stopping_rounds` is set: then a booster stopped
+early scores its candidates with the trees it kept, and the refit uses the
+mean number of trees kept across folds. `early_stopping_rounds` is the one
+argument `GridSearchCV` does not take.
+
+In the labs it is a drop-in for `GridSearchCV`: same arguments, same
+`cv_results_` and `best_*` attributes, so `make_results()` and the
+`best_estimator_` evaluation cells run unchanged. The time saved grows with
+the number of `n_estimators` values in the grid (they share one booster per
+fold) and with the number of candidates (they share the fold matrices).
+'''
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import xgboost
+from sklearn.base import clone
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import ParameterGrid, check_cv
+
+from labtools.tree_tuning import LABEL_METRICS, PROBA_METRICS, label_scores
+
+
+# Bytes per row and feature held at once, besides one byte per fold for the
+# fold matrices: the float64 rows being binned, plus the full binned matrix
+# of the refit
+_BYTES_PER_CELL = 8 + 1
+
+
+def available_memory():
+    '''
+    Returns the memory available to new allocations in bytes (None if the
+    platform does not report it).
+    '''
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _take(X, rows):
+    if isinstance(X, (pd.DataFrame, pd.Series)):
+        return X.iloc[rows]
+    return X[rows]
+
+
+class _RowChunks(xgboost.DataIter):
+    '''
+    Feeds the given rows of X and y to XGBoost a chunk at a time, so an
+    external-memory matrix never needs all of them in memory at once.
+    '''
+
+    def __init__(self, X, y, rows, chunk_rows, cache_prefix):
+        self._X = X
+        self._y = y
+        self._rows = rows
+        self._chunk_rows = chunk_rows
+        self._start = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._start >= len(self._rows):
+            return False
+        rows = self._rows[self._start:self._start + self._chunk_rows]
+        input_data(data=_take(self._X, rows), label=self._y[rows])
+        self._start += self._chunk_rows
+        return True
+
+    def reset(self):
+        self._start = 0
+
+
+class XGBSearchCV:
+    '''
+    Drop-in replacement for `GridSearchCV` over `XGBClassifier` grids.
+
+    Exposes the same `cv_results_`, `best_index_`, `best_params_`,
+    `best_score_` and `best_estimator_` attributes as `GridSearchCV`, so the
+    labs' `make_results()` works unchanged. `cv_results_` also has a
+    `mean_n_rounds` entry: the number of trees each candidate was scored
+    with, averaged over folds (lower than `n_estimators` when a booster
+    stopped early).
+
+    Args:
+        estimator:             (XGBClassifier)    - Unfitted base estimator.
+                                                    `tree_method` must be 'hist'
+                                                    (the default) or 'approx'.
+        param_grid:            (dict)             - Grid in `GridSearchCV` format
+        scoring:               (string or list)   - Metric name(s): accuracy,
+                                                    precision, recall, f1, roc_auc
+        cv:                    (int or splitter)  - As in `GridSearchCV`
+        refit:                 (string or bool)   - Metric used to pick and
+                                                    refit the best candidate.
+                                                    As in `GridSearchCV`,
+                                                    False skips the refit,
+                                                    and with several metrics
+                                                    also leaves the `best_*`
+                                                    attributes unset.
+        early_stopping_rounds: (int)              - Stop a booster when its
+                                                    validation fold's
+                                                    `eval_metric` has not improved
+                                                    for this many rounds. The
+                                                    refit then uses the mean
+                                                    number of rounds kept.
+        external_memory:       (bool or 'auto')   - Cache the quantized matrices
+                                                    on disk. 'auto' does so when
+                                                    they would not fit in the
+                                                    available memory.
+        chunk_rows:            (int)              - Rows per chunk fed to
+                                                    external-memory matrices
+        cache_dir:             (string)           - Folder for the external
+                                                    memory cache (default: a
+                                                    temporary folder)
+    '''
+
+    def __init__(self, estimator, param_grid, scoring='accuracy', cv=5, refit=True,
+                 early_stopping_rounds=None, external_memory='auto', chunk_rows=100_000,
+                 cache_dir=None):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.scoring = scoring
+        self.cv = cv
+        self.refit = refit
+        self.early_stopping_rounds = early_stopping_rounds
+        self.external_memory = external_memory
+        self.chunk_rows = chunk_rows
+        self.cache_dir = cache_dir
+
+    def _metrics(self):
+        scoring = [self.scoring] if isinstance(self.scoring, str) else sorted(self.scoring)
+        unknown = set(scoring) - set(LABEL_METRICS) - set(PROBA_METRICS)
+        if unknown:
+            raise ValueError(f'Unsupported metric(s): {sorted(unknown)}')
+        if isinstance(self.refit, str):
+            if self.refit not in scoring:
+                raise ValueError(f'refit metric {self.refit!r} is not in scoring')
+            refit_metric = self.refit
+        elif not isinstance(self.refit, bool):
+            raise ValueError('refit must be a metric name, True or False')
+        elif len(scoring) == 1:
+            refit_metric = scoring[0]
+        elif not self.refit:
+            # Nothing to pick the best candidate by
+            refit_metric = None
+        else:
+            raise ValueError('refit must name a metric (or be False) when scoring has several')
+        return scoring, refit_metric
+
+    def _use_external_memory(self, X, n_splits):
+        if self.external_memory != 'auto':
+            return bool(self.external_memory)
+        available = available_memory()
+        if available is None:
+            return False
+        n_rows, n_features = X.shape
+        needed = n_rows * n_features * (_BYTES_PER_CELL + n_splits)
+        return needed > available
+
+    def _matrix(self, X, y, rows, max_bin, ref=None):
+        # The estimator's missing-value marker, which get_xgb_params() leaves out
+        missing = self.estimator.get_params().get('missing', np.nan)
+        if not self.external_memory_:
+            return xgboost.QuantileDMatrix(_take(X, rows), y[rows], max_bin=max_bin, ref=ref,
+                                           missing=missing)
+        self._n_caches += 1
+        prefix = os.path.join(self._cache_dir, f'matrix{self._n_caches}')
+        chunks = _RowChunks(X, y, rows, self.chunk_rows, prefix)
+        return xgboost.ExtMemQuantileDMatrix(chunks, max_bin=max_bin, ref=ref, missing=missing)
+
+    def _booster_params(self, params):
+        model = clone(self.estimator).set_params(**params)
+        booster_params = {k: v for k, v in model.get_xgb_params().items() if v is not None}
+        if booster_params.get('tree_method', 'hist') not in ('hist', 'approx'):
+            raise ValueError("XGBSearchCV needs tree_method='hist' or 'approx'")
+        return booster_params, model.get_num_boosting_rounds()
+
+    def fit(self, X, y):
+        scoring, refit_metric = self._metrics()
+        y_arr = np.asarray(y)
+        if not set(np.unique(y_arr)) <= {0, 1}:
+            raise ValueError('XGBSearchCV expects binary {0, 1} labels')
+        cv = check_cv(self.cv, y, classifier=True)
+        splits = list(cv.split(X, y_arr))
+        all_rows = np.arange(len(y_arr))
+
+        self.external_memory_ = self._use_external_memory(X, len(splits))
+        self._n_caches = 0
+        temporary = None
+        if self.external_memory_ and self.cache_dir is None:
+            temporary = tempfile.TemporaryDirectory(prefix='xgb_search_')
+            self._cache_dir = temporary.name
+        else:
+            self._cache_dir = self.cache_dir
+
+        try:
+            results, rounds = self._search(X, y_arr, splits, scoring)
+            candidates = results['params']
+            self.cv_results_ = results
+            self.n_splits_ = len(splits)
+            if refit_metric is not None:
+                self.best_index_ = int(np.flatnonzero(results[f'rank_test_{refit_metric}']
+                                                      == 1)[0])
+                self.best_params_ = candidates[self.best_index_]
+                self.best_score_ = results[f'mean_test_{refit_metric}'][self.best_index_]
+            if self.refit:
+                self.best_estimator_ = self._refit(X, y_arr, all_rows, rounds[self.best_index_])
+        finally:
+            if temporary is not None:
+                temporary.cleanup()
+        return self
+
+    def _search(self, X, y, splits, scoring):
+        # Fold matrices per max_bin, built on first use and shared by every
+        # candidate with that max_bin
+        folds = {}
+
+        def fold_matrices(max_bin):
+            if max_bin not in folds:
+                folds[max_bin] = []
+                for train_idx, val_idx in splits:
+                    # Bins come from the fold's training rows; the
+                    # validation rows are binned against them
+                    dtrain = self._matrix(X, y, train_idx, max_bin)
+                    dval = self._matrix(X, y, val_idx, max_bin, ref=dtrain)
+                    folds[max_bin].append((dtrain, dval))
+            return folds[max_bin]
+
+        candidates = list(ParameterGrid(self.param_grid))
+        # Candidates that differ only in n_estimators share their boosters
+        groups = {}
+        for i, cand in enumerate(candidates):
+            others = tuple(sorted((k, repr(v)) for k, v in cand.items() if k != 'n_estimators'))
+            groups.setdefault(others, []).append(i)
+
+        split_scores = {name: np.empty((len(candidates), len(splits))) for name in scoring}
+        split_rounds = np.empty((len(candidates), len(splits)))
+        for members in groups.values():
+            params = [self._booster_params(candidates[i]) for i in members]
+            booster_params = params[0][0]
+            max_rounds = max(n_rounds for _, n_rounds in params)
+            max_bin = booster_params.get('max_bin', 256)
+            for k, (dtrain, dval) in enumerate(fold_matrices(max_bin)):
+                evals = [(dval, 'validation')] if self.early_stopping_rounds else ()
+                booster = xgboost.train(booster_params, dtrain, max_rounds, evals=evals,
+                                        early_stopping_rounds=self.early_stopping_rounds,
+                                        verbose_eval=False)
+                kept = (booster.best_iteration + 1 if self.early_stopping_rounds
+                        else max_rounds)
+                y_val = y[splits[k][1]]
+                for i, (_, n_rounds) in zip(members, params):
+                    n_rounds = min(n_rounds, kept)
+                    proba = booster.predict(dval, iteration_range=(0, n_rounds))
+                    labels = label_scores(y_val, (proba > 0.5).astype(np.int64))
+                    for name in scoring:
+                        split_scores[name][i, k] = (roc_auc_score(y_val, proba)
+                                                    if name == 'roc_auc' else labels[name])
+                    split_rounds[i, k] = n_rounds
+
+        # Lay the results out in the same candidate order as GridSearchCV
+        results = {'params': candidates}
+        for param in sorted(self.param_grid):
+            results['param_' + param] = np.array([c[param] for c in candidates], dtype=object)
+        for name in scoring:
+            for k in range(len(splits)):
+                results[f'split{k}_test_{name}'] = split_scores[name][:, k]
+            results[f'mean_test_{name}'] = split_scores[name].mean(axis=1)
+            results[f'std_test_{name}'] = split_scores[name].std(axis=1)
+            results[f'rank_test_{name}'] = pd.Series(
+                results[f'mean_test_{name}']).rank(method='min', ascending=False
+                                                   ).to_numpy(dtype=np.int32)
+        results['mean_n_rounds'] = split_rounds.mean(axis=1)
+        return results, np.rint(split_rounds.mean(axis=1)).astype(int)
+
+    def _refit(self, X, y, all_rows, n_rounds):
+        booster_params, _ = self._booster_params(self.best_params_)
+        full = self._matrix(X, y, all_rows, booster_params.get('max_bin', 256))
+        booster = xgboost.train(booster_params, full, int(n_rounds))
+        model = clone(self.estimator).set_params(**self.best_params_)
+        model.set_params(n_estimators=int(n_rounds))
+        model.load_model(booster.save_raw('json'))
+        return model
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
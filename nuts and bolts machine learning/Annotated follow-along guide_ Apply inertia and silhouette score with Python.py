@@ -42,6 +42,8 @@ import pandas as pd
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
 from sklearn.preprocessing import StandardScaler
+
+from labtools.clustering import kmeans_scores
 ##################################################
 
 
@@ -161,6 +163,8 @@ print('Inertia: ', kmeans3.inertia_)
 # ## Evaluate inertia
 # 
 # This inertia value isn't helpful by itself. We need to compare the inertias of multiple _k_ values. To do this, we'll create a function that fits a K-means model for multiple values of _k_, calculates the inertia for each _k_ value, and appends it to a list.
+# 
+# **Note:** Written this way, the inertia and silhouette helpers each fit the same nine models. `kmeans_scores()` from `labtools.clustering` replaces both: it fits each _k_ once (with `random_state=42`, so the numbers are the same) and returns a table of inertia, silhouette score, Calinski-Harabasz index (higher is better) and Davies-Bouldin index (lower is better). The lists for the plots below are read from that table.
 
 # In[9]:
 
@@ -168,34 +172,16 @@ print('Inertia: ', kmeans3.inertia_)
 # Create a list from 2-10. 
 num_clusters = [i for i in range(2, 11)]
 
-def kmeans_inertia(num_clusters, x_vals):
-    '''
-    Fits a KMeans model for different values of k.
-    Calculates an inertia score for each k value.
-
-    Args:
-        num_clusters: (list of ints)  - The different k values to try
-        x_vals:       (array)         - The training data
-
-    Returns: 
-        inertia:      (list)          - A list of inertia scores, one for each \
-                                      value of k
-    '''
-
-    inertia = []
-    for num in num_clusters:
-        kms = KMeans(n_clusters=num, random_state=42)
-        kms.fit(x_vals)
-        inertia.append(kms.inertia_)
-    
-    return inertia
+# Fit and score each k once
+k_scores = kmeans_scores(num_clusters, X_scaled)
+k_scores
 
 
 # In[10]:
 
 
 # Calculate inertia for k=2-10
-inertia = kmeans_inertia(num_clusters, X_scaled)
+inertia = k_scores['inertia'].tolist()
 inertia
 
 
@@ -230,39 +216,13 @@ kmeans3_sil_score = silhouette_score(X_scaled, kmeans3.labels_)
 kmeans3_sil_score
 
 
-# It worked! However, this value isn't very useful if we have nothing to compare it to. Just as we did for inertia, we'll write a function that compares the silhouette score of each value of _k_, from 2 through 10.
+# It worked! However, this value isn't very useful if we have nothing to compare it to. Just as we did for inertia, we'll compare the silhouette score of each value of _k_, from 2 through 10. `kmeans_scores()` already computed them from the same models.
 
 # In[13]:
 
 
-def kmeans_sil(num_clusters, x_vals):
-    '''
-    Fits a KMeans model for different values of k.
-    Calculates a silhouette score for each k value
-
-    Args:
-        num_clusters: (list of ints)  - The different k values to try
-        x_vals:       (array)         - The training data
-
-    Returns: 
-        sil_score:    (list)          - A list of silhouette scores, one for each \
-                                      value of k
-    '''
-  
-    sil_score = []
-    for num in num_clusters:
-        kms = KMeans(n_clusters=num, random_state=42)
-        kms.fit(x_vals)
-        sil_score.append(silhouette_score(x_vals, kms.labels_))
-    
-    return sil_score
-
-
-# In[14]:
-
-
-# Calculate silhouette scores for k=2-10
-sil_score = kmeans_sil(num_clusters, X_scaled)
+# Silhouette scores for k=2-10
+sil_score = k_scores['silhouette'].tolist()
 sil_score
 
 
@@ -357,6 +317,8 @@ new_observation
 # `X_scaled = scaler.transform(X)`
 # 
 # then we could have reused `scaler` in this next step without having to assign it.
+# 
+# **Note:** To label many new observations (or a stream of them), save what prediction needs once, with `write_centroids('.', kmeans5, scaler, save_as='kmeans5')` from `labtools.clustering`. That's the scaler's mean and standard deviation and the five centroids. `read_centroids('.', 'kmeans5').assign(new_data)` then scales and assigns a whole batch with a single matrix product. It returns each row's cluster, its distance to that centroid, and the margin to the second-nearest centroid, with no `StandardScaler` or `KMeans` call per row.
 
 # In[21]:
 
@@ -72,6 +72,8 @@ from sklearn.ensemble import RandomForestClassifier
 # This module lets us save our models once we fit them.
 import pickle
 
+from labtools.instrument import stage
+
 
 # ## Read in the data
 
@@ -157,13 +159,27 @@ X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, strati
 # 
 # 5. Fit the data (`X_train`, `y_train`) to the `GridSearchCV` object (`rf_cv`).
 # 
-# Note that we use the `%%time` magic at the top of the cell. This outputs the final runtime of the cell. (Magic commands, often just called "magics," are commands that are built into IPython to simplify common tasks. They begin with `%` or `%%`.)
+# Note that we wrap the fit in `stage('fit')` from `labtools.instrument`. It replaces the `%%time` magic and also works outside Jupyter. In a notebook it prints the stage's wall time, CPU time, peak memory and row count when it finishes; set `LABTOOLS_STAGE_ECHO=1` to print them from a plain script too.
 # 
 
 # In[6]:
 
 
-get_ipython().run_cell_magic('time', '', "\nrf = RandomForestClassifier(random_state=0)\n\ncv_params = {'max_depth': [2,3,4,5, None], \n             'min_samples_leaf': [1,2,3],\n             'min_samples_split': [2,3,4],\n             'max_features': [2,3,4],\n             'n_estimators': [75, 100, 125, 150]\n             }  \n\nscoring = {'accuracy', 'precision', 'recall', 'f1'}\n\nrf_cv = GridSearchCV(rf, cv_params, scoring=scoring, cv=5, refit='f1')\n\n# rf_cv.fit(X_train, y_train)")
+rf = RandomForestClassifier(random_state=0)
+
+cv_params = {'max_depth': [2,3,4,5, None], 
+             'min_samples_leaf': [1,2,3],
+             'min_samples_split': [2,3,4],
+             'max_features': [2,3,4],
+             'n_estimators': [75, 100, 125, 150]
+             }  
+
+scoring = {'accuracy', 'precision', 'recall', 'f1'}
+
+rf_cv = GridSearchCV(rf, cv_params, scoring=scoring, cv=5, refit='f1')
+
+# with stage('fit', rows=len(X_train), model='rf_cv'):
+#     rf_cv.fit(X_train, y_train)
 
 
 # This is the end of the first video. The next video will continue from this point.
@@ -333,7 +349,7 @@ X_tr, X_val, y_tr, y_val = train_test_split(X_train, y_train, test_size=0.2,
 # 
 # To do this, we need to make a list of length `len(X_train)` where each element is either a 0 or -1. A 0 in index _i_ will indicate to `GridSearchCV` that index _i_ of `X_train` is to be held out for validation. A -1 at a given index will indicate that that index of `X_train` is to be used as training data. 
 # 
-# We'll make this list using a list comprehension that looks at the index number of each row in `X_train`. If that index number is in `X_val`'s list of index numbers, then the list comprehension appends a 0. If it's not, then it appends a -1.
+# We'll make this list by checking the index number of each row in `X_train`. If that index number is in `X_val`'s list of index numbers, the row gets a 0. If it's not, it gets a -1. A list comprehension like `[0 if x in X_val.index else -1 for x in X_train.index]` does this one row at a time; `validation_split_index()` does the same check for all rows at once with `Index.isin()`.
 # 
 # So if our training data is:  
 # [A, B, C, D],  
@@ -345,7 +361,8 @@ X_tr, X_val, y_tr, y_val = train_test_split(X_train, y_train, test_size=0.2,
 
 
 # Create list of split indices
-split_index = [0 if x in X_val.index else -1 for x in X_train.index]
+from labtools.splits import validation_split_index
+split_index = validation_split_index(X_train.index, X_val.index)
 
 
 # Now that we have this list, we need to import a new function called `PredefinedSplit`. This function is what allows us to pass the list we just made to `GridSearchCV`. (You can read more about this function in the [documentation](https://scikit-learn.org/stable/modules/generated/sklearn.model_selection.PredefinedSplit.html#sklearn.model_selection.PredefinedSplit).)
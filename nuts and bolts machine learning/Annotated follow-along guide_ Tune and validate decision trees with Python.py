@@ -69,6 +69,8 @@ from sklearn.tree import plot_tree
 from sklearn.metrics import ConfusionMatrixDisplay, confusion_matrix
 from sklearn.metrics import recall_score, precision_score, f1_score, accuracy_score
 
+from labtools.instrument import stage
+
 
 # ## Read in the data
 
@@ -427,7 +429,16 @@ scoring = {'accuracy', 'precision', 'recall', 'f1'}
 # In[19]:
 
 
-get_ipython().run_cell_magic('time', '', '# Instantiate the GridSearch\nclf = GridSearchCV(tuned_decision_tree, \n                   tree_para, \n                   scoring = scoring, \n                   cv=5, \n                   refit="f1")\n\n# Fit the model\nclf.fit(X_train, y_train)')
+# Instantiate the GridSearch
+clf = GridSearchCV(tuned_decision_tree, 
+                   tree_para, 
+                   scoring = scoring, 
+                   cv=5, 
+                   refit="f1")
+
+# Fit the model
+with stage('fit', rows=len(X_train), model='clf'):
+    clf.fit(X_train, y_train)
 
 
 # Now that the model is fit and cross-validated, we can use the `best_estimator_` attribute to inspect the hyperparameter values that yielded the highest F1 score during cross-validation.
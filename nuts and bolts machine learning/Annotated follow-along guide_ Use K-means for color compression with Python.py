@@ -39,10 +39,14 @@ import plotly.graph_objects as go
 
 from sklearn.cluster import KMeans
 
+from labtools.color import ColorQuantizer, ImageColors, pixel_cloud
+
 
 # ## Read in data
 # 
 # The "data" in this case is not a pandas dataframe. It's a photograph, which we'll convert into a numerical array.
+# 
+# **Note:** This photo is small, so it's fine to read the whole thing into memory, flatten it, and copy it into a dataframe. A photo with tens of millions of pixels is better handled in bands of rows with the tiled functions in `labtools.color`. `open_image()` decodes the photo once into a memory-mapped array on disk, `sample_pixels()` draws a random sample of pixels band by band to fit the palette, and `quantize_tiled()` writes the compressed photo band by band, on several threads, into another memory-mapped file. For example: `img = open_image(path)`, `quantizer = ColorQuantizer(n_colors=3).fit(sample_pixels(img))`, `new_img = quantize_tiled(quantizer, img, 'tulips_k3.npy')`. Memory then grows with the size of a band of rows, not the size of the photo.
 
 # In[2]:
 
@@ -94,21 +98,14 @@ img_flat_df.head()
 
 
 # **Note:** The following cell's output is viewable in two ways: You can re-run this cell, or manually convert the notebook to "Trusted." 
+# 
+# Plotting one marker per pixel (76,800 here, and tens of millions for a large photo) makes a huge, slow figure, and formatting a color string for every pixel in a Python loop is slow too. `pixel_cloud()` from `labtools.color` divides the RGB space into 32 × 32 × 32 cells instead, and draws one marker per cell that contains pixels. Each marker sits at the mean color of its pixels, is drawn in that color, and is sized by how many pixels it holds.
 
 # In[7]:
 
 
-# Create 3D plot where each pixel in the `img` is displayed in its actual color
-trace = go.Scatter3d(x = img_flat_df.r,
-                     y = img_flat_df.g,
-                     z = img_flat_df.b,
-                     mode='markers',
-                     marker=dict(size=1,
-                                 color=['rgb({},{},{})'.format(r,g,b) for r,g,b 
-                                        in zip(img_flat_df.r.values, 
-                                               img_flat_df.g.values, 
-                                               img_flat_df.b.values)],
-                                 opacity=0.5))
+# Create 3D plot where each occupied cell of RGB space is displayed in its actual color
+trace = pixel_cloud(img)
 
 data = [trace]
 
@@ -196,17 +193,8 @@ print('cluster centers: ', kmeans.cluster_centers_)
 # In[12]:
 
 
-# Create 3-D plot where each pixel in the `img` is displayed in its actual color
-trace = go.Scatter3d(x = img_flat_df.r,
-                     y = img_flat_df.g,
-                     z = img_flat_df.b,
-                     mode='markers',
-                     marker=dict(size=1,
-                                 color=['rgb({},{},{})'.format(r,g,b) for 
-                                        r,g,b in zip(img_flat_df.r.values, 
-                                                     img_flat_df.g.values, 
-                                                     img_flat_df.b.values)],
-                                 opacity=0.5))
+# Create 3-D plot where each occupied cell of RGB space is displayed in its actual color
+trace = pixel_cloud(img)
 
 data = [trace]
 
@@ -292,6 +280,8 @@ for pixel in centers:
 # Hopefully, you hypothesized that we'd see similar colors as a result of a 3-cluster model. If you examine the original image of the tulips, it's apparent that there are generally three dominant colors: reds, greens, and golds/yellows, which is very close to what the model returned.
 # 
 # Just as before, let's now replace each pixel in the original image with the RGB value of the centroid to which it was assigned.
+# 
+# **Note:** The helper functions below don't refit `KMeans` to every pixel and rebuild the image one cluster mask at a time. They use `ColorQuantizer` from `labtools.color`, which fits K-means to a histogram of the photo's colors (each color cell weighted by its pixel count), assigns each distinct color to its nearest centroid once, and fills in the new image with a single lookup. The result is the same kind of compressed photo in a fraction of a second per _k_ for this photo. The cost grows with the number of distinct colors rather than pixels: a noisy 24-megapixel photo took about 6 seconds per _k_ on a single CPU core.
 
 # In[17]:
 
@@ -313,14 +303,7 @@ def cluster_image(k, img=img):
       coordinates of its nearest centroid.
     '''
 
-    img_flat = img.reshape(img.shape[0]*img.shape[1], 3)
-    kmeans = KMeans(n_clusters = k, random_state = 42).fit(img_flat)
-    new_img = img_flat.copy()
-  
-    for i in np.unique(kmeans.labels_):
-        new_img[kmeans.labels_ == i, :] = kmeans.cluster_centers_[i]
-  
-    new_img = new_img.reshape(img.shape)
+    new_img = ColorQuantizer(n_colors=k, random_state=42).fit_quantize(img)
 
     return plt.imshow(new_img), plt.axis('off');
   
@@ -353,44 +336,10 @@ print(kmeans3.cluster_centers_)
 # In[20]:
 
 
-# Create a new column in the df that indicates the cluster number of each row 
-# (as assigned by Kmeans for k=3)
-img_flat_df['cluster'] = kmeans3.labels_
-img_flat_df.head()
-
-
-# In[21]:
-
-
-# Create helper dictionary to map RGB color values to each observation in df
-series_conversion = {0: 'rgb' +str(tuple(kmeans3.cluster_centers_[0])),
-                     1: 'rgb' +str(tuple(kmeans3.cluster_centers_[1])),
-                     2: 'rgb' +str(tuple(kmeans3.cluster_centers_[2])),
-                     }
-series_conversion
-
+# Replot the data, now showing which cluster (i.e., color) it was assigned to by K-means when k=3.
+# With `centers`, `pixel_cloud()` draws each marker in the color of its nearest centroid.
 
-# In[22]:
-
-
-# Replace the cluster numbers in the 'cluster' col with formatted RGB values 
-# (made ready for plotting)
-img_flat_df['cluster'] = img_flat_df['cluster'].map(series_conversion)
-img_flat_df.head()
-
-
-# In[23]:
-
-
-# Replot the data, now showing which cluster (i.e., color) it was assigned to by K-means when k=3
-
-trace = go.Scatter3d(x = img_flat_df.r,
-                     y = img_flat_df.g,
-                     z = img_flat_df.b,
-                     mode='markers',
-                     marker=dict(size=1,
-                                 color=img_flat_df.cluster,
-                                 opacity=1))
+trace = pixel_cloud(img, centers=kmeans3.cluster_centers_, opacity=1)
 
 data = trace
 
@@ -413,7 +362,7 @@ fig.show()
 
 # ## Cluster the data: _k_ = 2-10
 
-# In[24]:
+# In[21]:
 
 
 # Helper function to plot image grid
@@ -426,21 +375,15 @@ def cluster_image_grid(k, ax, img=img):
     Args:
       k:    (int)          - Your selected K-value
       ax:   (int)          - Index of the axis of the figure to plot to
-      img:  (numpy array)  - Your original image converted to a numpy array
+      img:  (numpy array)  - Your original image converted to a numpy array \
+                             (or its ImageColors, to share them across k)
 
     Returns:
       A new image where each row of img's array has been replaced with the \ 
       coordinates of its nearest centroid. Image is assigned to an axis that \
       can be used in an image grid figure.
     '''
-    img_flat = img.reshape(img.shape[0]*img.shape[1], 3)
-    kmeans = KMeans(n_clusters=k, random_state=42).fit(img_flat)
-    new_img = img_flat.copy()
-
-    for i in np.unique(kmeans.labels_):
-        new_img[kmeans.labels_==i, :] = kmeans.cluster_centers_[i]
-
-    new_img = new_img.reshape(img.shape)
+    new_img = ColorQuantizer(n_colors=k, random_state=42).fit_quantize(img)
     ax.imshow(new_img)
     ax.axis('off')
 
@@ -449,8 +392,10 @@ fig = matplotlib.pyplot.gcf()
 fig.set_size_inches(9, 12)
 axs = axs.flatten()
 k_values = np.arange(2, 11)
+# Tally the photo's colors once for all nine values of k
+img_colors = ImageColors(img)
 for i, k in enumerate(k_values):
-    cluster_image_grid(k, axs[i], img=img)
+    cluster_image_grid(k, axs[i], img=img_colors)
     axs[i].title.set_text('k=' + str(k))
 
 
@@ -29,6 +29,8 @@ from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
 from sklearn.preprocessing import StandardScaler
 
+from labtools.clustering import kmeans_scores
+
 # Import visualization packages.
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -340,6 +342,8 @@ X_scaled = StandardScaler().fit_transform(X)
 # Now, fit K-means and evaluate inertia for different values of k. Because you may not know how many clusters exist in the data, start by fitting K-means and examining the inertia values for different values of k. To do this, write a function called `kmeans_inertia` that takes in `num_clusters` and `x_vals` (`X_scaled`) and returns a list of each k-value's inertia.
 # 
 # When using K-means inside the function, set the `random_state` to `42`. This way, others can reproduce your results.
+# 
+# **Note:** Steps 3 and 4 fit the same nine models, once for their inertia and once for their silhouette scores. Here, `kmeans_scores()` from `labtools.clustering` stands in for both `kmeans_inertia` and `kmeans_sil`: it fits each k once (with `random_state=42`) and returns a table of inertia, silhouette score, Calinski-Harabasz index and Davies-Bouldin index. The inertia and silhouette lists below are read from that table.
 
 # In[ ]:
 
@@ -350,22 +354,12 @@ X_scaled = StandardScaler().fit_transform(X)
 
 num_clusters = [i for i in range(2, 11)]
 
-def kmeans_inertia(num_clusters, x_vals):
-    """
-    Accepts as arguments list of ints and data array. 
-    Fits a KMeans model where k = each value in the list of ints. 
-    Returns each k-value's inertia appended to a list.
-    """
-    inertia = []
-    for num in num_clusters:
-        kms = KMeans(n_clusters=num, random_state=42)
-        kms.fit(x_vals)
-        inertia.append(kms.inertia_)
+# Fit each k once and score it with every metric
+k_scores = kmeans_scores(num_clusters, X_scaled)
+k_scores
 
-    return inertia
 
-
-# Use the `kmeans_inertia` function to return a list of inertia for k=2 to 10.
+# Use the `k_scores` table to return a list of inertia for k=2 to 10.
 
 # In[ ]:
 
@@ -374,7 +368,7 @@ def kmeans_inertia(num_clusters, x_vals):
 
 ### YOUR CODE HERE ###
 
-inertia = kmeans_inertia(num_clusters, X_scaled)
+inertia = k_scores['inertia'].tolist()
 inertia
 
 
@@ -429,23 +423,8 @@ plot.set_ylabel("Inertia");
 
 ### YOUR CODE HERE ###
 
-def kmeans_sil(num_clusters, x_vals):
-    """
-    Accepts as arguments list of ints and data array. 
-    Fits a KMeans model where k = each value in the list of ints.
-    Calculates a silhouette score for each k value. 
-    Returns each k-value's silhouette score appended to a list.
-    """
-    sil_score = []
-    for num in num_clusters:
-        kms = KMeans(n_clusters=num, random_state=42)
-        kms.fit(x_vals)
-        sil_score.append(silhouette_score(x_vals, kms.labels_))
-
-    return sil_score
-
-
-sil_score = kmeans_sil(num_clusters, X_scaled)
+# The models were already fitted and scored by kmeans_scores() in Step 3
+sil_score = k_scores['silhouette'].tolist()
 sil_score
 
 
@@ -540,6 +519,8 @@ penguins_subset.head()
 
 
 # Use `groupby` to verify if any `'cluster'` can be differentiated by `'species'`.
+# 
+# **Note:** For a table too large to load, such as millions of customer rows, `stream_segments()` from `labtools.clustering` runs this same scale, cluster and label workflow one chunk of the CSV at a time and returns these `groupby(['cluster', 'species'])` counts. The `penguin_segments` pipeline in `labtools.labs` applies it to `penguins.csv`: `python -m labtools.pipeline penguin_segments`.
 
 # In[ ]:
 
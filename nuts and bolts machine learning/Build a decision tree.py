@@ -606,7 +606,7 @@ scoring = {'accuracy', 'precision', 'recall', 'f1'}
 # 
 # Check every combination of values to examine which pair has the best evaluation metrics. Make a decision tree instance called `tuned_decision_tree` with `random_state=0`, make a `GridSearchCV` instance called `clf`, make sure to refit the estimator using `"f1"`, and fit the model on the training set. 
 # 
-# **Note:** This cell may take up to 15 minutes to run.
+# **Note:** This cell may take up to 15 minutes to run. To search a grid like this one faster, `TreePathSearchCV` from `labtools.tree_tuning` takes the same arguments and screens every `max_depth` from one full tree per fold and `min_samples_leaf` value (60 fits instead of 1,380). It then refits the leading candidates fold by fold, so it picks the same `best_params_` as `GridSearchCV`. Only the scores of candidates well below the best are left approximate.
 
 # In[23]:
 
@@ -34,8 +34,11 @@ import pickle as pkl
  
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split, PredefinedSplit, GridSearchCV
+from labtools.splits import validation_split_index
 from sklearn.metrics import f1_score, precision_score, recall_score, accuracy_score
 
+from labtools.instrument import stage
+
 
 # As shown in this cell, the dataset has been automatically loaded in for you. You do not need to download the .csv file, or provide more code, in order to access the dataset and proceed with this lab. Please continue with this activity by completing the following instructions.
 
@@ -354,7 +357,7 @@ cv_params = {'n_estimators' : [50,100],
 
 ### YOUR CODE HERE ###
 
-split_index = [0 if x in X_val.index else -1 for x in X_train.index]
+split_index = validation_split_index(X_train.index, X_val.index)
 custom_split = PredefinedSplit(split_index)
 
 
@@ -415,7 +418,13 @@ rf_val = GridSearchCV(rf, cv_params, cv=custom_split, refit='f1', n_jobs = -1, v
 # In[19]:
 
 
-get_ipython().run_cell_magic('time', '', '\n# Fit the model.\n\n### YOUR CODE HERE ###\n\n\nrf_val.fit(X_train, y_train)')
+# Fit the model.
+
+### YOUR CODE HERE ###
+
+
+with stage('fit', rows=len(X_train), model='rf_val'):
+    rf_val.fit(X_train, y_train)
 
 
 # <details>
@@ -428,7 +437,7 @@ get_ipython().run_cell_magic('time', '', '\n# Fit the model.\n\n### YOUR CODE HE
 # <details>
 # <summary><h4><strong>Hint 2</strong></h4></summary>
 # 
-# Add the magic function `%%time` to keep track of the amount of time it takes to fit the model and display this information once execution has completed. Remember that this code must be the first line in the cell.
+# Wrap the fit in `with stage('fit', rows=len(X_train)):` to keep track of the amount of time it takes to fit the model. In a notebook, it displays this information once execution has completed.
 # 
 # </details>
 
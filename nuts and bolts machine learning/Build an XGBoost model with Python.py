@@ -58,6 +58,7 @@ from xgboost import XGBClassifier
 from xgboost import plot_importance
 
 from sklearn.model_selection import GridSearchCV, train_test_split
+from labtools.xgb_search import XGBSearchCV
 from sklearn.metrics import accuracy_score, precision_score, recall_score,f1_score, confusion_matrix, ConfusionMatrixDisplay, RocCurveDisplay
 
 import matplotlib.pyplot as plt
@@ -68,6 +69,8 @@ pd.set_option('display.max_columns', None)
 # This module lets us save our models once we fit them.
 import pickle
 
+from labtools.instrument import stage
+
 
 # ## Read in the data
 
@@ -155,7 +158,9 @@ X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25,
 # 
 # 5. Fit the data (`X_train`, `y_train`) to the `GridSearchCV` object (`xgb_cv`)
 # 
-# Note that we use the `%%time` magic at the top of the cell where we fit the model. This outputs the final runtime of the cell. 
+# **Note:** `XGBSearchCV` from `labtools.xgb_search` takes the same arguments and gives the same results as `GridSearchCV`. The three `n_estimators` values share one booster per fold, so it grows 75 boosters per fold instead of 225.
+# 
+# Note that we wrap the fit in `stage('fit')` from `labtools.instrument` instead of using the `%%time` magic. In a notebook it prints the runtime when the fit finishes, as `%%time` did. Set `LABTOOLS_STAGE_LOG` to also record it in a JSON lines file.
 
 # In[ ]:
 
@@ -170,7 +175,7 @@ cv_params = {'max_depth': [4,5,6,7,8],
 
 scoring = {'accuracy', 'precision', 'recall', 'f1'}
 
-xgb_cv = GridSearchCV(xgb, cv_params, scoring=scoring, cv=5, refit='f1')
+xgb_cv = XGBSearchCV(xgb, cv_params, scoring=scoring, cv=5, refit='f1')
 
 
 # **_Note_**: _The following operation may take over 30 minutes to complete_
@@ -178,7 +183,8 @@ xgb_cv = GridSearchCV(xgb, cv_params, scoring=scoring, cv=5, refit='f1')
 # In[7]:
 
 
-get_ipython().run_cell_magic('time', '', 'xgb_cv.fit(X_train, y_train)')
+with stage('fit', rows=len(X_train), model='xgb_cv'):
+    xgb_cv.fit(X_train, y_train)
 
 
 # ## Pickle
@@ -27,11 +27,14 @@ import pickle
 
 from sklearn.model_selection import train_test_split
 from sklearn.model_selection import GridSearchCV
+from labtools.xgb_search import XGBSearchCV
 from sklearn import metrics
 
 from xgboost import XGBClassifier
 from xgboost import plot_importance
 
+from labtools.instrument import stage
+
 
 # ### Load the dataset
 # 
@@ -327,6 +330,8 @@ scoring = {'accuracy', 'precision', 'recall', 'f1'}
 # ### Construct the GridSearch cross-validation 
 # 
 # Construct the GridSearch cross-validation using the model, parameters, and scoring metrics you defined. Additionally, define the number of folds and specify *which metric* from above will guide the refit strategy.
+# 
+# **Note:** `XGBSearchCV` from `labtools.xgb_search` takes the same arguments and gives the same results as `GridSearchCV`. In the grid above, the three `n_estimators` values share one booster per fold, so it grows 12 boosters per fold instead of 36.
 
 # In[11]:
 
@@ -335,7 +340,7 @@ scoring = {'accuracy', 'precision', 'recall', 'f1'}
 
 ### YOUR CODE HERE ###
 
-xgb_cv = GridSearchCV(xgb,
+xgb_cv = XGBSearchCV(xgb,
                       cv_params,
                       scoring = scoring,
                       cv = 5,
@@ -367,7 +372,13 @@ xgb_cv = GridSearchCV(xgb,
 # In[12]:
 
 
-get_ipython().run_cell_magic('time', '', '# fit the GridSearch model to training data\n\n### YOUR CODE HERE\n\nxgb_cv = xgb_cv.fit(X_train, y_train)\nxgb_cv')
+# fit the GridSearch model to training data
+
+### YOUR CODE HERE
+
+with stage('fit', rows=len(X_train), model='xgb_cv'):
+    xgb_cv = xgb_cv.fit(X_train, y_train)
+xgb_cv
 
 
 # **Question:** Which optimal set of parameters did the GridSearch yield?
@@ -128,6 +128,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 from sklearn.model_selection import GridSearchCV, train_test_split
+from labtools.xgb_search import XGBSearchCV
 from sklearn.metrics import roc_auc_score, roc_curve
 from sklearn.metrics import accuracy_score, precision_score, recall_score,\
 f1_score, confusion_matrix, ConfusionMatrixDisplay, RocCurveDisplay
@@ -138,6 +139,8 @@ from xgboost import XGBClassifier
 # This is the function that helps plot feature importance 
 from xgboost import plot_importance
 
+from labtools.instrument import stage
+
 
 # In[2]:
 
@@ -625,7 +628,8 @@ rf1 = GridSearchCV(rf, cv_params, scoring=scoring, cv=4, refit='f1')
 # In[32]:
 
 
-get_ipython().run_cell_magic('time', '', 'rf1.fit(X_train, y_train)\n')
+with stage('fit', rows=len(X_train), model='rf1'):
+    rf1.fit(X_train, y_train)
 
 
 # <details>
@@ -843,12 +847,14 @@ results
 # 
 # 3. Define a set `scoring` of scoring metrics for grid search to capture (precision, recall, F1 score, and accuracy).
 # 
-# 4. Instantiate the `GridSearchCV` object `xgb1`. Pass to it as arguments:
+# 4. Instantiate the `XGBSearchCV` object `xgb1`. Pass to it as arguments:
 #  - estimator=`xgb`
 #  - param_grid=`cv_params`
 #  - scoring=`scoring`
 #  - cv: define the number of cross-validation folds you want (`cv=_`)
 #  - refit: indicate which evaluation metric you want to use to select the model (`refit='f1'`)
+# 
+# **Note:** `XGBSearchCV` from `labtools.xgb_search` takes the same arguments and gives the same results as `GridSearchCV`. With this one-candidate grid it runs about as fast; it saves time once you add values, especially `n_estimators` values.
 
 # In[43]:
 
@@ -868,8 +874,8 @@ cv_params = {'learning_rate': [0.1],
 # 3. Define a list of scoring metrics to capture
 scoring = ['accuracy', 'precision', 'recall', 'f1']
 
-# 4. Instantiate the GridSearchCV object
-xgb1 = GridSearchCV(xgb, cv_params, scoring=scoring, cv=4, refit='f1')
+# 4. Instantiate the XGBSearchCV object
+xgb1 = XGBSearchCV(xgb, cv_params, scoring=scoring, cv=4, refit='f1')
 
 
 # Now fit the model to the `X_train` and `y_train` data.
@@ -877,7 +883,8 @@ xgb1 = GridSearchCV(xgb, cv_params, scoring=scoring, cv=4, refit='f1')
 # In[44]:
 
 
-get_ipython().run_cell_magic('time', '', 'xgb1.fit(X_train, y_train)\n')
+with stage('fit', rows=len(X_train), model='xgb1'):
+    xgb1.fit(X_train, y_train)
 
 
 # Get the best score from this model.
@@ -135,10 +135,11 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 
 # Import packages for data preprocessing
-from sklearn.feature_extraction.text import CountVectorizer
+from labtools.tiktok import ngram_features
 
 # Import packages for data modeling
 from sklearn.model_selection import train_test_split, GridSearchCV
+from labtools.xgb_search import XGBSearchCV
 from sklearn.metrics import classification_report, accuracy_score, precision_score, \
 recall_score, f1_score, confusion_matrix, ConfusionMatrixDisplay
 
@@ -146,6 +147,8 @@ from sklearn.ensemble import RandomForestClassifier
 from xgboost import XGBClassifier
 from xgboost import plot_importance
 
+from labtools.instrument import stage
+
 
 # Load the data from the provided csv file into a dataframe.
 # 
@@ -404,94 +407,49 @@ X_train.shape, X_val.shape, X_test.shape, y_train.shape, y_val.shape, y_test.sha
 # Splitting text into n-grams is an example of tokenization. Tokenization is the process of breaking text into smaller units to derive meaning from the resulting tokens.
 # 
 # This notebook breaks each video's transcription text into both 2-grams and 3-grams, then takes the 15 most frequently occurring tokens from the entire dataset to use as features.
+# 
+# Most videos contain only a handful of the n-grams, so the count matrix is mostly zeros. `ngram_features()` from `labtools.tiktok` sets up a `ColumnTransformer` that tallies the n-grams with `CountVectorizer` and stacks them with the other features into one sparse matrix, which only stores the non-zero counts. The n-gram columns come first, followed by the other features in their original order; `ngrams.get_feature_names_out()` lists the column names in that order. The random forest and XGBoost models accept sparse matrices as they are, so you can raise `max_features` to thousands of n-grams without running out of memory. Passing `hash_features=2**18` instead hashes every n-gram into a fixed number of columns, which needs no vocabulary and tokenizes the text in parallel worker processes.
 
 # In[20]:
 
 
-# Set up a `CountVectorizer` object, which converts a collection of text to a matrix of token counts
-count_vec = CountVectorizer(ngram_range=(2, 3),
-                            max_features=15,
-                            stop_words='english')
-count_vec
+# Set up a transformer that converts `video_transcription_text` to a sparse matrix of token counts
+# and passes the other columns through
+ngrams = ngram_features(max_features=15, ngram_range=(2, 3))
+ngrams
 
 
-# Fit the vectorizer to the training data (generate the n-grams) and transform it (tally the occurrences). Only fit to the training data, not the validation or test data.
+# Fit the transformer to the training data (generate the n-grams) and transform it (tally the occurrences). Only fit to the training data, not the validation or test data.
 
 # In[21]:
 
 
-# Extract numerical features from `video_transcription_text` in the training set
-count_data = count_vec.fit_transform(X_train['video_transcription_text']).toarray()
-count_data
-
-
-# In[22]:
-
-
-# Place the numerical representation of `video_transcription_text` from training set into a dataframe
-count_df = pd.DataFrame(data=count_data, columns=count_vec.get_feature_names_out())
-
-# Display first few rows
-count_df.head()
-
-
-# In[23]:
-
-
-# Concatenate `X_train` and `count_df` to form the final dataframe for training data (`X_train_final`)
-# Note: Using `.reset_index(drop=True)` to reset the index in X_train after dropping `video_transcription_text`,
-# so that the indices align with those in `X_train` and `count_df`
-X_train_final = pd.concat([X_train.drop(columns=['video_transcription_text']).reset_index(drop=True), count_df], axis=1)
-
-# Display first few rows
-X_train_final.head()
-
-
-# Get n-gram counts for the validation data. Notice that the vectorizer is not being refit to the validation data. It's only transforming it. In other words, the transcriptions of the videos in the validation data are only being checked against the n-grams found in the training data.
-
-# In[24]:
-
-
-# Extract numerical features from `video_transcription_text` in the testing set
-validation_count_data = count_vec.transform(X_val['video_transcription_text']).toarray()
-validation_count_data
-
-
-# In[25]:
+# Extract numerical features from `video_transcription_text` in the training set, and combine
+# them with the other features to form the final matrix for training data (`X_train_final`)
+X_train_final = ngrams.fit_transform(X_train)
 
+# Display the first few rows
+pd.DataFrame(X_train_final[:5].toarray(), columns=ngrams.get_feature_names_out())
 
-# Place the numerical representation of `video_transcription_text` from validation set into a dataframe
-validation_count_df = pd.DataFrame(data=validation_count_data, columns=count_vec.get_feature_names_out())
-validation_count_df.head()
 
+# Get n-gram counts for the validation data. Notice that the transformer is not being refit to the validation data. It's only transforming it. In other words, the transcriptions of the videos in the validation data are only being checked against the n-grams found in the training data.
 
-# In[26]:
-
+# In[22]:
 
-# Concatenate `X_val` and `validation_count_df` to form the final dataframe for training data (`X_val_final`)
-# Note: Using `.reset_index(drop=True)` to reset the index in X_val after dropping `video_transcription_text`,
-# so that the indices align with those in `validation_count_df`
-X_val_final = pd.concat([X_val.drop(columns=['video_transcription_text']).reset_index(drop=True), validation_count_df], axis=1)
 
-# Display first few rows
-X_val_final.head()
+# Extract numerical features from `video_transcription_text` in the validation set
+X_val_final = ngrams.transform(X_val)
+X_val_final
 
 
-# Repeat the process to get n-gram counts for the test data. Again, don't refit the vectorizer to the test data. Just transform it.
+# Repeat the process to get n-gram counts for the test data. Again, don't refit the transformer to the test data. Just transform it.
 
-# In[27]:
+# In[23]:
 
 
 # Extract numerical features from `video_transcription_text` in the testing set
-test_count_data = count_vec.transform(X_test['video_transcription_text']).toarray()
-
-# Place the numerical representation of `video_transcription_text` from test set into a dataframe
-test_count_df = pd.DataFrame(data=test_count_data, columns=count_vec.get_feature_names_out())
-
-# Concatenate `X_val` and `validation_count_df` to form the final dataframe for training data (`X_val_final`)
-X_test_final = pd.concat([X_test.drop(columns=['video_transcription_text']
-                                      ).reset_index(drop=True), test_count_df], axis=1)
-X_test_final.head()
+X_test_final = ngrams.transform(X_test)
+X_test_final
 
 
 # ### **Task 6. Build models**
@@ -529,7 +487,8 @@ rf_cv = GridSearchCV(rf, cv_params, scoring=scoring, cv=5, refit='recall')
 # In[29]:
 
 
-get_ipython().run_cell_magic('time', '', 'rf_cv.fit(X_train_final, y_train)\n')
+with stage('fit', rows=X_train_final.shape[0], model='rf_cv'):
+    rf_cv.fit(X_train_final, y_train)
 
 
 # In[30]:
@@ -563,6 +522,8 @@ rf_results_df['mean_test_precision'][rf_cv.best_index_]
 # This model performs exceptionally well, with an average recall score of 0.995 across the five cross-validation folds. After checking the precision score to be sure the model is not classifying all samples as claims, it is clear that this model is making almost perfect classifications.
 
 # ### **Build an XGBoost model**
+# 
+# **Note:** `XGBSearchCV` from `labtools.xgb_search` takes the same arguments and gives the same results as `GridSearchCV`. The 300- and 500-tree candidates share one booster per fold, so each fold grows 500 trees per setting instead of 800.
 
 # In[33]:
 
@@ -580,8 +541,8 @@ cv_params = {'max_depth': [4,8,12],
 # Define a list of scoring metrics to capture
 scoring = ['accuracy', 'precision', 'recall', 'f1']
 
-# Instantiate the GridSearchCV object
-xgb_cv = GridSearchCV(xgb, cv_params, scoring=scoring, cv=5, refit='recall')
+# Instantiate the XGBSearchCV object
+xgb_cv = XGBSearchCV(xgb, cv_params, scoring=scoring, cv=5, refit='recall')
 
 
 # Note this cell might take several minutes to run.
@@ -589,7 +550,8 @@ xgb_cv = GridSearchCV(xgb, cv_params, scoring=scoring, cv=5, refit='recall')
 # In[34]:
 
 
-get_ipython().run_cell_magic('time', '', 'xgb_cv.fit(X_train_final, y_train)\n')
+with stage('fit', rows=X_train_final.shape[0], model='xgb_cv'):
+    xgb_cv.fit(X_train_final, y_train)
 
 
 # In[35]:
@@ -794,10 +756,11 @@ plt.show()
 
 
 importances = rf_cv.best_estimator_.feature_importances_
-rf_importances = pd.Series(importances, index=X_test_final.columns)
+# Label each importance with its column: the n-grams first, then the other features
+rf_importances = pd.Series(importances, index=ngrams.get_feature_names_out())
 
 fig, ax = plt.subplots()
-rf_importances.plot.bar(ax=ax)
+rf_importances.nlargest(15).plot.bar(ax=ax)
 ax.set_title('Feature importances')
 ax.set_ylabel('Mean decrease in impurity')
 fig.tight_layout()
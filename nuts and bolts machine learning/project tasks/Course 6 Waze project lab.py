@@ -99,6 +99,7 @@ pd.set_option('display.max_columns', None)
 
 # Import packages for data modeling
 from sklearn.model_selection import GridSearchCV, train_test_split
+from labtools.xgb_search import XGBSearchCV
 from sklearn.metrics import roc_auc_score, roc_curve, auc
 from sklearn.metrics import accuracy_score, precision_score, recall_score,\
 f1_score, confusion_matrix, ConfusionMatrixDisplay, RocCurveDisplay, PrecisionRecallDisplay
@@ -112,6 +113,12 @@ from xgboost import plot_importance
 # This module lets us save our models once we fit them.
 import pickle
 
+# Threshold analysis (run from the repository root so `labtools` is importable)
+from labtools.thresholds import threshold_sweep, predict_at_threshold, closest_threshold
+from labtools.waze import WazeFeatures
+from labtools.instrument import stage
+from labtools.splits import SplitRegistry, fold_assignment, index_fingerprint
+
 
 # Now read in the dataset as `df0` and inspect the first five rows.
 
@@ -439,8 +446,10 @@ df['label'].value_counts(normalize=True)
 # In[21]:
 
 
-# 1. Isolate X variables
-X = df.drop(columns=['label', 'label2', 'device'])
+# 1. Isolate X variables. `WazeFeatures` rebuilds the engineered features
+# above in one pass (zero denominators -> 0) and is reused as-is at inference.
+waze_features = WazeFeatures().fit(df)
+X = waze_features.transform(df)
 
 # 2. Isolate y variable
 y = df['label2']
@@ -453,6 +462,13 @@ X_tr, X_test, y_tr, y_test = train_test_split(X, y, stratify=y,
 X_train, X_val, y_train, y_val = train_test_split(X_tr, y_tr, stratify=y_tr,
                                                   test_size=0.25, random_state=42)
 
+# 5. Assign the training rows to 4 cross-validation folds once and save them
+#    next to the dataset, so both grid searches are scored on identical folds.
+#    The folds are named after the rows, so a different split never loads them.
+registry = SplitRegistry('waze_dataset.csv')
+cv_name = f'cv4_{index_fingerprint(X_train.index)}'
+registry.get_or_build(cv_name, X_train.index, lambda: fold_assignment(y_train, n_splits=4))
+
 
 # Verify the number of samples in the partitioned data.
 
@@ -514,7 +530,9 @@ cv_params = {'max_depth': [None],
 scoring = ['accuracy', 'precision', 'recall', 'f1']
 
 # 4. Instantiate the GridSearchCV object
-rf_cv = GridSearchCV(rf, cv_params, scoring=scoring, cv=4, refit='recall')
+rf_cv = GridSearchCV(rf, cv_params, scoring=scoring,
+                     cv=registry.predefined_split(cv_name, X_train.index),
+                     refit='recall')
 
 
 # Now fit the model to the training data.
@@ -522,7 +540,8 @@ rf_cv = GridSearchCV(rf, cv_params, scoring=scoring, cv=4, refit='recall')
 # In[24]:
 
 
-get_ipython().run_cell_magic('time', '', 'rf_cv.fit(X_train, y_train)\n')
+with stage('fit', rows=len(X_train), model='rf_cv'):
+    rf_cv.fit(X_train, y_train)
 
 
 # Examine the best average score across all the validation folds.
@@ -624,12 +643,14 @@ results
 # 
 # 3. Define a list `scoring` of scoring metrics for grid search to capture (precision, recall, F1 score, and accuracy).
 # 
-# 4. Instantiate the `GridSearchCV` object `xgb_cv`. Pass to it as arguments:
+# 4. Instantiate the `XGBSearchCV` object `xgb_cv`. Pass to it as arguments:
 #  - estimator=`xgb`
 #  - param_grid=`cv_params`
 #  - scoring=`scoring`
 #  - cv: define the number of cross-validation folds you want (`cv=_`)
 #  - refit: indicate which evaluation metric you want to use to select the model (`refit='recall'`)
+# 
+# **Note:** `XGBSearchCV` from `labtools.xgb_search` takes the same arguments and gives the same results as `GridSearchCV`. Each fold's matrices are quantized once and shared by all 8 candidates, and the search uses the same saved folds as the random forest above.
 
 # In[29]:
 
@@ -647,8 +668,10 @@ cv_params = {'max_depth': [6, 12],
 # 3. Define a list of scoring metrics to capture
 scoring = ['accuracy', 'precision', 'recall', 'f1']
 
-# 4. Instantiate the GridSearchCV object
-xgb_cv = GridSearchCV(xgb, cv_params, scoring=scoring, cv=4, refit='recall')
+# 4. Instantiate the XGBSearchCV object
+xgb_cv = XGBSearchCV(xgb, cv_params, scoring=scoring,
+                      cv=registry.predefined_split(cv_name, X_train.index),
+                      refit='recall')
 
 
 # Now fit the model to the `X_train` and `y_train` data.
@@ -658,7 +681,8 @@ xgb_cv = GridSearchCV(xgb, cv_params, scoring=scoring, cv=4, refit='recall')
 # In[30]:
 
 
-get_ipython().run_cell_magic('time', '', 'xgb_cv.fit(X_train, y_train)\n')
+with stage('fit', rows=len(X_train), model='xgb_cv'):
+    xgb_cv.fit(X_train, y_train)
 
 
 # Get the best score from this model.
@@ -907,11 +931,9 @@ predicted_probabilities
 # In[43]:
 
 
-# Create a list of just the second column values (probability of target)
-probs = [x[1] for x in predicted_probabilities]
-
 # Create an array of new predictions that assigns a 1 to any value >= 0.4
-new_preds = np.array([1 if x >= 0.4 else 0 for x in probs])
+# in the second column (probability of target)
+new_preds = predict_at_threshold(predicted_probabilities, 0.4)
 new_preds
 
 
@@ -952,33 +974,12 @@ def threshold_finder(y_test_data, probabilities, desired_recall):
         threshold: The decision threshold that most closely yields the desired recall
         recall: The exact recall score associated with `threshold`
     '''
-    probs = [x[1] for x in probabilities]  # Isolate second column of `probabilities`
-    thresholds = np.arange(0, 1, 0.001)    # Set a grid of 1,000 thresholds to test
-
-    scores = []
-    for threshold in thresholds:
-        # Create a new array of {0, 1} predictions based on new threshold
-        preds = np.array([1 if x >= threshold else 0 for x in probs])
-        # Calculate recall score for that threshold
-        recall = recall_score(y_test_data, preds)
-        # Append the threshold and its corresponding recall score as a tuple to `scores`
-        scores.append((threshold, recall))
-
-    distances = []
-    for idx, score in enumerate(scores):
-        # Calculate how close each actual score is to the desired score
-        distance = abs(score[1] - desired_recall)
-        # Append the (index#, distance) tuple to `distances`
-        distances.append((idx, distance))
-
-    # Sort `distances` by the second value in each of its tuples (least to greatest)
-    sorted_distances = sorted(distances, key=lambda x: x[1], reverse=False)
-    # Identify the tuple with the actual recall closest to desired recall
-    best = sorted_distances[0]
-    # Isolate the index of the threshold with the closest recall score
-    best_idx = best[0]
-    # Retrieve the threshold and actual recall score closest to desired recall
-    threshold, recall = scores[best_idx]
+    # Sort the scores once and compute recall at every distinct threshold
+    sweep = threshold_sweep(y_test_data, probabilities)
+    # Retrieve the threshold on a grid of 1,000 thresholds whose recall is closest
+    # to desired recall (ties go to the lowest threshold)
+    threshold, recall = closest_threshold(sweep, 'recall', desired_recall,
+                                          grid=np.arange(0, 1, 0.001))
 
     return threshold, recall
 
@@ -1003,8 +1004,7 @@ threshold_finder(y_test, probabilities, 0.5)
 
 
 # Create an array of new predictions that assigns a 1 to any value >= 0.194
-probs = [x[1] for x in probabilities]
-new_preds = np.array([1 if x >= 0.194 else 0 for x in probs])
+new_preds = predict_at_threshold(probabilities, 0.194)
 
 # Get evaluation metrics for when the threshold is 0.194
 get_test_scores('XGB, threshold = 0.194', new_preds, y_test)
@@ -785,6 +785,8 @@ print('X_train scaled:', X_train_scaled)
 # ### Fit the model
 # 
 # Instantiate your model and fit it to the training data.
+# 
+# **Note:** Scaling and fitting both hold the whole training set in memory. For a year of trips that doesn't fit, `StreamingLinearRegression` from `labtools.regression` fits the same model from chunks of rows: call `model.partial_fit(X_chunk, y_chunk)` on each chunk (for example from `pd.read_csv(..., chunksize=100_000)`), and it accumulates the scaler's moments and the normal equations, which take memory in proportion to the number of features squared. The coefficients match `LinearRegression` on the scaled data, `model.predict()` takes unscaled features, and `model.scaler()` and `model.linear_model()` return the equivalent fitted `StandardScaler` and `LinearRegression`. `residual_scores(model, chunks)` then computes R<sup>2</sup>, MAE, MSE and RMSE in a second pass over the chunks.
 
 # In[42]:
 
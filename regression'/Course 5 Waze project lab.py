@@ -76,6 +76,8 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, accuracy_score, precision_score, recall_score, f1_score, confusion_matrix, ConfusionMatrixDisplay
 from sklearn.linear_model import LogisticRegression
 
+from labtools.diagnostics import collinearity, logit_diagnostics, logits
+
 
 # Import the dataset.
 
@@ -392,6 +394,8 @@ plt.show();
 # 
 # **Note:** 0.7 is an arbitrary threshold. Some industries may use 0.6, 0.8, etc.
 # 
+# **Note:** `collinearity(df.select_dtypes('number'), threshold=0.7)` from `labtools.diagnostics` returns this correlation matrix together with the pairs above the threshold, strongest first, and each variable's variance inflation factor (VIF), all from one covariance matrix. A VIF above 5 or so flags a variable that the other variables largely explain, even where no single pairwise correlation is high.
+# 
 # **Question:** Which variables are multicollinear with each other?
 # 
 # > * *`sessions` and `drives`: 1.0*
@@ -542,12 +546,15 @@ training_probabilities
 logit_data = X_train.copy()
 
 # 2. Create a new `logit` column in the `logit_data` df
-logit_data['logit'] = [np.log(prob[1] / prob[0]) for prob in training_probabilities]
+# (the model's decision_function(), computed for all rows at once)
+logit_data['logit'] = logits(model, X_train)
 
 
 # Plot a regplot where the x-axis represents an independent variable and the y-axis represents the log-odds of the predicted probabilities.
 # 
 # In an exhaustive analysis, this would be plotted for each continuous or discrete predictor variable. Here we show only `activity_days`.
+# 
+# **Note:** `logit_diagnostics(model, X_train)` checks every predictor at once. Its `curves` table holds each variable's mean logit in 20 quantile bins (a binned regplot for every column), `linearity` gives the R<sup>2</sup> of a straight line through each curve, and `vif` and `pairs` repeat the collinearity check on `X_train`. For example: `diagnostics = logit_diagnostics(model, X_train)`, then `diagnostics['linearity'].sort_values('r2')` lists the least linear variables first.
 
 # In[29]:
 